@@ -14,6 +14,9 @@ ANALYSIS_TYPE_PULSE_HEIGHT_COINCIDENCE = 'ph_coincidence'
 
 ANALYSIS_ROOT = 'analysis'
 
+SUMMARY_ROOT = 'summary'
+    # per-file summaries (see summarize_files.py) are in vol/SUMMARY_ROOT/run/file
+
 # write a JSON file saying when analysis was done and with what params
 #
 def write_summary(analysis_dir, params, username):
@@ -30,7 +30,7 @@ def init_sky_array(array_resolution, verbose):
     return birdie_utils.get_sky_image_array(array_resolution, verbose)
 
 
-def init_module(start_t, obs_config, module_id, bytes_per_pixel, sky_array):
+def init_module(start_t, end_t, obs_config, module_id, bytes_per_pixel, sky_array):
     if obs_config:
         for dome in obs_config['domes']:
             for module in dome['modules']:
@@ -45,7 +45,8 @@ def init_module(start_t, obs_config, module_id, bytes_per_pixel, sky_array):
                         module['elevation'],
                         module['position_angle'],
                         bytes_per_pixel,
-                        sky_array
+                        sky_array,
+                        end_time_utc=end_t
                     )
     else:
         return ModuleView(
@@ -58,7 +59,8 @@ def init_module(start_t, obs_config, module_id, bytes_per_pixel, sky_array):
             78.506,
             0,
             bytes_per_pixel,
-            sky_array
+            sky_array,
+            end_time_utc=end_t
         )
 
 
@@ -121,7 +123,7 @@ def do_setup(start_t, end_t, obs_config, birdie_config, bytes_per_pixel,
     sky_array = init_sky_array(birdie_config['array_resolution'], verbose)
 
     # Init ModuleView object
-    mod = init_module(start_t, obs_config, module_id, bytes_per_pixel, sky_array)
+    mod = init_module(start_t, end_t, obs_config, module_id, bytes_per_pixel, sky_array)
     initial_bounding_box = birdie_utils.get_coord_bounding_box(mod.center_ra, mod.center_dec)
     birdie_utils.init_ra_dec_ranges(start_t, end_t, initial_bounding_box, module_id, verbose)
 
@@ -57,11 +57,11 @@ def init_ra_dec_ranges(t_start, t_end, initial_bounding_box, module_id, verbose)
 def ra_dec_to_sky_array_indices(ra, dec, bounding_box):
     """Given sky_array, a 2D sky array recording light intensities at RA-DEC coordinates,
     returns the indices in sky_array corresponding to the point (ra, dec).
-    ra and dec must be in degrees."""
+    ra and dec must be in degrees, and may be numpy arrays of coordinates."""
     ra_len, dec_len = sky_arr_consts['coord_lens']
     shape = sky_arr_consts['shape']
-    ra_index = int(shape[0] * ((ra - bounding_box[0][0]) % 360) / ra_len) % shape[0]
-    dec_index = int(shape[1] * ((dec - bounding_box[1][1]) / dec_len)) % shape[1]
+    ra_index = np.trunc(shape[0] * ((ra - bounding_box[0][0]) % 360) / ra_len).astype(int) % shape[0]
+    dec_index = np.trunc(shape[1] * ((dec - bounding_box[1][1]) / dec_len)).astype(int) % shape[1]
     return ra_index, dec_index
 
 
@@ -190,6 +190,46 @@ def bresenham_line(x0, y0, x1, y1, pts):
             y += sy
 
 
+def scanline_fill_quads(xs, ys):
+    """Scanline rasterization of many quadrilaterals at once.
+    xs and ys are (n, 4) integer arrays with the vertices of n quadrilaterals, in order
+    around each polygon. Returns arrays (polygon index, y, min x, max x), one entry
+    per row of each polygon, giving the inclusive range of x indices filled in that row.
+    The edges are walked with bresenham_line's steps, vectorised over all edges, so the
+    spans are the same as drawing each edge (from vertex i + 1 to vertex i) with bresenham_line."""
+    xs, ys = np.asarray(xs, dtype=int), np.asarray(ys, dtype=int)
+    n = len(xs)
+    min_y = ys.min(axis=1)
+    height = int((ys.max(axis=1) - min_y).max()) + 1 if n else 0
+    left = np.full((n, height), np.iinfo(int).max)
+    right = np.full((n, height), np.iinfo(int).min)
+    # All 4 * n edges, each walked from vertex i + 1 to vertex i.
+    poly = np.tile(np.arange(n), 4)
+    x1, y1 = xs.T.ravel(), ys.T.ravel()
+    x, y = np.roll(xs, -1, axis=1).T.ravel(), np.roll(ys, -1, axis=1).T.ravel()
+    dx = np.abs(x1 - x)
+    dy = -np.abs(y1 - y)
+    sx = np.where(x < x1, 1, -1)
+    sy = np.where(y1 >= y, 1, -1)
+    err = dx + dy
+    active = np.ones(len(x), dtype=bool)
+    while active.any():
+        p, row = poly[active], y[active] - min_y[poly[active]]
+        np.minimum.at(left, (p, row), x[active])
+        np.maximum.at(right, (p, row), x[active])
+        active &= (x != x1) | (y != y1)
+        e2 = 2 * err
+        step_x = active & (e2 >= dy)
+        step_y = active & (e2 <= dx)
+        err += np.where(step_x, dy, 0) + np.where(step_y, dx, 0)
+        x += np.where(step_x, sx, 0)
+        y += np.where(step_y, sy, 0)
+    filled = left <= right
+    rows = min_y[:, np.newaxis] + np.arange(height)
+    poly_index = np.broadcast_to(np.arange(n)[:, np.newaxis], rows.shape)[filled]
+    return poly_index, rows[filled], left[filled], right[filled]
+
+
 # Config file IO
 
 def get_birdie_config(birdie_config_path):
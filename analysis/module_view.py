@@ -3,21 +3,25 @@ A ModuleView object simulates the on-sky field of view (FoV) of a PanoSETI modul
 The FoV is determined by
     1. the fixed Alt-AZ orientation of the module specified in obs_config.json
     2. a utc timestamp, determining the RA-DEC coordinates in view.
-Given a utc timestamp, the RA-DEC coordinates of the center of the module's FoV are calculated with the ICRS system.
+The RA-DEC coordinates of the center of the module's FoV are calculated with the ICRS system once,
+on a coarse time grid spanning the simulation (see sky_band.get_pointing_model),
+and interpolated from that grid for each frame timestamp.
 Then, the coordinates of each pixel are computed relative to the module's center.
 These coordinates are used to determine the FoV of each pixel and integrate over the visible simulated signals
  produced by BirdieSource objects.
 """
 import datetime
+import unittest
 
 import astropy.coordinates as c
 import astropy.units as u
-import astropy.time as t
 import numpy as np
 import matplotlib.pyplot as plt
 
-from birdie_utils import ra_dec_to_sky_array_indices, bresenham_line, get_coord_bounding_box
-from sky_band import get_module_pixel_corner_coord_ftn
+from birdie_utils import ra_dec_to_sky_array_indices, scanline_fill_quads, get_coord_bounding_box, \
+    bresenham_line, get_sky_image_array
+from sky_band import get_module_pixel_corner_offsets, get_module_pixel_corner_coords, \
+    get_pointing_model, interp_module_center_ra_dec
 
 
 class ModuleView:
@@ -25,8 +29,11 @@ class ModuleView:
     # See pixel size on https://oirlab.ucsd.edu/PANOinstr.html.
     pixels_per_side = 32
     pixel_size = 0.31
+    # Default time span of the pointing model, if no end time is given.
+    default_pointing_model_span = 24 * 60 * 60
 
-    def __init__(self, module_id, start_time_utc, obslat, obslon, obsalt, azimuth, elevation, pos_angle, bytes_per_pixel, sky_array):
+    def __init__(self, module_id, start_time_utc, obslat, obslon, obsalt, azimuth, elevation, pos_angle, bytes_per_pixel, sky_array,
+                 end_time_utc=None):
         self.module_id = module_id
         # Module orientation
         self.azimuth = azimuth * u.deg
@@ -35,14 +42,20 @@ class ModuleView:
         self.earth_loc = c.EarthLocation(
             lat=obslat*u.deg, lon=obslon*u.deg, height=obsalt*u.m, ellipsoid='WGS84'
         )
+        # Pointing model: center RA-DEC coordinates on a coarse time grid spanning the simulation.
+        if end_time_utc is None:
+            end_time_utc = start_time_utc + ModuleView.default_pointing_model_span
+        self.pointing_model = get_pointing_model(
+            start_time_utc, end_time_utc, azimuth, elevation, obslat, obslon, obsalt
+        )
         # Current field of view RA-DEC coordinates
         self.current_utc = start_time_utc
         self.center_ra = self.center_dec = None
-        self.get_pixel_corner_coord = None
-        self.get_module_pixel_corner_coord_ftn = get_module_pixel_corner_coord_ftn(
+        self.pixel_corner_offsets = get_module_pixel_corner_offsets(
             pos_angle, pixel_size=ModuleView.pixel_size
         )
-        self.pixel_fovs = dict()
+        self.pixel_spans = None
+        self.sky_array = None
         self.init_center_ra_dec_coords(start_time_utc, sky_array)
         # Simulated data array. dtype is double the max possible value
         if bytes_per_pixel == 1:
@@ -63,66 +76,33 @@ class ModuleView:
 
     def init_center_ra_dec_coords(self, frame_utc, sky_array):
         if self.center_ra is None or self.center_dec is None:
-            obstime = t.Time(frame_utc, format='unix')
-            alt_alz_coords = c.SkyCoord(
-                az=self.azimuth, alt=self.elevation, location=self.earth_loc,
-                obstime=obstime, frame=c.AltAz
-            )
-            pos = alt_alz_coords.transform_to('icrs')
-            self.center_ra = pos.ra.value
-            self.center_dec = pos.dec.value
-        self.get_pixel_corner_coord = self.get_module_pixel_corner_coord_ftn(self.center_ra, self.center_dec)
+            self.center_ra, self.center_dec = interp_module_center_ra_dec(frame_utc, self.pointing_model)
         self.init_pixel_rasters(sky_array)
 
     def init_pixel_rasters(self, sky_array):
-        """Initialize self.pixel_fovs, a dictionary of pixel coordinate: pixel raster pairs.
-        Each pixel raster is a view into sky_array corresponding to the region of the sky
-        visible by that detector."""
-        bounding_box = get_coord_bounding_box(self.center_ra, self.center_dec)
-        for px in range(32):
-            for py in range(32):
-                self.pixel_fovs[px, py] = self.compute_pixel_raster(px, py, bounding_box, sky_array)
-
-    def compute_pixel_raster(self, px, py, bounding_box, sky_array):
-        """Return a masked numpy view into sky_array corresponding to the scanline rasterization
-        of the region of sky_array visible by the detector at coordinates px, py.
+        """Initialize self.pixel_spans, the scanline rasterization of the region of sky_array
+        visible by each detector, computed for all 1024 pixels in one pass.
+        Each entry of self.pixel_spans is an array with one element per scanline:
+        (pixel index, sky_array row, first column, last column).
         The program uses top left corner zero-indexing."""
-        # Get sky_array indices for the corners of detector (px, py)
-        indices = [-1] * 4
-        for row in range(2):
-            for col in range(2):
-                x, y = self.get_pixel_corner_coord(px, py, row, col)
-                indices[2 * row + col] = ra_dec_to_sky_array_indices(x, y, bounding_box)
-        # Get pixel horizontal slices part of this pixel's FoV.
-        min_x, max_x = min(indices, key=lambda p: p[0])[0], max(indices, key=lambda p: p[0])[0]
-        min_y, max_y = min(indices, key=lambda p: p[1])[1], max(indices, key=lambda p: p[1])[1]
-        # Dictionary of [y-index] : [min_x index, max_x index].
-        pts = {
-            y: [float('inf'), float('-inf')] for y in range(min_y, max_y + 1)
-        }
-        corners = [0, 1, 3, 2, 0]
-        for i in range(4):
-            x1, y1 = indices[corners[i]]
-            x0, y0 = indices[corners[i + 1]]
-            bresenham_line(x0, y0, x1, y1, pts)
-        # Create masked numpy view:
-        mask_shape = max_y - min_y + 1, max_x - min_x + 1
-        pixel_mask = np.ones(mask_shape)
-        for y in pts:
-            left, right = pts[y][0] - min_x, pts[y][1] - min_x + 1
-            pixel_mask[y - min_y, left:right] = 0
-        # Get a view into the portion of sky_array corresponding to the FoV of this pixel.
-        pixel_sky_array_slice = sky_array[min_y:max_y + 1, min_x:max_x + 1]
-        return np.ma.array(pixel_sky_array_slice, mask=pixel_mask)
+        bounding_box = get_coord_bounding_box(self.center_ra, self.center_dec)
+        corner_ra, corner_dec = get_module_pixel_corner_coords(
+            self.center_ra, self.center_dec, self.pixel_corner_offsets
+        )
+        x, y = ra_dec_to_sky_array_indices(corner_ra, corner_dec, bounding_box)
+        # Vertices of pixel (px, py), in order around its FoV:
+        # corners (0, 0), (0, 1), (1, 1), (1, 0).
+        s = self.pixels_per_side
+        quad_xs = np.stack((x[:s, :s], x[:s, 1:], x[1:, 1:], x[1:, :s]), axis=-1).reshape(-1, 4)
+        quad_ys = np.stack((y[:s, :s], y[:s, 1:], y[1:, 1:], y[1:, :s]), axis=-1).reshape(-1, 4)
+        self.pixel_spans = scanline_fill_quads(quad_xs, quad_ys)
+        self.sky_array = sky_array
 
     def update_center_ra_dec_coords(self, frame_utc):
         """Return the RA-DEC coordinates of the center of the module's field of view at frame_utc."""
         assert frame_utc >= self.current_utc, f'frame_utc must be at least as large as self.current_utc'
-        dt = frame_utc - self.current_utc
-        # Earth rotates approx 360 degrees in 24 hrs.)
-        self.center_ra = (self.center_ra + dt * 360 / (24 * 60 * 60)) % 360
+        self.center_ra, self.center_dec = interp_module_center_ra_dec(frame_utc, self.pointing_model)
         self.current_utc = frame_utc
-        self.get_pixel_corner_coord = self.get_module_pixel_corner_coord_ftn(self.center_ra, self.center_dec)
 
     def add_birdies_to_image_array(self, raw_img):
         assert len(raw_img) == len(self.simulated_img_arr)
@@ -132,13 +112,15 @@ class ModuleView:
     def simulate_all_pixel_fovs(self):
         """Simulate every pixel FoV in this module, resulting in a simulated 32x32 image array
         containing only birdies."""
-        self.simulated_img_arr.fill(0)
-        for px in range(32):
-            for py in range(32):
-                # Sum the intensities in each element of sky_array visible by pixel (px, py) and
-                # return a counter value to add to the current image frame.
-                total_intensity = self.pixel_fovs[px, py].sum()
-                self.simulated_img_arr[px * 32 + py] = min(total_intensity, self.max_pixel_counter_value)
+        # Sum the intensities in each element of sky_array visible by each pixel, using
+        # row-wise cumulative sums to get the total of each scanline span.
+        pixel_index, rows, left, right = self.pixel_spans
+        row_sums = np.zeros((self.sky_array.shape[0], self.sky_array.shape[1] + 1))
+        np.cumsum(self.sky_array, axis=1, out=row_sums[:, 1:])
+        span_sums = row_sums[rows, right + 1] - row_sums[rows, left]
+        total_intensity = np.bincount(pixel_index, weights=span_sums, minlength=self.pixels_per_side**2)
+        # Counter value to add to the current image frame.
+        self.simulated_img_arr[:] = np.minimum(total_intensity, self.max_pixel_counter_value)
 
     def plot_simulated_image(self, raw_img):
         """Plot the simulated image array."""
@@ -150,3 +132,46 @@ class ModuleView:
         ax.set_aspect('equal', adjustable='box')
         fig1.suptitle(self)
         return fig1
+
+
+class TestPixelRasters(unittest.TestCase):
+    def bresenham_spans(self, view, bounding_box):
+        """The scanline spans of each pixel, found by walking the edges of its FoV
+        one pixel at a time with bresenham_line."""
+        x, y = ra_dec_to_sky_array_indices(*get_module_pixel_corner_coords(
+            view.center_ra, view.center_dec, view.pixel_corner_offsets
+        ), bounding_box)
+        spans = set()
+        for px in range(32):
+            for py in range(32):
+                indices = [(x[px + row, py + col], y[px + row, py + col]) for row in range(2) for col in range(2)]
+                ys = [p[1] for p in indices]
+                pts = {
+                    y: [float('inf'), float('-inf')] for y in range(min(ys), max(ys) + 1)
+                }
+                corners = [0, 1, 3, 2, 0]
+                for i in range(4):
+                    x1, y1 = indices[corners[i]]
+                    x0, y0 = indices[corners[i + 1]]
+                    bresenham_line(x0, y0, x1, y1, pts)
+                for row in pts:
+                    spans.add((px * 32 + py, row, pts[row][0], pts[row][1]))
+        return spans
+
+    def test_matches_bresenham(self):
+        sky_array = get_sky_image_array(100, False)
+        for pos_angle in [0, 17, 45, 120]:
+            # Skip the pointing model: only the center coordinates are needed.
+            view = ModuleView.__new__(ModuleView)
+            view.center_ra, view.center_dec = 180, 30
+            view.pixel_corner_offsets = get_module_pixel_corner_offsets(
+                pos_angle, pixel_size=ModuleView.pixel_size
+            )
+            view.init_pixel_rasters(sky_array)
+            spans = set(zip(*[a.tolist() for a in view.pixel_spans]))
+            bounding_box = get_coord_bounding_box(view.center_ra, view.center_dec)
+            self.assertEqual(self.bresenham_spans(view, bounding_box), spans)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -7,10 +7,14 @@ import astropy.time
 import astropy.units
 import astropy.coordinates
 
+# Dict of pointing models, keyed by module orientation, observatory location and time grid.
+pointing_models = dict()
+
 
 def get_module_center_ra_dec(t, azimuth, elevation, obslat, obslon, obsalt):
     """Return the RA-DEC coordinates of the center of the module's field of view at time t.
-    t should be a unix timestamp."""
+    t should be a unix timestamp, or an array of unix timestamps; in the latter case
+    all the transforms are done in a single astropy call."""
     angle_unit = astropy.units.deg
     earth_loc = astropy.coordinates.EarthLocation(
         lat=obslat * angle_unit,
@@ -32,13 +36,41 @@ def get_module_center_ra_dec(t, azimuth, elevation, obslat, obslon, obsalt):
     return center_ra, center_dec
 
 
-def get_module_pixel_corner_coord_ftn(pos_angle, pixel_size=0.31):
-    """Returns a higher-order function that returns functions that
-    return the RA-DEC coordinate of a pixel corner. The environment of
-    this function makes module-wide constants available throughout the simulation.
+def get_pointing_model(t_start, t_end, azimuth, elevation, obslat, obslon, obsalt, grid_step=60):
+    """Return a pointing model for a module between t_start and t_end: a tuple
+    (grid_times, center_ra, center_dec) of arrays giving the RA-DEC coordinates
+    of the center of the module's FoV every grid_step seconds.
+    Astropy is evaluated once per model; models are cached in pointing_models."""
+    assert t_end >= t_start, 'End time cannot be before start time.'
+    key = (azimuth, elevation, obslat, obslon, obsalt, t_start, t_end, grid_step)
+    if key not in pointing_models:
+        num_steps = max(int(np.ceil((t_end - t_start) / grid_step)), 1)
+        grid_times = t_start + grid_step * np.arange(num_steps + 1)
+        center_ra, center_dec = get_module_center_ra_dec(
+            grid_times, azimuth, elevation, obslat, obslon, obsalt
+        )
+        # Unwrap RA so that linear interpolation is valid across the 360 -> 0 degree boundary.
+        center_ra = np.degrees(np.unwrap(np.radians(center_ra)))
+        pointing_models[key] = grid_times, center_ra, center_dec
+    return pointing_models[key]
+
+
+def interp_module_center_ra_dec(t, pointing_model):
+    """Return the RA-DEC coordinates of the center of the module's field of view at time t,
+    interpolated from pointing_model. t may be a unix timestamp or an array of timestamps."""
+    grid_times, center_ra, center_dec = pointing_model
+    assert np.all((grid_times[0] <= t) & (t <= grid_times[-1])), 't is outside the range of the pointing model.'
+    ra = np.interp(t, grid_times, center_ra) % 360
+    dec = np.interp(t, grid_times, center_dec)
+    return ra, dec
+
+
+def get_module_pixel_corner_offsets(pos_angle, pixel_size=0.31):
+    """Return two 33 x 33 arrays containing the RA and DEC offsets of every pixel corner
+    from the center of the module's FoV. Adding the center coordinates of the module
+    (or arrays of them, with two trailing axes) gives the pixel corner coordinates.
         pos_angle: orientation of the astronomical instr/image on the plane
         of the sky, measured in degrees from North to East"""
-    #pos_angle = 45
     # Pixel offsets from the center of the module's FoV.
     col_offsets, row_offsets = np.linspace(-16, 16, 33), np.linspace(16, -16, 33)
 
@@ -56,14 +88,35 @@ def get_module_pixel_corner_coord_ftn(pos_angle, pixel_size=0.31):
 
     pixel_corner_i_hat_coords = col_offsets * i_hat[:, np.newaxis]
     pixel_corner_j_hat_coords = row_offsets * j_hat[:, np.newaxis]
+    ra_offsets = pixel_corner_i_hat_coords[0][:, np.newaxis] + pixel_corner_j_hat_coords[0]
+    dec_offsets = pixel_corner_i_hat_coords[1][:, np.newaxis] + pixel_corner_j_hat_coords[1]
+    return ra_offsets, dec_offsets
+
+
+def get_module_pixel_corner_coords(center_ra, center_dec, corner_offsets):
+    """Return the RA-DEC coordinates of every pixel corner given the center coordinates
+    of the module's FoV. center_ra and center_dec may be arrays, e.g. one entry per frame;
+    the result then has shape center_ra.shape + (33, 33)."""
+    ra_offsets, dec_offsets = corner_offsets
+    center_ra = np.asarray(center_ra)[..., np.newaxis, np.newaxis]
+    center_dec = np.asarray(center_dec)[..., np.newaxis, np.newaxis]
+    return center_ra + ra_offsets, center_dec + dec_offsets
+
+
+def get_module_pixel_corner_coord_ftn(pos_angle, pixel_size=0.31):
+    """Returns a higher-order function that returns functions that
+    return the RA-DEC coordinate of a pixel corner. The environment of
+    this function makes module-wide constants available throughout the simulation.
+        pos_angle: orientation of the astronomical instr/image on the plane
+        of the sky, measured in degrees from North to East"""
+    corner_offsets = get_module_pixel_corner_offsets(pos_angle, pixel_size)
 
     def get_pixel_corner_coord_ftn(center_ra, center_dec):
         """Returns a function that returns the RA-DEC coordinate of
         the corner (x,y) = (0..1, 0..1) of pixel (row, col) = (0..31, 0..31).
         Pixels and corner positions are zero-indexed from the top left."""
         # 33 x 33 matrix corresponding to the RA-DEC corner coords of each pixel.
-        corner_coords_ra = center_ra + pixel_corner_i_hat_coords[0][:, np.newaxis] + pixel_corner_j_hat_coords[0]
-        corner_coords_dec = center_dec + pixel_corner_i_hat_coords[1][:, np.newaxis] + pixel_corner_j_hat_coords[1]
+        corner_coords_ra, corner_coords_dec = get_module_pixel_corner_coords(center_ra, center_dec, corner_offsets)
 
         def get_pixel_corner_coord(row, col, x, y):
             """Returns the RA-DEC coordinate of the corner (x,y) = (0..1, 0..1) of
@@ -91,11 +144,11 @@ def get_sky_band_corner_coords(t_start, t_end, azimuth, elevation, obslat, obslo
     """Return a 2x2 list of RA-DEC coordinates bounding the region of sky observed by a module
     between t_start and t_end. The positions are zero-indexed from the top left corner."""
     assert t_end >= t_start, 'End time cannot be before start time.'
-    center_start_ra, center_start_dec = get_module_center_ra_dec(t_start, azimuth, elevation, obslat, obslon, obsalt)
-    start_corner_coords = get_module_corner_coords(center_start_ra, center_start_dec, pos_angle)
-
-    center_end_ra, center_end_dec = get_module_center_ra_dec(t_end, azimuth, elevation, obslat, obslon, obsalt)
-    end_corner_coords = get_module_corner_coords(center_end_ra, center_end_dec, pos_angle)
+    center_ras, center_decs = get_module_center_ra_dec(
+        np.array((t_start, t_end)), azimuth, elevation, obslat, obslon, obsalt
+    )
+    start_corner_coords = get_module_corner_coords(center_ras[0], center_decs[0], pos_angle)
+    end_corner_coords = get_module_corner_coords(center_ras[1], center_decs[1], pos_angle)
     sky_band_corner_coords = [
         [start_corner_coords[0][0], end_corner_coords[0][1]],
         [start_corner_coords[1][0], end_corner_coords[1][1]]
@@ -0,0 +1,259 @@
+#! /usr/bin/env python3
+
+# summarize_files.py --vol X [--run R] [--loop N]
+#
+# build summaries of the PFF files of a volume's runs,
+# so that web pages can show them as static files
+# rather than processing the data for each request.
+# For each image or pulse-height file, in vol/summary/run/file/:
+#   thumbnail.png       a frame from the middle of the file
+#   mean.png            mean image
+#   rate.png, rate.csv  pixel counts (image) or events (PH) per second
+#   ph_hist.png         (PH only) histogram of the max pixel of each event
+#   summary.json        written last; source file size and mtime,
+#                       frame count, time span, mean pixel value.
+#                       If the file has no frames or can't be read,
+#                       it has only the size and mtime, and 'error'
+#
+# Each file is summarized once: it's redone only if its size or mtime
+# change, or if SUMMARY_VERSION changes.
+# Only complete runs are summarized.
+#
+# --run R   summarize only run R
+# --loop N  keep running, checking for new files every N seconds
+
+import os, sys, json, time
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+sys.path.append('../util')
+import pff, run_catalog
+from analysis_util import *
+
+SUMMARY_VERSION = 1
+    # increase this to redo all summaries
+CHUNK_FRAMES = 10000
+    # frames processed at once
+MAX_PH_EVENTS = 100000
+    # max PH events whose header times are parsed, for the rate plot
+MAX_RATE_BINS = 1000
+THUMBNAIL_SCALE = 4
+    # thumbnail pixels per image pixel
+
+# image size and pixel type for each data product
+#
+DP_IMAGE_PARAMS = {
+    'img8': (32, 'u1'),
+    'img16': (32, '<u2'),
+    'ph256': (16, '<i2'),
+    'ph1024': (32, '<i2'),
+}
+
+# return the frames of a PFF file as a memory-mapped structured array
+#
+def frame_array(path, image_size, pixel_type):
+    with open(path, 'rb') as f:
+        pff.read_json(f)
+        header_size = f.tell()
+    dtype = np.dtype([
+        ('header', 'S%d'%header_size),
+        ('star', 'S1'),
+        ('image', pixel_type, (image_size*image_size,)),
+    ])
+    nframes = os.path.getsize(path)//dtype.itemsize
+    return np.memmap(path, dtype=dtype, mode='r', shape=(nframes,))
+
+# return the limits for displaying an image
+#
+def display_limits(img):
+    lo, hi = np.quantile(img, [0.01, 0.99])
+    if hi <= lo:
+        hi = lo + 1
+    return lo, hi
+
+def write_thumbnail(img, path):
+    lo, hi = display_limits(img)
+    img = np.repeat(np.repeat(img, THUMBNAIL_SCALE, axis=0), THUMBNAIL_SCALE, axis=1)
+    plt.imsave(path, img, vmin=lo, vmax=hi, cmap='gray')
+
+def write_mean_image(mean, path):
+    lo, hi = display_limits(mean)
+    fig, ax = plt.subplots(figsize=(4, 3.5))
+    im = ax.imshow(mean, vmin=lo, vmax=hi, cmap='plasma')
+    fig.colorbar(im, ax=ax)
+    ax.set_title('Mean image')
+    fig.savefig(path, dpi=100, bbox_inches='tight')
+    plt.close(fig)
+
+# write a time series of weights summed in time bins,
+# per second of the bin width
+#
+def write_rate(t, weights, ylabel, csv_path, png_path):
+    # frames with bad times have t = 0
+    weights = weights[t > 0]
+    t = t[t > 0]
+    if len(t) == 0:
+        return
+    span = t.max() - t.min()
+    nbins = int(min(max(span, 1), MAX_RATE_BINS))
+    counts, edges = np.histogram(t, bins=nbins, weights=weights)
+    bin_width = (edges[1] - edges[0]) if span > 0 else 1
+    rate = counts/bin_width
+    secs = edges[:-1] - edges[0]
+    np.savetxt(
+        csv_path, np.column_stack([secs, rate]), delimiter=',',
+        header='seconds,%s'%ylabel, comments=''
+    )
+    fig, ax = plt.subplots(figsize=(6, 3))
+    ax.plot(secs, rate)
+    ax.set_xlabel('Seconds since %s'%time.strftime(
+        '%Y-%m-%d %H:%M:%S', time.gmtime(edges[0])
+    ))
+    ax.set_ylabel(ylabel)
+    fig.savefig(png_path, dpi=100, bbox_inches='tight')
+    plt.close(fig)
+
+def write_ph_histogram(maxes, path):
+    fig, ax = plt.subplots(figsize=(6, 3))
+    ax.hist(maxes, bins=100, log=True)
+    ax.set_xlabel('Max pixel value')
+    ax.set_ylabel('Events')
+    fig.savefig(path, dpi=100, bbox_inches='tight')
+    plt.close(fig)
+
+# return the times of (a sample of) PH events, and the weight of each
+#
+def ph_event_times(frames):
+    n = len(frames)
+    step = max(1, n//MAX_PH_EVENTS)
+    headers = frames['header'][::step]
+    t = np.array([pff.img_header_time(json.loads(h)) for h in headers])
+    return t, np.full(len(t), float(step))
+
+def summarize_file(path, dp, info, out_dir):
+    image_size, pixel_type = DP_IMAGE_PARAMS[dp]
+    is_ph = dp.startswith('ph')
+    frames = frame_array(path, image_size, pixel_type)
+    n = len(frames)
+    if n == 0:
+        return None
+
+    npix = image_size*image_size
+    total = np.zeros(npix)
+    frame_sums = np.empty(n)
+    frame_maxes = np.empty(n)
+    for i in range(0, n, CHUNK_FRAMES):
+        images = frames['image'][i:i+CHUNK_FRAMES].astype(np.float64)
+        total += images.sum(axis=0)
+        frame_sums[i:i+len(images)] = images.sum(axis=1)
+        frame_maxes[i:i+len(images)] = images.max(axis=1)
+    mean = (total/n).reshape(image_size, image_size)
+
+    write_thumbnail(
+        frames['image'][n//2].reshape(image_size, image_size).astype(np.float64),
+        '%s/thumbnail.png'%out_dir
+    )
+    write_mean_image(mean, '%s/mean.png'%out_dir)
+    if is_ph:
+        t, weights = ph_event_times(frames)
+        write_rate(t, weights, 'Events/sec', '%s/rate.csv'%out_dir, '%s/rate.png'%out_dir)
+        write_ph_histogram(frame_maxes, '%s/ph_hist.png'%out_dir)
+    elif info['first_t']:
+        # frames are (nearly) evenly spaced in time
+        t = np.linspace(info['first_t'], info['last_t'], n)
+        write_rate(t, frame_sums, 'Counts/sec', '%s/rate.csv'%out_dir, '%s/rate.png'%out_dir)
+
+    return {
+        'nframes': n,
+        'mean_pixel': float(mean.mean()),
+        'max_pixel': float(frame_maxes.max()),
+    }
+
+# return True if the file's summary exists and is up to date.
+# st is from os.stat() of the file; the catalog's size and mtime
+# may be out of date if the file was rewritten in place
+#
+def summary_ok(out_dir, st):
+    try:
+        with open('%s/summary.json'%out_dir) as f:
+            s = json.load(f)
+    except Exception:
+        return False
+    return s['version'] == SUMMARY_VERSION and s['size'] == st.st_size \
+        and s['mtime'] == st.st_mtime
+
+def do_run(vol, run, entry):
+    for fname, info in entry['files'].items():
+        dp = info['attrs'].get('dp') if info['attrs'] else None
+        if dp not in DP_IMAGE_PARAMS:
+            continue
+        path = '%s/data/%s/%s'%(vol, run, fname)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        if not st.st_size:
+            continue
+        out_dir = '%s/%s/%s/%s'%(vol, SUMMARY_ROOT, run, fname)
+        if summary_ok(out_dir, st):
+            continue
+        make_dir('%s/%s'%(vol, SUMMARY_ROOT))
+        make_dir('%s/%s/%s'%(vol, SUMMARY_ROOT, run))
+        make_dir(out_dir)
+        print('summarizing %s/%s'%(run, fname))
+        # if the file can't be summarized, record that,
+        # so that it's not retried until it changes
+        try:
+            s = summarize_file(path, dp, info, out_dir)
+            if s is None:
+                s = {'error': 'no frames'}
+        except Exception as e:
+            print('summarize_file() failed: %s'%e)
+            s = {'error': str(e)}
+        s.update({
+            'version': SUMMARY_VERSION,
+            'size': st.st_size,
+            'mtime': st.st_mtime,
+            'first_t': info['first_t'],
+            'last_t': info['last_t'],
+        })
+        with open('%s/summary.json.tmp'%out_dir, 'w') as f:
+            json.dump(s, f, indent=4)
+        os.rename('%s/summary.json.tmp'%out_dir, '%s/summary.json'%out_dir)
+
+def do_vol(vol, run=None):
+    catalog = run_catalog.update_catalog('%s/data'%vol)
+    for name, entry in run_catalog.sorted_runs(catalog):
+        if run and name != run:
+            continue
+        if not entry['complete']:
+            continue
+        do_run(vol, name, entry)
+
+if __name__ == '__main__':
+    vol = None
+    run = None
+    loop = 0
+    argv = sys.argv
+    i = 1
+    while i<len(argv):
+        if argv[i] == '--vol':
+            i += 1
+            vol = argv[i]
+        elif argv[i] == '--run':
+            i += 1
+            run = argv[i]
+        elif argv[i] == '--loop':
+            i += 1
+            loop = float(argv[i])
+        else:
+            raise Exception('bad arg: %s'%argv[i])
+        i += 1
+    if not vol:
+        raise Exception('no volume specified')
+    while True:
+        do_vol(vol, run)
+        if not loop:
+            break
+        time.sleep(loop)
@@ -9,21 +9,20 @@
 ##############################################################
 import time, sys
 import serial
-import struct
 import redis
 from influxdb import InfluxDBClient
 from signal import signal, SIGINT
-from datetime import datetime
-from datetime import timezone
 from redis_utils import *
 import util
 sys.path.insert(0, '../util')
 import config_file
+import tsip
 
 
-BYTEORDER = 'big'
 RKEY = 'GPSPRIM'
 RKEYsupp = 'GPSSUPP'
+READ_SIZE = 4096
+    # max bytes per read from a file or pty
 
 lastTime = ''
 lastTimeUpdated = False
@@ -32,63 +31,36 @@ def handler(signal_recieved, frame):
     print('\nSIGINT or CTRL-C detected. Exiting')
     exit(0)
 
-def floatfrom_bytes(bytesData, bytesorder=BYTEORDER):
-    if BYTEORDER == 'little':
-        f = '<f'
-    else:
-        f = '>f'
-
-    return struct.unpack(f, bytesData)[0]
-
-def doublefrom_bytes(bytesData, bytesorder=BYTEORDER):
-    if BYTEORDER == 'little':
-        d = '<d'
-    else:
-        d = '>d'
-
-    return struct.unpack(d, bytesData)[0]
-
 timingFlagValues = {0:'GPS', 1:'UTC'}
 
 # OutputID 0x8F-AB
 def primaryTimingPacket(data, r):
     global lastTime, lastTimeUpdated
-    if len(data) != 17:
+    if len(data) != tsip.PRIMARY_TIMING_STRUCT.size:
         print(RKEY, ' is malformed ignoring the following data packet')
         print(data)
         print('Packet size is ', len(data))
         return
-    tvUTC = str(datetime.now(timezone.utc))
-    
-    timeofWeek = int.from_bytes(data[1:5], byteorder=BYTEORDER, signed=False)
-    
-    weekNumber = int.from_bytes(data[5:7], byteorder=BYTEORDER, signed=False)
-    
-    UTCOffset = int.from_bytes(data[7:9], byteorder=BYTEORDER, signed=True)
-    
-    timingFlag = int.from_bytes(data[9:10], byteorder=BYTEORDER, signed=False)
+    p = tsip.decodePrimaryTimingPacket(data)
+    year, month, dayofMonth = p['year'], p['month'], p['dayofMonth']
+    hours, minutes, seconds = p['hours'], p['minutes'], p['seconds']
+
+    timingFlag = p['timingFlag']
     timeFlagIndex = timingFlag & 0x01
     PPS = (timingFlag & 0x02) >> 1
     timeSet = (timingFlag & 0x04) >> 2
     UTCinfo = (timingFlag & 0x08) >> 3
     timeFrom = (timingFlag & 0x10) >> 4
     
-    seconds = int.from_bytes(data[10:11], byteorder=BYTEORDER, signed=False)
-    minutes = int.from_bytes(data[11:12], byteorder=BYTEORDER, signed=False)
-    hours = int.from_bytes(data[12:13], byteorder=BYTEORDER, signed=False)
-    dayofMonth = int.from_bytes(data[13:14], byteorder=BYTEORDER, signed=False)
-    month = int.from_bytes(data[14:15], byteorder=BYTEORDER, signed=False)
-    year = int.from_bytes(data[15:17], byteorder=BYTEORDER, signed=False)
-    
     lastTime = str(year)+'-'+str(month)+'-'+str(dayofMonth)+'T'+str(hours)+':'+str(minutes)+':'+str(seconds) + 'Z'
     lastTimeUpdated = True
     print(lastTime)
     
     redis_set = { 'Computer_UTC': time.time(),#datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
         'GPSTIME': lastTime,
-        'TOW': timeofWeek,
-        'WEEKNUMBER': weekNumber,
-        'UTCOFFSET': UTCOffset,
+        'TOW': p['timeofWeek'],
+        'WEEKNUMBER': p['weekNumber'],
+        'UTCOFFSET': p['UTCOffset'],
         'TIMEFLAG': timingFlagValues[timeFlagIndex],
         'PPSFLAG': timingFlagValues[PPS],
         'TIMESET': (timeSet+1)%2,
@@ -96,8 +68,7 @@ def primaryTimingPacket(data, r):
         'TIMEFROMGPS': (timeFrom+1)%2
     }
 
-    for key in redis_set.keys():
-        r.hset(RKEY, key, redis_set[key])
+    store_in_redis(r, RKEY, redis_set)
     
 
     
@@ -112,7 +83,7 @@ DEFAULTVALUE = 'Uknown Value {0}'
 # OutputID 0x8F-AC
 def supplementaryTimingPacket(data, r):
     global lastTimeUpdated
-    if len(data) != 68:
+    if len(data) != tsip.SUPPLEMENTARY_TIMING_STRUCT.size:
         print(RKEYsupp, ' is malformed ignoring the following data packet')
         print(data)
         print('Packet size is ', len(data))
@@ -122,33 +93,20 @@ def supplementaryTimingPacket(data, r):
         print("Primary Packet Failed not saving Supplementary Packet")
         return
     
-    receiverMode = int.from_bytes(data[1:2], byteorder=BYTEORDER, signed=False)
-    discipliningMode = int.from_bytes(data[2:3], byteorder=BYTEORDER, signed=False)
-    selfSurveyProgress = int.from_bytes(data[3:4], byteorder=BYTEORDER, signed=False)
-    holdOverDuration = int.from_bytes(data[4:8], byteorder=BYTEORDER, signed=False)
-    criticalAlarms = int.from_bytes(data[8:10], byteorder=BYTEORDER, signed=False)
-    minorAlarms = int.from_bytes(data[10:12], byteorder=BYTEORDER, signed=False)
-    GPSDecodingStatus = int.from_bytes(data[12:13], byteorder=BYTEORDER, signed=False)
-    discipliningActivity = int.from_bytes(data[13:14], byteorder=BYTEORDER, signed=False)
-    spareStatus1 = int.from_bytes(data[14:15], byteorder=BYTEORDER, signed=False)
-    spareStatus2 = int.from_bytes(data[15:16], byteorder=BYTEORDER, signed=False)
-
-    PPSOffset = floatfrom_bytes(data[16:20])
-    clockOffset = floatfrom_bytes(data[20:24])
-    DACValue = int.from_bytes(data[24:28], byteorder=BYTEORDER, signed=False)
-    DACVoltage = floatfrom_bytes(data[28:32])
-    temp = floatfrom_bytes(data[32:36])
-    latitude = doublefrom_bytes(data[36:44])
-    longitude = doublefrom_bytes(data[44:52])
-    altitude = doublefrom_bytes(data[52:60])
-    PPSQuantizationError = floatfrom_bytes(data[60:64])
+    p = tsip.decodeSupplementaryTimingPacket(data)
+    receiverMode = p['receiverMode']
+    discipliningMode = p['discipliningMode']
+    criticalAlarms = p['criticalAlarms']
+    minorAlarms = p['minorAlarms']
+    GPSDecodingStatus = p['GPSDecodingStatus']
+    discipliningActivity = p['discipliningActivity']
 
     redis_set = { 'Computer_UTC': time.time(),#datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
         'GPSTIME': lastTime,
         'RECEIVERMODE': DEFAULTVALUE.format(receiverMode),
-        'DISCIPLININGMODE': DEFAULTVALUE.format(disModeValues),
-        'SELFSURVEYPROGRESS': selfSurveyProgress,
-        'HOLDOVERDURATION': holdOverDuration,
+        'DISCIPLININGMODE': DEFAULTVALUE.format(discipliningMode),
+        'SELFSURVEYPROGRESS': p['selfSurveyProgress'],
+        'HOLDOVERDURATION': p['holdOverDuration'],
         'DACatRail': (criticalAlarms & 0x08) >> 3,
         'DACnearRail': minorAlarms & 0x0001,
         'AntennaOpen': (minorAlarms & 0x0002) >> 1,
@@ -165,17 +123,17 @@ def supplementaryTimingPacket(data, r):
         'PPSNotGenerated': (minorAlarms & 0x1000) >> 12,
         'GPSDECODINGSTATUS': DEFAULTVALUE.format(GPSDecodingStatus),
         'DISCIPLININGACTIVITY': DEFAULTVALUE.format(discipliningActivity),
-        'SPARESTATUS1': spareStatus1,
-        'SPARESTATUS2': spareStatus2,
-        'PPSOFFSET': PPSOffset,
-        'CLOCKOFFSET': clockOffset,
-        'DACVALUE': DACValue,
-        'DACVOLTAGE': DACVoltage,
-        'TEMPERATURE': temp,
-        'LATITUDE': latitude,
-        'LONGITUDE': longitude,
-        'ALTITUDE': altitude,
-        'PPSQUANTIZATIONERROR': PPSQuantizationError
+        'SPARESTATUS1': p['spareStatus1'],
+        'SPARESTATUS2': p['spareStatus2'],
+        'PPSOFFSET': p['PPSOffset'],
+        'CLOCKOFFSET': p['clockOffset'],
+        'DACVALUE': p['DACValue'],
+        'DACVOLTAGE': p['DACVoltage'],
+        'TEMPERATURE': p['temp'],
+        'LATITUDE': p['latitude'],
+        'LONGITUDE': p['longitude'],
+        'ALTITUDE': p['altitude'],
+        'PPSQUANTIZATIONERROR': p['PPSQuantizationError']
     }
     if receiverMode in recModeValues:
         redis_set['RECEIVERMODE'] = recModeValues[receiverMode]
@@ -186,40 +144,22 @@ def supplementaryTimingPacket(data, r):
     if discipliningActivity in disActivityValues:
         redis_set['DISCIPLININGACTIVITY'] = disActivityValues[discipliningActivity]
     
-    for key in redis_set.keys():
-        r.hset(RKEYsupp, key, redis_set[key])
+    store_in_redis(r, RKEYsupp, redis_set)
     
     lastTimeUpdated = False
-    
-    #print('ID = ', data[0:1])
-    #print('ReceiverMode = ', receiverMode, ' bytes = ', data[1:2])
-    #print('DiscipliningMode = ', discipliningMode, ' bytes = ', data[2:3])
-    #print('Self-SurveyProgress = ', selfSurveyProgress, ' bytes = ', data[3:4])
-    #print('Holdover Duration = ', holdOverDuration, ' bytes = ', data[4:8])
-    #print('Critical Alarms = ', criticalAlarms, ' bytes = ', data[8:10])
-    #print('Minor Alarms = ', minorAlarms, ' bytes = ', data[10:12])
-    #print('GPS Decoding Status = ', GPSDecodingStatus, ' bytes = ', data[12:13])
-    #print('Disciplining Activity = ', discipliningActivity, ' bytes = ', data[13:14])
-    #print('Spare Status1 = ', spareStatus1, ' bytes = ', data[14:15])
-    #print('Spare Status2 = ', spareStatus2, ' bytes = ', data[15:16])
-    #print('PPSOffset = ', PPSOffset, ' bytes = ', data[16:20])
-    #print('Clock Offset = ', clockOffset, ' bytes = ', data[20:24])
-    #print('DAC Values = ', DACValue, ' bytes = ', data[24:28])
-    #print('DAC Voltage = ', DACVoltage, ' bytes = ', data[28:32])
-    #print('Temperature = ', temp, ' bytes = ', data[32:36])
-    #print('Lat = ', latitude, ' Long = ', longitude, ' Altitude = ', altitude)
-    #print('PPS Quantization Error = ', PPSQuantizationError, ' bytes = ', data[60:64])
-
-
 
 
 # Reading the data from the serial port. This will be running in an infinite loop.
 
 signal(SIGINT, handler)
 
-def initialize():
+def initialize(path=None):
     r = redis_init()
 
+    if path is not None:
+        # recorded serial capture, or a pty replaying one
+        return open(path, 'rb', buffering=0), r
+
     # configure the serial connections (the parameters differs on the device you are connecting to)
     ser = serial.Serial(
         port=util.get_gps_port(config_file.get_obs_config()),
@@ -233,36 +173,45 @@ def initialize():
 
     return ser, r
 
+# Read the bytes available from the serial port or file,
+# blocking until there's at least one. Returns b'' at EOF.
+#
+def readChunk(ser):
+    if isinstance(ser, serial.Serial):
+        return ser.read(max(1, ser.in_waiting))
+    return ser.read(READ_SIZE)
+
+def handlePacket(packet, r):
+    id = packet[0:2]
+    if id == tsip.PRIMARY_TIMING_ID:
+        primaryTimingPacket(packet[1:], r)
+    elif id == tsip.SUPPLEMENTARY_TIMING_ID:
+        supplementaryTimingPacket(packet[1:], r)
+    else:
+        print('****fishy packet')
+        print(packet)
+        print(len(packet[1:]))
 
-def main():
-    data = b''
-    data_size = 0
-    last_recv_byte = 0
 
-    ser, r = initialize()
+# usage: capture_gps.py [path]
+# path: file or pty to read TSIP data from instead of the GPS receiver
+#
+def main():
+    ser, r = initialize(sys.argv[1] if len(sys.argv) > 1 else None)
+    parser = tsip.TSIPParser()
 
     print('Running')
     while True:
-        recv_byte = ser.read()
-        if recv_byte == b'\x10' and last_recv_byte == b'\x10':
-            pass
-        else:
-            data += recv_byte
-            data_size += 1
-        last_recv_byte = recv_byte
-        if data[data_size - 1:data_size] == b'\x03' and data[data_size - 2:data_size - 1] == b'\x10':
-            if data[0:1] == b'\x10':
-                id = data[1:3]
-                if id == b'\x8f\xab':
-                    primaryTimingPacket(data[2:data_size - 2], r)
-                elif id == b'\x8f\xac':
-                    supplementaryTimingPacket(data[2:data_size - 2], r)
-                else:
-                    print('****fishy packet')
-                    print(data[1:data_size - 2])
-                    print(len(data[2:data_size - 2]))
-            data = b''
-            data_size = 0
+        chunk = readChunk(ser)
+        if not chunk:
+            break
+        packets = parser.feed(chunk)
+        if not packets:
+            continue
+        pipe = r.pipeline(transaction=False)
+        for packet in packets:
+            handlePacket(packet, pipe)
+        pipe.execute()
 
 
 if __name__ == "__main__":
@@ -3,6 +3,12 @@
 """
 Script for capturing metadata from each ethernet outlet
 and storing it in the Redis database.
+All the outlets are queried concurrently, and the results
+are written to Redis in one pipeline.
+
+usage: capture_power.py [--wps name url socket]...
+    --wps: poll this WPS instead of those in obs_config.json,
+        e.g. a wps_standin.py server for testing.
 """
 from datetime import datetime
 import sys, time
@@ -16,16 +22,11 @@ import config_file
 UPDATE_INTERVAL = 1
 
 
-def get_wps_fields(wps_dict):
+def get_wps_fields(power_on):
     """Creates a dictionary of values to write into Redis."""
-    try:
-        power_status = "ON" if power.quabo_power_query(wps_dict) else "OFF"
-    except Exception:
-        print(f'capture_power.py: Failed to query {wps_dict}. The login info for this UPS may be incorrect."')
-        raise
     rkey_fields = {
         'Computer_UTC': time.time(),
-        'POWER': power_status
+        'POWER': "ON" if power_on else "OFF"
     }
     return rkey_fields
 
@@ -35,20 +36,41 @@ def get_wps_rkey(wps_key):
     return wps_key.upper()
 
 
+def get_wpss():
+    """Returns a dict of wps name: wps config, from the command line or obs_config.json."""
+    wpss = dict()
+    argv = sys.argv
+    i = 1
+    while i < len(argv):
+        if argv[i] == '--wps':
+            wpss[argv[i+1]] = {'url': argv[i+2], 'quabo_socket': int(argv[i+3])}
+            i += 3
+        else:
+            raise Exception('bad arg: %s'%argv[i])
+        i += 1
+    if not wpss:
+        obs_config = config_file.get_obs_config()
+        wpss = {key: obs_config[key] for key in obs_config.keys() if 'wps' in key.lower()}
+    return wpss
+
+
 def main():
     r = redis_utils.redis_init()
-    obs_config = config_file.get_obs_config()
-    wps_keys = [key for key in obs_config.keys() if 'wps' in key.lower()]
+    wpss = get_wpss()
     print("capture_power.py: Running...")
     while True:
-        for wps_key in wps_keys:
-            rkey = get_wps_rkey(wps_key)
-            wps_dict = obs_config[wps_key]
-            fields = get_wps_fields(wps_dict)
-            redis_utils.store_in_redis(r, rkey, fields)
-        time.sleep(UPDATE_INTERVAL)
+        t = time.time()
+        status = power.quabo_power_query_all(wpss)
+        pipe = r.pipeline(transaction=False)
+        for wps_key, power_on in status.items():
+            if isinstance(power_on, Exception):
+                print(f'capture_power.py: Failed to query {wpss[wps_key]}: {power_on}. '
+                      f'The login info for this UPS may be incorrect.')
+                continue
+            redis_utils.store_in_redis(pipe, get_wps_rkey(wps_key), get_wps_fields(power_on))
+        pipe.execute()
+        time.sleep(max(0, UPDATE_INTERVAL - (time.time() - t)))
 
 
 if __name__ == "__main__":
     main()
-
@@ -6,6 +6,12 @@
 # All packet information is time stamped by the computer and 
 # added to each set of values with a variable labeled as
 # 'Computer_UTC'.
+# Each poll is a single SNMP GETBULK request; only the fields
+# that changed since the last poll are written to Redis,
+# plus a full snapshot every HEARTBEAT_INTERVAL seconds.
+#
+# usage: capture_wr.py [--switch host[:port]] [--interval secs]
+# Use --switch with wrs_snmp_standin.py to test without a switch.
 ##############################################################
 import os, sys
 import netsnmp
@@ -19,7 +25,7 @@ import util
 sys.path.insert(0, '../util')
 import config_file
 
-from panoseti_snmp import wrs_snmp
+from panoseti_snmp import wrs_snmp, wrs_snmp_bulk
 
 # wrs status
 LINK_DOWN   =   '1'
@@ -29,10 +35,14 @@ SFP_PN1     =   'PS-FB-RX1310'
 SOFTPLL_LOCKED      =   '1'
 SOFTPLL_UNLOCKED    =   '2'
 
-SWITCHIP    =   util.get_wr_ip_addr(config_file.get_obs_config())
 RKEY        =   f'WRSWITCH{""}'
 OBSERVATORY =   'lick'
 
+POLL_INTERVAL       =   1
+    # seconds between polls
+HEARTBEAT_INTERVAL  =   60
+    # seconds between writes of all fields, changed or not
+
 def handler(signal_recieved, frame):
     print('\nSIGINT or CTRL-C detected. Exiting')
     exit(0)
@@ -111,34 +121,76 @@ def wrsSoftPLLCheck(wrs):
         print(' ')
 
 
-# init redis and create wrs_snmp obj
+# init redis and create wrs_snmp objs
 #
-def initialize():
+def initialize(switch_ip):
     r = redis_init()
-    wrs = wrs_snmp(SWITCHIP)
-    return wrs, r
+    wrs = wrs_snmp(switch_ip)
+    wrs_bulk = wrs_snmp_bulk(switch_ip)
+    return wrs, wrs_bulk, r
+
+# poll the switch; return a dict of Redis fields, or None on failure
+#
+def wrsPoll(wrs_bulk):
+    res = wrs_bulk.status()
+    if res == -1:
+        return None
+    links, pll = res
+    fields = {}
+    for i in range(len(links)):
+        fields['Port%2d_LINK'%(i+1)] = 1 if links[i] == LINK_UP else 0
+    fields['SOFTPLL'] = 1 if pll == SOFTPLL_LOCKED else 0
+    return fields
 
 def main():
-    wrs, r = initialize()
+    switch_ip = None
+    interval = POLL_INTERVAL
+    argv = sys.argv
+    i = 1
+    while i < len(argv):
+        if argv[i] == '--switch':
+            i += 1
+            switch_ip = argv[i]
+        elif argv[i] == '--interval':
+            i += 1
+            interval = float(argv[i])
+        else:
+            print('bad arg: %s'%argv[i])
+            return
+        i += 1
+    if switch_ip is None:
+        switch_ip = util.get_wr_ip_addr(config_file.get_obs_config())
+    wrs, wrs_bulk, r = initialize(switch_ip)
     # check the current status one time, including sfpPN, link status and softpll status,
     # and print the info out
     wrsSFPCheck(wrs)
     wrsLinkStatusCheck(wrs)
     wrsSoftPLLCheck(wrs)
 
-    # then check link status and softpll status once a second,
-    # and write the status into redis
+    # then check link status and softpll status every interval seconds,
+    # and write the changes into redis
+    last = {}
+    last_full = 0
+        # time of the last full snapshot
     while(True):
-        r.hset(RKEY, 'Computer_UTC', time.time())
-        # check link status
-        res = wrs.linkstatus()
-        for i in range(len(res)):
-            r.hset(RKEY, 'Port%2d_LINK'%(i+1), 1 if res[i] == LINK_UP else 0)
-        # check softpll status
-        res = wrs.pllstatus()
-        r.hset(RKEY, 'SOFTPLL', 1 if res[0] == SOFTPLL_LOCKED else 0)
-        print(datetime.utcnow())
-        time.sleep(1)
+        t = time.time()
+        fields = wrsPoll(wrs_bulk)
+        if fields is None:
+            print("We can't connect to WR-SWITCH(%s)!"%(switch_ip))
+        else:
+            if t - last_full >= HEARTBEAT_INTERVAL:
+                changed = dict(fields)
+                last_full = t
+            else:
+                changed = {k: v for k, v in fields.items() if last.get(k) != v}
+            if changed:
+                changed['Computer_UTC'] = t
+                pipe = r.pipeline(transaction=False)
+                store_in_redis(pipe, RKEY, changed)
+                pipe.execute()
+                print(datetime.utcnow(), changed)
+            last = fields
+        time.sleep(max(0, interval - (time.time() - t)))
 
 if __name__ == "__main__":
     main()
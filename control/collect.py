@@ -1,6 +1,9 @@
 #! /usr/bin/env python3
 
-# collect files from remote DAQ nodes at the end of a recording run
+# collect files from remote DAQ nodes at the end of a recording run.
+# Nodes are handled concurrently; files are checked against a
+# per-file manifest (sizes and checksums) before DAQ nodes are cleaned up,
+# and running it again resumes an interrupted collection.
 #
 # options when run as a cmdline script:
 #
@@ -8,36 +11,103 @@
 # --cleanup     clean up DAQ nodes; don't collect
 # --verbose
 
-import os, sys
+import os, sys, json
 import file_xfer, util
 sys.path.insert(0, '../util')
 import config_file
 
+manifest_filename = 'collect_manifest.json'
+    # in the head node run dir; per DAQ node, the files of the run
+    # on that node and whether they were copied and verified,
+    # and the files copied and verified during the run
+    # by trickle_collect.py ('trickled')
+
+# DAQ nodes are identified by IP addr and data dir
+# (so several nodes can be on one host, e.g. for testing)
+#
+def node_key(node):
+    return '%s:%s'%(node['ip_addr'], node['data_dir'])
+
+def read_manifest(daq_config, run_dir):
+    path = '%s/%s/%s'%(daq_config['head_node_data_dir'], run_dir, manifest_filename)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def write_manifest(daq_config, run_dir, manifest):
+    path = '%s/%s/%s'%(daq_config['head_node_data_dir'], run_dir, manifest_filename)
+    with open(path+'.tmp', 'w') as f:
+        json.dump(manifest, f, indent=4)
+    os.rename(path+'.tmp', path)
+
+# move a run's files on the head node (if it's also a DAQ node)
+# into the run dir.
+# return '' if successful, else error msg
+#
+def collect_local(daq_config, node, run_dir, verbose):
+    error_msg = ''
+    for module in node['modules']:
+        # Move files locally; if different volume, this will copy
+        cmd = 'mv %s/module_%d/%s/* %s/%s'%(
+            node['data_dir'], module['id'], run_dir,
+            daq_config['head_node_data_dir'], run_dir
+        )
+        if verbose:
+            print(cmd)
+        ret = os.system(cmd)
+        if ret:
+            error_msg += 'command %s failed: %d'%(cmd, ret)
+    return error_msg
+
+# copy a run's files from a remote DAQ node, and verify them
+# against the node's manifest.
+# Files in trickled (already copied and verified during the run)
+# aren't checksummed again.
+# return (manifest, error msg); error msg is '' if successful
+#
+def collect_remote(daq_config, node, run_dir, verbose, trickled={}):
+    try:
+        manifest = file_xfer.get_node_manifest(run_dir, node, verbose, trickled)
+    except Exception as e:
+        return None, 'collect_remote(): %s'%e
+    error_msg = file_xfer.copy_run_from_node(run_dir, daq_config, node, manifest, verbose)
+    if not error_msg:
+        error_msg = file_xfer.verify_run_from_node(run_dir, daq_config, node, manifest, trickled)
+    if verbose and not error_msg:
+        print('copied and verified %d files from %s'%(len(manifest), node_key(node)))
+    return manifest, error_msg
+
+# collect a run's files from all DAQ nodes, concurrently,
+# and record the result in the run's manifest.
+# Nodes already collected (e.g. by an earlier, interrupted call) are skipped.
+#
 # return '' if data collection was successful, else error msg
 #
 def collect_data(daq_config, run_dir, verbose=False):
     my_ip = util.local_ip()
-    error_msg = ''
-    for node in daq_config['daq_nodes']:
-        for module in node['modules']:
-            module_id = module['id']
-            if node['ip_addr'] == my_ip:
-                # head node is also a DAQ node.
-                # Move files locally; if different volume, this will copy
-                cmd = 'mv %s/module_%d/%s/* %s/%s'%(
-                    node['data_dir'], module_id, run_dir,
-                    daq_config['head_node_data_dir'], run_dir
-                )
-                if verbose:
-                    print(cmd)
-                ret = os.system(cmd)
-                if ret:
-                    error_msg += 'command %s failed: %d'%(cmd, ret)
-            else:
-                error_msg += file_xfer.copy_dir_from_node(
-                    run_dir, daq_config, node, module_id, verbose
-                )
-    return error_msg
+    manifest = read_manifest(daq_config, run_dir)
+    nodes = [node for node in daq_config['daq_nodes'] if node['modules']]
+
+    def collect_node(node):
+        key = node_key(node)
+        if key in manifest and manifest[key]['verified']:
+            return ''
+        if node['ip_addr'] == my_ip:
+            # head node is also a DAQ node.
+            return collect_local(daq_config, node, run_dir, verbose)
+        trickled = manifest.get(key, {}).get('trickled', {})
+        files, error_msg = collect_remote(daq_config, node, run_dir, verbose, trickled)
+        if files is not None:
+            manifest[key] = {
+                'files': files, 'verified': error_msg == '', 'trickled': trickled
+            }
+        return error_msg
+
+    error_msgs = util.for_each_node(nodes, collect_node)
+    if os.path.isdir('%s/%s'%(daq_config['head_node_data_dir'], run_dir)):
+        write_manifest(daq_config, run_dir, manifest)
+    return ''.join(error_msgs)
 
 # remove stuff from DAQ nodes no longer needed after run
 # remote:
@@ -45,12 +115,15 @@ def collect_data(daq_config, run_dir, verbose=False):
 #    data/module_n/run
 # local
 #    data/module_n/run (should be empty dir)
+# Remote nodes with modules are cleaned up only if the run's
+# manifest shows that their files were copied and verified.
 # return error message or ''
 #
 def cleanup_daq(daq_config, run_dir, verbose=False):
     my_ip = util.local_ip()
-    error_msg = ''
-    for node in daq_config['daq_nodes']:
+    manifest = read_manifest(daq_config, run_dir)
+
+    def cleanup_node(node):
         if node['ip_addr'] == my_ip:
             cmd = 'rm -rf %s/module_*/%s'%(
                 node['data_dir'], run_dir
@@ -59,21 +132,22 @@ def cleanup_daq(daq_config, run_dir, verbose=False):
                 print(cmd)
             ret = os.system(cmd)
             if ret:
-                error_msg += 'cleanup_daq(): %s returned %d '%(cmd, ret)
-        else:
-            rcmd = 'rm -rf %s/module_*/%s; rm -rf %s/%s'%(
-                node['data_dir'], run_dir,
-                node['data_dir'], run_dir
-            )
-            cmd = 'ssh %s@%s "%s"'%(
-                node['username'], node['ip_addr'], rcmd
-            )
-            if verbose:
-                print(cmd)
-            ret = os.system(cmd)
-            if ret:
-                error_msg += 'cleanup_daq(): %s returned %d '%(cmd, ret)
-    return error_msg
+                return 'cleanup_daq(): %s returned %d '%(cmd, ret)
+            return ''
+        key = node_key(node)
+        if node['modules'] and not (key in manifest and manifest[key]['verified']):
+            return 'cleanup_daq(): files on %s not verified; not cleaning up '%key
+        rcmd = 'rm -rf %s/module_*/%s; rm -rf %s/%s'%(
+            node['data_dir'], run_dir,
+            node['data_dir'], run_dir
+        )
+        try:
+            util.run_on_node(node, rcmd, verbose=verbose)
+        except Exception as e:
+            return 'cleanup_daq(): %s '%e
+        return ''
+
+    return ''.join(util.for_each_node(daq_config['daq_nodes'], cleanup_node))
 
 if __name__ == "__main__":
     i = 1
@@ -100,4 +174,4 @@ if __name__ == "__main__":
         cleanup_daq(daq_config, run_dir, verbose)
     else:
         ret = collect_data(daq_config, run_dir, verbose)
-        print('success' if ret else 'failed')
+        print('failed: %s'%ret if ret else 'success')
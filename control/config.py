@@ -9,6 +9,8 @@ firmware_silver_bga = 'quabo_0207_28514055.bin'
 firmware_gold = 'quabo_GOLD_23BD5DA4.bin'
 
 import sys, os, subprocess, time, datetime, json, statistics
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import util, file_xfer, quabo_driver
 from panoseti_tftp import tftpw
 
@@ -56,38 +58,80 @@ def show_config(obs_config, quabo_uids):
     print("This node's IP addr: %s"%util.local_ip())
     config_file.show_daq_assignments(quabo_uids)
 
+REBOOT_CONCURRENCY = 16
+    # max number of quabos rebooting at once
+REBOOT_TIMEOUT = 120
+    # secs to wait for a quabo to answer pings after reboot
+
+def reboot_quabo(ip_addr):
+    x = tftpw(ip_addr)
+    x.reboot(verbose=False)
+
+# reboot quabos, and wait until they answer pings.
+# Returns a dict of IP addr: error message for quabos that failed
+#
 def do_reboot(modules, quabo_uids):
     # need to reboot quabos in order 0..3
-    # to parallelize:
-    # start reboot of quabo 0 in all modules
+    # so: start reboot of quabo 0 in all modules,
+    # REBOOT_CONCURRENCY at a time,
     # wait for ping of quabo 0 in all modules (means reboot is done)
     # ... same for quabo 1 etc.
     #
-    for i in range(4):
-        for module in modules:
-            if not util.is_quabo_alive(module, quabo_uids, i):
-                continue
-            ip_addr = config_file.quabo_ip_addr(module['ip_addr'], i)
-            print('rebooting quabo at %s'%ip_addr)
-            x = tftpw(ip_addr)
-            x.reboot()
-
-        # wait for pings
-        #
-        for module in modules:
-            if not util.is_quabo_alive(module, quabo_uids, i):
+    failed = {}
+    with ThreadPoolExecutor(max_workers=REBOOT_CONCURRENCY) as executor:
+        for i in range(4):
+            ip_addrs = [
+                config_file.quabo_ip_addr(module['ip_addr'], i)
+                for module in modules if util.is_quabo_alive(module, quabo_uids, i)
+            ]
+            if not ip_addrs:
                 continue
-            ip_addr = config_file.quabo_ip_addr(module['ip_addr'], i)
-            print('waiting for ping of %s'%ip_addr)
-            while True:
-                if util.ping(ip_addr):
-                    break
-                time.sleep(1)
-            print('pinged %s; reboot done'%ip_addr)
-
-    print('All quabos rebooted')
-
+            print('rebooting quabo %d in %d modules'%(i, len(ip_addrs)))
+            t0 = time.time()
+            futures = {
+                ip_addr: executor.submit(reboot_quabo, ip_addr) for ip_addr in ip_addrs
+            }
+            rebooted = []
+            for ip_addr, f in futures.items():
+                try:
+                    f.result()
+                    rebooted.append(ip_addr)
+                except Exception as e:
+                    failed[ip_addr] = 'reboot failed: %s'%e
+
+            # wait for pings
+            #
+            ready = util.wait_for_pings(rebooted, REBOOT_TIMEOUT)
+            for ip_addr in rebooted:
+                if ready[ip_addr] is None:
+                    failed[ip_addr] = 'no ping after %d secs'%REBOOT_TIMEOUT
+                else:
+                    print('pinged %s; reboot done in %.1f secs'%(
+                        ip_addr, ready[ip_addr] - t0
+                    ))
+
+    if failed:
+        for ip_addr, msg in failed.items():
+            print('%s: %s'%(ip_addr, msg))
+        print('%d quabos failed to reboot'%len(failed))
+    else:
+        print('All quabos rebooted')
+    return failed
+
+LOAD_CONCURRENCY = 16
+    # max number of quabos loading firmware at once
+
+def load_quabo(ip_addr, fw):
+    x = tftpw(ip_addr)
+    print('loading %s into %s'%(fw, ip_addr))
+    x.put_bin_file(fw, verify=True)
+
+# load silver firmware into quabos, several at once,
+# and check that the image in flash matches the file.
+# Returns a dict of IP addr: error message for quabos that failed
+#
 def do_loads(modules, quabo_uids, quabo_info):
+    loads = {}
     for module in modules:
         for i in range(4):
             if not util.is_quabo_alive(module, quabo_uids, i):
@@ -97,9 +141,25 @@ def do_loads(modules, quabo_uids, quabo_info):
                 fw = firmware_silver_qfp
             else:
                 fw = firmware_silver_bga
-            x = tftpw(ip_addr)
-            print('loading %s into %s'%(fw, ip_addr))
-            x.put_bin_file(fw)
+            loads[ip_addr] = fw
+    failed = {}
+    with ThreadPoolExecutor(max_workers=LOAD_CONCURRENCY) as executor:
+        futures = {
+            ip_addr: executor.submit(load_quabo, ip_addr, fw)
+            for ip_addr, fw in loads.items()
+        }
+        for ip_addr, f in futures.items():
+            try:
+                f.result()
+            except Exception as e:
+                failed[ip_addr] = 'load failed: %s'%e
+    if failed:
+        for ip_addr, msg in failed.items():
+            print('%s: %s'%(ip_addr, msg))
+        print('%d quabos failed to load firmware'%len(failed))
+    else:
+        print('Loaded firmware into %d quabos'%len(loads))
+    return failed
 
 def do_loadg(modules):
     print("not supported")
@@ -110,13 +170,16 @@ def do_ping(modules, verbose=False):
         "ping_true": [],
         "ping_false": []
     }
-    for module in modules:
-        for i in range(4):
-            ip_addr = config_file.quabo_ip_addr(module['ip_addr'], i)
-            if util.ping(ip_addr):
-                ping_record["ping_true"].append(ip_addr)
-            else:
-                ping_record["ping_false"].append(ip_addr)
+    ip_addrs = [
+        config_file.quabo_ip_addr(module['ip_addr'], i)
+        for module in modules for i in range(4)
+    ]
+    pinged = util.ping_all(ip_addrs)
+    for ip_addr in ip_addrs:
+        if ip_addr in pinged:
+            ping_record["ping_true"].append(ip_addr)
+        else:
+            ping_record["ping_false"].append(ip_addr)
     if verbose:
         for ip in ping_record["ping_true"]:
             print("pinged %s" % ip)
@@ -167,9 +230,28 @@ def do_hv_off(modules, quabo_uids):
             quabo.close()
             print('%s: set HV to zero'%ip_addr)
 
-# set the DAC1/DA2/GAIN* params for MAROC chips
+# detector_to_quabo() for all 64 pixels x 4 detectors, as index arrays
+# (x[k][j], y[k][j]) into a quabo's pixel_gain, for QFP and BGA quabos
 #
-def do_maroc_config(modules, quabo_uids, quabo_info, data_config, obs_config, daq_config, verbose=False):
+pixel_gain_index = {}
+
+def get_pixel_gain_index(is_qfp):
+    if is_qfp not in pixel_gain_index:
+        xy = np.array([
+            [pixel_coords.detector_to_quabo(k, j, is_qfp) for j in range(4)]
+            for k in range(64)
+        ])
+        pixel_gain_index[is_qfp] = (xy[:, :, 0], xy[:, :, 1])
+    return pixel_gain_index[is_qfp]
+
+def format_quad(v):
+    return '%d,%d,%d,%d'%tuple(v)
+
+# compute the MAROC params (DAC1, DAC2, GAIN*, D1_D2) of each quabo.
+# Returns a list of (IP addr, MAROC params, low-DAC2 MAROC params)
+# where the last is None unless PH mode is used
+#
+def compile_maroc_config(modules, quabo_uids, quabo_info, data_config, obs_config, verbose=False):
     gain = float(data_config['gain'])
     do_img = 'image' in data_config.keys()
     do_ph = 'pulse_height' in data_config.keys()
@@ -181,7 +263,36 @@ def do_maroc_config(modules, quabo_uids, quabo_info, data_config, obs_config, da
     if not do_img and not do_ph:
         raise Exception('data_config.json specifies no data products')
 
-    qc_dict = quabo_driver.parse_quabo_config_file('quabo_config.txt')
+    # try to find the detector overvoltage in obs_config.abs
+    # if we can't find it, we will use 3v by default.
+    try:
+        detovervol = obs_config['detector_overvoltage']
+    except:
+        detovervol = 3
+
+    # We have different calibration files for different modes: image alone and image/ph together
+    # so we have to specifiy the mode here.
+    # TODO: If it's PH alone, what calibration file should we use?
+    if do_img and not do_ph:
+        op_mode = 'img'
+    else:
+        op_mode = 'ph'
+
+    # set D1_D2 based on the two_pixel_trigger and three_pixel_trigger in data_config.json
+    do_two_pixel_trigger = False
+    do_three_pixel_trigger = False
+    if do_ph:
+        if 'two_pixel_trigger' in data_config['pulse_height']:
+            do_two_pixel_trigger = data_config['pulse_height']['two_pixel_trigger']
+        if 'three_pixel_trigger' in data_config['pulse_height']:
+            do_three_pixel_trigger = data_config['pulse_height']['three_pixel_trigger']
+
+    qc_dict_base = quabo_driver.parse_quabo_config_file('quabo_config.txt')
+    # if using 2/3 pixel trigger, D1_D2 should be set to 1,1,1,1
+    if do_two_pixel_trigger or do_three_pixel_trigger:
+        qc_dict_base['D1_D2'] = format_quad([1,1,1,1])
+
+    configs = []
     for module in modules:
         for i in range(4):
             uid = util.quabo_uid(module, quabo_uids, i)
@@ -189,113 +300,88 @@ def do_maroc_config(modules, quabo_uids, quabo_info, data_config, obs_config, da
             is_qfp = util.is_quabo_old_version(module, i, quabo_uids, quabo_info)
             qi = quabo_info[uid]
             serialno = qi['serialno'][3:]
-            # try to find the detector overvoltage in obs_config.abs
-            # if we can't find it, we will use 3v by default.
-            try:
-                detovervol = obs_config['detector_overvoltage']
-            except:
-                detovervol = 3
-            
-            # We have different calibration files for different modes: image alone and image/ph together
-            # so we have to specifiy the mode here.
-            # TODO: If it's PH alone, what calibration file should we use?
-            if do_img and not do_ph:
-                op_mode = 'img'
-            else:
-                op_mode = 'ph'
             quabo_calib = config_file.get_quabo_calib(serialno, detovervol, op_mode)
             ip_addr = config_file.quabo_ip_addr(module['ip_addr'], i)
+            qc_dict = dict(qc_dict_base)
 
             # compute DAC1[] and possibly DAC2 based on calibration data
-            dac1 = [0]*4
-            dac2 = [0]*4
-            for j in range(4):      # 4 detectors in a quabo
-                quad = quabo_calib['quadrants'][j]
-                a = quad['a']       # a and b are used for img mode
-                b = quad['b']
-                ah= quad['ah']      # ah and bh are used for ph mode
-                bh= quad['bh']
-                if do_img:
-                    dac1[j] = int(a*gain*pe_thresh1 + b)
-                if do_ph:
-                    dac2[j] = int(ah*gain*pe_thresh2 + bh)
+            # of the 4 detectors in a quabo.
+            # a and b are used for img mode, ah and bh for ph mode
+            quads = quabo_calib['quadrants']
+            a, b, ah, bh = (np.array([quad[p] for quad in quads]) for p in ['a', 'b', 'ah', 'bh'])
             if do_img:
-                qc_dict['DAC1'] = '%d,%d,%d,%d'%(dac1[0], dac1[1], dac1[2], dac1[3])
+                qc_dict['DAC1'] = format_quad(np.trunc(a*gain*pe_thresh1 + b))
                 if verbose:
-                    print('%s: DAC1 = %s'%(ip_addr, qc_dict['DAC1'])) 
+                    print('%s: DAC1 = %s'%(ip_addr, qc_dict['DAC1']))
             if do_ph:
-                qc_dict['DAC2'] = '%d,%d,%d,%d'%(dac2[0], dac2[1], dac2[2], dac2[3])
+                qc_dict['DAC2'] = format_quad(np.trunc(ah*gain*pe_thresh2 + bh))
                 if verbose:
                     print('%s: DAC2 = %s'%(ip_addr, qc_dict['DAC2']))
+
             # compute GAIN0[]..GAIN63[] based on calibration data
             # TODO: fix indexing
-            maroc_gain = [[0]*4 for i in range(64)]
-
-            for j in range(4):
-                for k in range(64):
-                    [x, y] = pixel_coords.detector_to_quabo(k, j, is_qfp)
-                    delta = quabo_calib['pixel_gain'][x][y]
-                    g = int(round(gain*(1+delta)))
-                    maroc_gain[k][j] = g
+            x, y = get_pixel_gain_index(is_qfp)
+            delta = np.array(quabo_calib['pixel_gain'])[x, y]
+            maroc_gain = np.rint(gain*(1+delta)).astype(int)
             for k in range(64):
                 tag = 'GAIN%d'%k
-                qc_dict[tag] = '%d,%d,%d,%d'%(
-                    maroc_gain[k][0], maroc_gain[k][1],
-                    maroc_gain[k][2], maroc_gain[k][3]
-                )
+                qc_dict[tag] = format_quad(maroc_gain[k])
                 if verbose:
                     print('%s: %s = %s'%(ip_addr, tag, qc_dict[tag]))
-            # set D1_D2 based on the two_pixel_trigger and three_pixel_trigger in data_config.json
-            do_two_pixel_trigger = False
-            do_three_pixel_trigger = False
-            if do_ph:
-                if 'two_pixel_trigger' in data_config['pulse_height']:
-                    do_two_pixel_trigger = data_config['pulse_height']['two_pixel_trigger']
-                if 'three_pixel_trigger' in data_config['pulse_height']:
-                    do_three_pixel_trigger = data_config['pulse_height']['three_pixel_trigger']
-            # if using 2/3 pixel trigger, D1_D2 should be set to 1,1,1,1
-            if do_two_pixel_trigger or do_three_pixel_trigger:
-                qc_dict['D1_D2'] = '%d,%d,%d,%d'%(1,1,1,1)
             if verbose:
                 print('%s: %s = %s'%(ip_addr, 'D1_D2', qc_dict['D1_D2']))
-            # send MAROC params to the quabo
-            quabo = quabo_driver.QUABO(ip_addr)
+
             # For ph mode, we seem to have a bug in firmware.
             # we need to set DAC2 to low, and make the quabos send out data first.
+            qc_dict_low = None
             if do_ph:
-                tmp = [0] * 4
+                qc_dict_low = dict(qc_dict)
                 # set the DAC2 value very low, 5.5 pe
-                for j in range(4):      # 4 detectors in a quabo
-                    quad = quabo_calib['quadrants'][j]
-                    ah = quad['ah']
-                    bh = quad['bh']
-                    tmp[j] = int(ah*gain*5.5 + bh)
-                qc_dict['DAC2'] = '%d,%d,%d,%d'%(tmp[0],tmp[1],tmp[2],tmp[3])
-                quabo.send_maroc_params(qc_dict)
-                # make the quabos send out some ph packets
-                daq_start = quabo_driver.DAQ_PARAMS(
-                        do_image=False,
-                        image_us=4999,
-                        image_8bit=False,
-                        do_ph=True,
-                        bl_subtract=True
-                    )
-                daq_stop = quabo_driver.DAQ_PARAMS(False, 0, False, False, False)
-                # This IP is not important, so I put a static IP here.
-                # It's just for generating a ph packet
-                daq_node_ip_addr = daq_config['head_node_ip_addr']
-                quabo.data_packet_destination(daq_node_ip_addr)
-                quabo.send_daq_params(daq_start)
-                time.sleep(1)
-                quabo.send_daq_params(daq_stop)
-                # set the DAC2 values back
-                qc_dict['DAC2'] = '%d,%d,%d,%d'%(dac2[0], dac2[1], dac2[2], dac2[3])
-            quabo.send_maroc_params(qc_dict)
-            quabo.close()
+                qc_dict_low['DAC2'] = format_quad(np.trunc(ah*gain*5.5 + bh))
+            configs.append((ip_addr, qc_dict, qc_dict_low))
+    return configs
 
-# set CHANMASK and GOEMASK for modules
+# send MAROC params to a quabo
 #
-def do_mask_config(modules, data_config, verbose=False):
+def send_maroc_config(quabo, qc_dict, qc_dict_low, daq_node_ip_addr):
+    if qc_dict_low:
+        quabo.send_maroc_params(qc_dict_low)
+        # make the quabos send out some ph packets
+        daq_start = quabo_driver.DAQ_PARAMS(
+                do_image=False,
+                image_us=4999,
+                image_8bit=False,
+                do_ph=True,
+                bl_subtract=True
+            )
+        daq_stop = quabo_driver.DAQ_PARAMS(False, 0, False, False, False)
+        quabo.data_packet_destination(daq_node_ip_addr)
+        quabo.send_daq_params(daq_start)
+        time.sleep(1)
+        quabo.send_daq_params(daq_stop)
+    quabo.send_maroc_params(qc_dict)
+
+# set the DAC1/DA2/GAIN* params for MAROC chips.
+# The params of all quabos are computed first, then sent to all quabos
+# concurrently (so the 1 sec PH-mode workaround overlaps across quabos)
+#
+def do_maroc_config(modules, quabo_uids, quabo_info, data_config, obs_config, daq_config, verbose=False):
+    configs = compile_maroc_config(
+        modules, quabo_uids, quabo_info, data_config, obs_config, verbose
+    )
+    # This IP is not important, so I put a static IP here.
+    # It's just for generating a ph packet
+    daq_node_ip_addr = daq_config['head_node_ip_addr']
+    qc_dicts = {ip_addr: (qc_dict, qc_dict_low) for ip_addr, qc_dict, qc_dict_low in configs}
+    quabo_driver.for_each_quabo(
+        list(qc_dicts.keys()),
+        lambda quabo: send_maroc_config(quabo, *qc_dicts[quabo.ip_addr], daq_node_ip_addr),
+        max_workers=len(qc_dicts)
+    )
+
+# compute the CHANMASK and GOEMASK params (the same for all quabos)
+#
+def compile_mask_config(data_config):
     qc_dict = quabo_driver.parse_quabo_config_file('quabo_config.txt')
     do_ph = 'pulse_height' in data_config.keys()
     qc_dict['GOEMASK'] = int(qc_dict['GOEMASK'], 16)
@@ -320,35 +406,51 @@ def do_mask_config(modules, data_config, verbose=False):
             if data_config['pulse_height']['two_pixel_trigger']:
                 qc_dict['CHANMASK_8'] = qc_dict['CHANMASK_8'] | 0xff
                 qc_dict['GOEMASK'] = qc_dict['GOEMASK'] & 0x2
+    return qc_dict
 
-    for module in modules:
-        for i in range(4):
-            ip_addr = config_file.quabo_ip_addr(module['ip_addr'], i)
-            for tag in ['CHANMASK_8', 'GOEMASK']:
-                if verbose:
-                    print('%s: %s = 0x%x'%(ip_addr, tag, qc_dict[tag]))
-            # send MASK params to the quabo
-            quabo = quabo_driver.QUABO(ip_addr)
-            quabo.send_trigger_mask(qc_dict)
-            quabo.send_goe_mask(qc_dict)
-            quabo.close()
+def send_mask_config(quabo, qc_dict):
+    quabo.send_trigger_mask(qc_dict)
+    quabo.send_goe_mask(qc_dict)
 
-# compute PH baselines on quabos and write to file
+# set CHANMASK and GOEMASK for modules, on all quabos concurrently
+#
+def do_mask_config(modules, data_config, verbose=False):
+    qc_dict = compile_mask_config(data_config)
+    ip_addrs = [
+        config_file.quabo_ip_addr(module['ip_addr'], i)
+        for module in modules for i in range(4)
+    ]
+    if verbose:
+        for ip_addr in ip_addrs:
+            for tag in ['CHANMASK_8', 'GOEMASK']:
+                print('%s: %s = 0x%x'%(ip_addr, tag, qc_dict[tag]))
+    # send MASK params to the quabos
+    quabo_driver.for_each_quabo(
+        ip_addrs, lambda quabo: send_mask_config(quabo, qc_dict),
+        max_workers=len(ip_addrs)
+    )
+
+# compute PH baselines on quabos and write to file.
+# Calibration runs on all quabos concurrently
 #
 def do_calibrate_ph(modules, quabo_uids):
-    quabos = []
+    uids = {}
     for module in modules:
         for i in range(4):
             uid = util.quabo_uid(module, quabo_uids, i)
             if uid == '': continue
             ip_addr = config_file.quabo_ip_addr(module['ip_addr'], i)
-            quabo = quabo_driver.QUABO(ip_addr)
-            coefs = quabo.calibrate_ph_baseline()
-            quabo.close()
-            q = {}
-            q['uid'] = uid
-            q['coefs'] = coefs
-            quabos.append(q)
+            uids[ip_addr] = uid
+    coefs = quabo_driver.for_each_quabo(
+        list(uids.keys()), lambda quabo: quabo.calibrate_ph_baseline(),
+        max_workers=len(uids)
+    )
+    quabos = []
+    for ip_addr, uid in uids.items():
+        q = {}
+        q['uid'] = uid
+        q['coefs'] = coefs[ip_addr]
+        quabos.append(q)
     x={}
     d = datetime.datetime.utcnow()
     x['date'] = d.isoformat()
@@ -360,6 +462,8 @@ def do_calibrate_ph(modules, quabo_uids):
 # show summary statistics for the PH baseline calibrations of each quabo
 def do_show_ph_baselines(quabo_uids):
     quabo_ph_baselines = config_file.get_quabo_ph_baselines()
+    # uid -> baselines; if a uid appears more than once, the last one is used
+    baselines_by_uid = {q['uid']: q for q in quabo_ph_baselines['quabos']}
     msg = f"Creation date: {quabo_ph_baselines['date']}\n"
     for dome in quabo_uids['domes']:
         for module in dome['modules']:
@@ -368,10 +472,7 @@ def do_show_ph_baselines(quabo_uids):
             for quabo_index in range(4):
                 quabo_num = config_file.get_boardloc(module_ip_addr, quabo_index)
                 quabo_uid = module['quabos'][quabo_index]['uid']
-                quabo_baselines = None
-                for q in quabo_ph_baselines['quabos']:
-                    if q['uid'] == quabo_uid:
-                        quabo_baselines = q
+                quabo_baselines = baselines_by_uid.get(quabo_uid)
                 if quabo_baselines is None:
                     msg += f'\tquabo {quabo_num}: found no ph baseline data\n'
                 else:
@@ -7,7 +7,7 @@
 # --hashpipe            copy hashpipe executable (hashpipe.so) to nodes
 # --get_data run_dir    copy data files in given run dir from daq nodes
 
-import sys, os
+import sys, os, io, tarfile, hashlib, subprocess, shlex
 import util
 from glob import glob
 sys.path.insert(0, '../util')
@@ -31,60 +31,147 @@ def copy_file_to_node(file, daq_config, node, run_dir='', verbose=False):
         ret = os.system(cmd)
         if ret: raise Exception('%s returned %d'%(cmd, ret))
 
-# Copy the contents of a module/run dir from a DAQ node
-# to the corresponding run dir on this (head) node.
-# scp doesn't let you do this directly,
-# so we copy the dir to a temp directory (data/IP_ADDR/run),
-# then move (rename) the files into the target dir
+# return the SHA-256 (hex) of a local file
 #
-# return error message, or '' on success
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            b = f.read(1<<20)
+            if not b: break
+            h.update(b)
+    return h.hexdigest()
+
+# the files of a run on a DAQ node, relative to its data dir:
+# hashpipe stdout, process snapshot, and the module/run dirs
 #
-def copy_dir_from_node(run_name, daq_config, node, module_id, verbose=False):
-    local_data_dir = daq_config['head_node_data_dir']
-    run_dir_path = '%s/%s'%(local_data_dir, run_name)
+def node_run_file_patterns(run_name, node):
+    patterns = [
+        '%s/%s*'%(run_name, util.hp_stdout_prefix),
+        '%s/%s*'%(run_name, util.pss_prefix),
+    ]
+    for module in node['modules']:
+        patterns.append('module_%d/%s/*'%(module['id'], run_name))
+    return patterns
 
-    if not os.path.isdir(run_dir_path):
-        return 'copy_dir_from_node(): no run dir %s'%run_dir_path
-        
-    # copy stdout from remote node to this node
-    cmd = 'rsync -P %s@%s:%s/%s/%s* %s'%(
-        node['username'], node['ip_addr'],
-        node['data_dir'], run_name, util.hp_stdout_prefix,
-        run_dir_path
+# return a dict of path (relative to the node's data dir): size
+# of a run's files on a DAQ node
+#
+def list_node_run_files(run_name, node, verbose=False):
+    rcmd = 'cd %s && for f in %s; do if [ -f "$f" ]; then stat -c "%%s %%n" "$f"; fi; done'%(
+        node['data_dir'], ' '.join(node_run_file_patterns(run_name, node))
     )
-    if verbose:
-        print(cmd)
-    try:
-        ret = os.system(cmd)
-    except:
-        return 'copy_dir_from_node(): %s returned %d'%(cmd, ret)
-    
-    # copy process snapshot from remote node to this node
-    cmd = 'rsync -P %s@%s:%s/%s/%s* %s'%(
-        node['username'], node['ip_addr'],
-        node['data_dir'], run_name, util.pss_prefix,
-        run_dir_path
+    out = util.run_on_node(node, rcmd, verbose=verbose, capture=True)
+    sizes = {}
+    for line in out.decode().splitlines():
+        size, path = line.split(' ', 1)
+        sizes[path] = int(size)
+    return sizes
+
+# return a dict of path: SHA-256 of the given files on a DAQ node
+# (paths relative to its data dir).
+# The checksums are computed at low CPU priority
+#
+def hash_node_files(node, paths, verbose=False):
+    if not paths:
+        return {}
+    rcmd = 'cd %s && nice -n 19 sha256sum -- %s'%(
+        node['data_dir'], ' '.join(shlex.quote(p) for p in paths)
     )
-    if verbose:
-        print(cmd)
-    try:
-        ret = os.system(cmd)
-    except:
-        return 'copy_dir_from_node(): %s returned %d'%(cmd, ret)
-    # copy PFF files from remote node to this node
-    cmd = 'rsync -P %s@%s:%s/module_%d/%s/* %s'%(
-        node['username'], node['ip_addr'],
-        node['data_dir'], module_id, run_name,
-        run_dir_path
+    out = util.run_on_node(node, rcmd, verbose=verbose, capture=True)
+    hashes = {}
+    for line in out.decode().splitlines():
+        sha256, path = line.split(None, 1)
+        hashes[path] = sha256
+    return hashes
+
+# Get the manifest of a run's files on a DAQ node:
+# a dict of path (relative to the node's data dir): {'size', 'sha256'}.
+# Files in known (a manifest of files already checked) with
+# the same size aren't checksummed again
+#
+def get_node_manifest(run_name, node, verbose=False, known={}):
+    sizes = list_node_run_files(run_name, node, verbose)
+    hashes = hash_node_files(
+        node,
+        [p for p, size in sizes.items() if p not in known or known[p]['size'] != size],
+        verbose
     )
+    manifest = {}
+    for path, size in sizes.items():
+        if path in hashes:
+            manifest[path] = {'size': size, 'sha256': hashes[path]}
+        else:
+            manifest[path] = known[path]
+    return manifest
+
+# Copy the files of a run from a DAQ node into the run dir on
+# this (head) node, as listed in the node's manifest.
+# This is one rsync covering all the node's modules;
+# the files are put directly in the run dir (not in subdirs).
+# Files already copied are skipped, and partial copies are resumed.
+# If bwlimit is given, limit bandwidth to that many KB/sec.
+#
+# return error message, or '' on success
+#
+def copy_run_from_node(run_name, daq_config, node, manifest, verbose=False, bwlimit=0):
+    run_dir_path = '%s/%s'%(daq_config['head_node_data_dir'], run_name)
+    if not os.path.isdir(run_dir_path):
+        return 'copy_run_from_node(): no run dir %s'%run_dir_path
+    if not manifest:
+        return ''
+    cmd = [
+        'rsync', '-t', '--partial-dir=.rsync-partial',
+        '--no-relative', '--files-from=-', '-e', util.ssh_cmd_str(),
+        '%s@%s:%s/'%(node['username'], node['ip_addr'], node['data_dir']),
+        run_dir_path
+    ]
+    if bwlimit:
+        cmd.insert(1, '--bwlimit=%d'%bwlimit)
     if verbose:
-        print(cmd)
-    try:
-        ret = os.system(cmd)
-    except:
-        return 'copy_dir_from_node(): %s returned %d'%(cmd, ret)
+        print(' '.join(cmd))
+    ret = subprocess.run(cmd, input='\n'.join(manifest.keys()).encode()).returncode
+    if ret:
+        return 'copy_run_from_node(): %s returned %d'%(' '.join(cmd), ret)
     return ''
 
+# Check a file copied from a DAQ node against its manifest entry f.
+# A file with the wrong size or checksum is removed,
+# so that it's copied again next time.
+# If checksum is False, only check the size.
+#
+# return error message, or '' if the file is OK
+#
+def verify_file_from_node(run_name, daq_config, node, path, f, checksum=True):
+    run_dir_path = '%s/%s'%(daq_config['head_node_data_dir'], run_name)
+    local_path = '%s/%s'%(run_dir_path, os.path.basename(path))
+    if not os.path.exists(local_path):
+        return '%s:%s missing; '%(node['ip_addr'], path)
+    if os.path.getsize(local_path) != f['size']:
+        msg = '%s:%s has size %d, not %d; '%(
+            node['ip_addr'], path, os.path.getsize(local_path), f['size']
+        )
+        os.remove(local_path)
+        return msg
+    if checksum and sha256_file(local_path) != f['sha256']:
+        os.remove(local_path)
+        return '%s:%s has wrong checksum; '%(node['ip_addr'], path)
+    return ''
+
+# Check the files copied from a DAQ node against its manifest.
+# Files in verified (a manifest of files already checked) with
+# the same size and checksum aren't checksummed again.
+#
+# return error message, or '' if all files are OK
+#
+def verify_run_from_node(run_name, daq_config, node, manifest, verified={}):
+    error_msg = ''
+    for path, f in manifest.items():
+        error_msg += verify_file_from_node(
+            run_name, daq_config, node, path, f, verified.get(path) != f
+        )
+    return error_msg
+
 # create a directory on DAQ nodes
 #
 def make_remote_dirs(daq_config, dirname):
@@ -96,12 +183,32 @@ def make_remote_dirs(daq_config, dirname):
         ret = os.system(cmd)
         if ret: raise Exception('%s returned %d'%(cmd, ret))
 
-# copy config files to run dirs on DAQ nodes
+# return a tar archive (as bytes) of the config files
 #
-def copy_config_files(daq_config, run_dir, verbose=False):
-    for node in daq_config['daq_nodes']:
+def config_files_archive():
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w') as tar:
         for f in config_file.config_file_names:
-            copy_file_to_node(f, daq_config, node, run_dir, verbose)
+            for file in glob(f):
+                tar.add(file)
+    return buf.getvalue()
+
+# the shell command that unpacks a config files archive on a DAQ node
+#
+def unpack_config_files_cmd(node, run_dir):
+    return 'cd %s/%s && tar xf -'%(node['data_dir'], run_dir)
+
+# copy config files to run dirs on DAQ nodes:
+# one archive, sent to all nodes concurrently
+#
+def copy_config_files(daq_config, run_dir, verbose=False):
+    archive = config_files_archive()
+    util.for_each_node(
+        daq_config['daq_nodes'],
+        lambda node: util.run_on_node(
+            node, unpack_config_files_cmd(node, run_dir), archive, verbose
+        )
+    )
 
 # copy hashpipe binary and scripts to data dirs on DAQ nodes
 #
@@ -113,7 +220,7 @@ def copy_daq_files(daq_config):
         copy_file_to_node('status_daq.py', daq_config, node)
         copy_file_to_node('util.py', daq_config, node)
         copy_file_to_node('../util/pff.py', daq_config, node)
-        copy_file_to_node('video_daq.py', daq_config, node)
+        copy_file_to_node('live_daq.py', daq_config, node)
 
 if __name__ == "__main__":
 
@@ -0,0 +1,176 @@
+##############################################################
+# Decoder for quabo housekeeping (HK) packets. The fixed 64-byte
+# packet layout is compiled once into a NumPy structured dtype,
+# and the HKconvert conversion for each field is resolved once
+# when the decoder is created. A batch of packets is then
+# decoded with vectorised array expressions. Running this
+# script runs the unit tests for the decoder.
+##############################################################
+import unittest
+
+import numpy as np
+
+from panosetiSIconvert import HKconvert
+
+HK_PACKET_SIZE = 64
+HK_PACKET_TYPE = 0x20
+HK_STARTUP_FLAG = 0xaa
+
+# Packet layout: 2 header bytes followed by 31 little-endian 16-bit words.
+HK_DTYPE = np.dtype([
+    ('PACKET_TYPE', 'u1'),
+    ('STARTUP', 'u1'),
+    ('BOARDLOC', '<u2'),
+    ('HVMON0', '<u2'), ('HVMON1', '<u2'), ('HVMON2', '<u2'), ('HVMON3', '<u2'),         # (0 to -80V)
+    ('HVIMON0', '<u2'), ('HVIMON1', '<u2'), ('HVIMON2', '<u2'), ('HVIMON3', '<u2'),     # ((65535-HVIMON) * 38.1nA)
+    ('RAWHVMON', '<u2'),        # (0 to -80V)
+    ('V12MON', '<u2'),          # (19.07uV/LSB) (1.2V supply)
+    ('V18MON', '<u2'),          # (38.14uV/LSB) (1.8V supply)
+    ('V33MON', '<u2'),          # (76.20uV/LSB) (3.3V supply)
+    ('V37MON', '<u2'),          # (76.20uV/LSB) (3.7V supply)
+    ('I10MON', '<u2'),          # (182uA/LSB) (1.0V supply)
+    ('I18MON', '<u2'),          # (37.8uA/LSB) (1.8V supply)
+    ('I33MON', '<u2'),          # (37.8uA/LSB) (3.3V supply)
+    ('TEMP1', '<i2'),           # (0.25*N)
+    ('TEMP2', '<u2'),           # (N/130.04-273.15)
+    ('VCCINT', '<u2'),          # (N*3/65536)
+    ('VCCAUX', '<u2'),          # (N*3/65536)
+    ('UID0', '<u2'), ('UID1', '<u2'), ('UID2', '<u2'), ('UID3', '<u2'),
+    ('STATUS', '<u2'),          # SHUTTER, LIGHT_SENSOR STATUS, and PCBREV_N
+    ('UNUSED', '<u2'),
+    ('FWTIME0', '<u2'), ('FWTIME1', '<u2'),
+    ('FWVER0', '<u2'), ('FWVER1', '<u2'),
+])
+assert HK_DTYPE.itemsize == HK_PACKET_SIZE
+
+# Fields converted with HKconvert, in the order they're written to Redis.
+CONVERTED_FIELDS = [
+    'HVMON0', 'HVMON1', 'HVMON2', 'HVMON3',
+    'HVIMON0', 'HVIMON1', 'HVIMON2', 'HVIMON3',
+    'RAWHVMON',
+    'V12MON', 'V18MON', 'V33MON', 'V37MON',
+    'I10MON', 'I18MON', 'I33MON',
+    'TEMP1', 'TEMP2',
+    'VCCINT', 'VCCAUX'
+]
+# RAWHVMON is negated before conversion.
+NEGATED_FIELDS = ['RAWHVMON']
+
+
+class HKdecoder():
+    def __init__(self, hk_converter=None):
+        if hk_converter is None:
+            hk_converter = HKconvert()
+        self.hk_converter = hk_converter
+        # Resolve the conversion function for each field once.
+        self.converters = {
+            field: hk_converter.getConverter(field) for field in CONVERTED_FIELDS
+        }
+
+    # Return a structured array with one element per valid HK packet.
+    # Packets with the wrong size or type are dropped.
+    #
+    def parsePackets(self, packets):
+        valid = [p for p in packets if len(p) == HK_PACKET_SIZE and p[0] == HK_PACKET_TYPE]
+        return np.frombuffer(b''.join(valid), dtype=HK_DTYPE)
+
+    # Return a dict mapping each field to an array of values
+    # in physical units, one per element of parsed.
+    #
+    def convertFields(self, parsed):
+        fields = {}
+        for field, converter in self.converters.items():
+            values = parsed[field].astype(np.float64)
+            if field in NEGATED_FIELDS:
+                values = -values
+            fields[field] = converter(values)
+        return fields
+
+    # Decode a batch of HK packets.
+    # Returns a list of (board name, Redis record) pairs, one per valid packet.
+    #
+    def decodePackets(self, packets, computer_utc):
+        parsed = self.parsePackets(packets)
+        fields = {k: v.tolist() for k, v in self.convertFields(parsed).items()}
+        records = []
+        for i, p in enumerate(parsed.tolist()):
+            p = dict(zip(HK_DTYPE.names, p))
+            status = p['STATUS']
+            record = {
+                'Computer_UTC': computer_utc,
+                'BOARDLOC': p['BOARDLOC'],
+            }
+            for field in CONVERTED_FIELDS:
+                record[field] = fields[field][i]
+            record.update({
+                'UID': '0x{0:04x}{1:04x}{2:04x}{3:04x}'.format(p['UID3'], p['UID2'], p['UID1'], p['UID0']),
+
+                'SHUTTER_STATUS': status & 0x01,
+                'LIGHT_SENSOR_STATUS': (status & 0x02) >> 1,
+
+                # PCBrev_n represents the quabo version. If 0, the quabo is BGA version; if 1, the qubao is QFP version
+                # Bit 0 in the byte with offset 53.
+                'PCBREV_N': ((status & 0xFF00) >> 8) & 0x01,
+
+                'FWTIME': '0x{0:04x}{1:04x}'.format(p['FWTIME1'], p['FWTIME0']),
+                'FWVER': bytes.fromhex('{0:04x}{1:04x}'.format(p['FWVER1'], p['FWVER0'])).decode("ASCII"),
+
+                'StartUp': 1 if p['STARTUP'] == HK_STARTUP_FLAG else 0,
+                'AGG_STATUS_MSG': "",
+                'AGG_STATUS_LEVEL': 0
+            })
+            records.append(("QUABO_" + str(p['BOARDLOC']), record))
+        return records
+
+
+# Build an HK packet with the given raw 16-bit field values; other fields are 0.
+#
+def makePacket(**raw_values):
+    packet = np.zeros(1, dtype=HK_DTYPE)
+    packet['PACKET_TYPE'] = HK_PACKET_TYPE
+    for field, value in raw_values.items():
+        packet[field] = value
+    return packet.tobytes()
+
+
+class TestHKDecoder(unittest.TestCase):
+    hk_converter = HKconvert()
+    hk_decoder = HKdecoder(hk_converter)
+
+    def decodeOne(self, **raw_values):
+        records = self.hk_decoder.decodePackets([makePacket(**raw_values)], 0)
+        self.assertEqual(1, len(records))
+        return records[0][1]
+
+    def test_matches_HKconvert(self):
+        for raw in [0x0000, 0x0001, 0x7fff, 0xffff]:
+            record = self.decodeOne(**{field: raw for field in CONVERTED_FIELDS if field != 'TEMP1'})
+            for field in CONVERTED_FIELDS:
+                if field == 'TEMP1':
+                    continue
+                value = -raw if field in NEGATED_FIELDS else raw
+                self.assertAlmostEqual(self.hk_converter.convertValue(field, value), record[field])
+
+    def test_HVMON_conversion(self):
+        self.assertEqual(0, self.decodeOne(HVMON0=0x0000)['HVMON0'])
+        self.assertEqual(-0.00122, self.decodeOne(HVMON1=0x0001)['HVMON1'])
+        self.assertAlmostEqual(-80, self.decodeOne(HVMON2=0xffff)['HVMON2'], places=1)
+
+    def test_signed_TEMP1(self):
+        self.assertEqual(self.hk_converter.convertValue('TEMP1', -4), self.decodeOne(TEMP1=-4)['TEMP1'])
+
+    def test_board_fields(self):
+        record = self.decodeOne(BOARDLOC=0x0102, UID0=0x4444, UID3=0x1111, STATUS=0x0103)
+        self.assertEqual(0x0102, record['BOARDLOC'])
+        self.assertEqual('0x1111000000004444', record['UID'])
+        self.assertEqual(1, record['SHUTTER_STATUS'])
+        self.assertEqual(1, record['PCBREV_N'])
+
+    def test_bad_packets_dropped(self):
+        good = makePacket(BOARDLOC=1)
+        bad_type = b'\x21' + good[1:]
+        self.assertEqual(1, len(self.hk_decoder.decodePackets([good, bad_type, good[:10]], 0)))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
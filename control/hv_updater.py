@@ -12,6 +12,7 @@ for more info about the detector constants used in this script.
 """
 
 import time, sys
+import numpy as np
 import redis
 import redis_utils
 import quabo_driver
@@ -23,8 +24,18 @@ import config_file
 # HV offset
 HV_OFFSET = 1.073
 
+# Volts per unit of the HV setting sent to the quabo.
+HV_LSB = 0.0011453
+
+# Change in detector HV per degree Celsius (from GitHub Issue 47).
+HV_TEMP_COEFF = 0.054
+
 # Seconds between updates.
-UPDATE_INTERVAL = 5
+UPDATE_INTERVAL = 1
+
+# Seconds after which HV values are resent even if they haven't changed
+# (e.g. in case a quabo was power-cycled).
+RESEND_INTERVAL = 60
 
 # Min & max detector operating temperatures (degrees Celsius).
 MIN_TEMP = -20.0
@@ -40,146 +51,161 @@ quabo_uids = config_file.get_quabo_uids()
 # Set of quabos whose detectors have been turned off by this script.
 quabos_off = set()
 
-def is_acceptable_temperature(temp: float):
-    """Returns True only if the provided temperature is between
-    MIN_TEMP and MAX_TEMP."""
-    return MIN_TEMP <= temp <= MAX_TEMP
+# Set of quabos whose temperature was missing from Redis in the last update.
+quabos_untracked = set()
 
 
-def get_adjusted_detector_hv(det_serial_num: str, temp: float) -> float:
-    """Given a detector serial number and a temperature in degrees Celsius,
-     returns the desired adjusted high-voltage value."""
+def is_acceptable_temperature(temp):
+    """Returns True only where the provided temperature is between
+    MIN_TEMP and MAX_TEMP. temp may be an array."""
+    return (MIN_TEMP <= temp) & (temp <= MAX_TEMP)
+
+
+def get_nominal_detector_hv(det_serial_num: str) -> float:
+    """Given a detector serial number, returns its nominal high-voltage value."""
     try:
-        nominal_hv = detector_info[str(det_serial_num)]
+        return detector_info[str(det_serial_num)]
     except KeyError as kerr:
         msg = "hv_updater: Failed to get the nominal HV for the detector with serial number: '{0}'."
         msg += "detector_info.json might be missing an entry for this detector. "
         msg += "Error msg: {1}"
         util.write_log(msg.format(det_serial_num, kerr))
         raise
-    else:
-        # Formula from GitHub Issue 47.
-        adjusted_voltage = nominal_hv + (temp - 25) * 0.054
-        return adjusted_voltage
-
-
-def update_quabo(quabo_obj: quabo_driver.QUABO,
-                 det_serial_nums: list,
-                 temp: float):
-    """Helper method for the function update_all_quabos. Updates each
-     detector in the quabo represented by quabo_obj."""
-    adjusted_hv_values = [0] * 4
-    try:
-        for detector_index in range(4):
-            det_serial_num = det_serial_nums[detector_index]
-            adjusted_hv = get_adjusted_detector_hv(det_serial_num, temp)
-            # Save int encoding
-            adjusted_hv_values[detector_index] = int((adjusted_hv + HV_OFFSET) / 0.0011453)
-    except KeyError as kerr:
-        msg = "A detector in the quabo with IP {0} could not be found in the configuration files. "
-        msg += "Error message: {1}"
-        util.write_log(msg.format(quabo_obj.ip_addr, kerr))
-        raise
-    else:
-        quabo_obj.hv_set(adjusted_hv_values)
 
 
-def get_redis_temp(r: redis.Redis, rkey: str) -> float:
-    """Given a Quabo's redis key, rkey, returns the field value of TEMP1 in Redis."""
+def get_adjusted_detector_hv(nominal_hv, temp):
+    """Given nominal high-voltage values and temperatures in degrees Celsius,
+     returns the desired adjusted high-voltage values."""
+    # Formula from GitHub Issue 47.
+    return nominal_hv + (temp - 25) * HV_TEMP_COEFF
+
+
+class QuaboChannels:
+    """Long-lived command channels to every quabo in the observatory,
+    sharing one send-only socket, with the nominal HV of each detector.
+    hv_set() doesn't read replies, so the socket isn't bound to the command port,
+    which other scripts can use while hv_updater is running."""
+    def __init__(self):
+        self.sock = quabo_driver.send_socket()
+        self.rkeys = []
+        self.quabos = []
+        nominal_hv = []
+        for dome in quabo_uids['domes']:
+            for module in dome['modules']:
+                module_ip_addr = module['ip_addr']
+                for quabo_index in range(4):
+                    uid = module['quabos'][quabo_index]['uid']
+                    if uid == '':
+                        continue
+                    try:
+                        # Get the list of detector serial numbers for this quabo.
+                        q_info = quabo_info[uid]
+                        nominal_hv.append([
+                            get_nominal_detector_hv(s) for s in q_info['detector_serialno']
+                        ])
+                    except KeyError as kerr:
+                        msg = "hv_updater: Quabo {0} with base IP {1} may be missing from a config file. "
+                        msg += "Error msg: {2}"
+                        util.write_log(msg.format(quabo_index, module_ip_addr, kerr))
+                        raise
+                    self.rkeys.append("QUABO_{0}".format(config_file.get_boardloc(module_ip_addr, quabo_index)))
+                    q_ip_addr = config_file.quabo_ip_addr(module_ip_addr, quabo_index)
+                    self.quabos.append(quabo_driver.QUABO(q_ip_addr, sock=self.sock))
+        self.nominal_hv = np.array(nominal_hv, dtype=np.float64).reshape(-1, 4)
+        # Last HV values sent to each quabo, and when.
+        self.sent_hv = [None] * len(self.quabos)
+        self.sent_time = np.zeros(len(self.quabos))
+
+    def close(self):
+        self.sock.close()
+
+    def send_hv(self, i, values):
+        """Sends HV values to quabo i. Returns True if successful."""
+        try:
+            self.quabos[i].hv_set(values)
+        except OSError as oserr:
+            msg = "hv_updater: Failed to send HV values to the quabo with IP {0}. "
+            msg += "Error msg: {1}"
+            util.write_log(msg.format(self.quabos[i].ip_addr, oserr))
+            return False
+        self.sent_hv[i] = values
+        self.sent_time[i] = time.time()
+        return True
+
+
+def get_redis_temps(r: redis.Redis, rkeys) -> np.ndarray:
+    """Reads TEMP1 of each quabo in rkeys with one Redis pipeline.
+    Returns an array of temperatures; temperatures missing from Redis are NaN."""
+    pipe = r.pipeline(transaction=False)
+    for rkey in rkeys:
+        pipe.hget(rkey, 'TEMP1')
     try:
-        temp = float(r.hget(rkey, 'TEMP1'))
-        return temp
+        values = pipe.execute()
     except redis.RedisError as err:
         msg = "hv_updater: A Redis error occurred. "
         msg += "Error msg: {0}"
         util.write_log(msg.format(err))
         raise
-    except TypeError as terr:
-        msg = "hv_updater: Failed to update '{0}'. "
-        msg += "Temperature HK data may be missing. "
-        msg += "Error msg: {1}"
-        util.write_log(msg.format(rkey, terr))
-        raise
-
-
-def update_all_quabos(r: redis.Redis):
-    """Iterates through each quabo in the observatory and updates
-    its detectors' high-voltage values, provided its temperature is
-    not too extreme."""
-    for dome in quabo_uids['domes']:
-        for module in dome['modules']:
-            module_ip_addr = module['ip_addr']
-            for quabo_index in range(4):
-                quabo_obj = None
-                try:
-                    # Get this Quabo's redis key.
-                    rkey = "QUABO_{0}".format(config_file.get_boardloc(module_ip_addr, quabo_index))
-                    if rkey in quabos_off:
-                        continue
-                    uid = module['quabos'][quabo_index]['uid']
-                    if uid == '':
-                        continue
-                    # Get this Quabo's temp, if it exists.
-                    if rkey.encode('utf-8') not in r.keys():
-                        raise Warning("%s is not tracked in Redis." % rkey)
-                    else:
-                        # Get the temperature data for this quabo.
-                        temp = get_redis_temp(r, rkey)
-                    # Get quabo object
-                    q_ip_addr = config_file.quabo_ip_addr(module_ip_addr, quabo_index)
-                    quabo_obj = quabo_driver.QUABO(q_ip_addr)
-                    # Get the list of detector serial numbers for this quabo.
-                    q_info = quabo_info[uid]
-                    detector_serial_nums = [s for s in q_info['detector_serialno']]
-                except Warning as werr:
-                    msg = "hv_updater: Failed to update quabo at index {0} with base IP {1}. "
-                    msg += "Error msg: {2} \n"
-                    util.write_log(msg.format(quabo_index, module_ip_addr, werr))
-                    continue
-                except redis.RedisError as rerr:
-                    msg = "hv_updater: A Redis error occurred. "
-                    msg += "Error msg: {0}"
-                    util.write_log(msg.format(rerr))
-                    raise
-                except KeyError as kerr:
-                    msg = "hv_updater: Quabo {0} with base IP {1} may be missing from a config file. "
-                    msg += "Error msg: {2}"
-                    util.write_log(msg.format(quabo_index, module_ip_addr, kerr))
-                    raise
-                except OSError as oserr:
-                    continue
-                else:
-                    # Checks whether the quabo temperature is acceptable.
-                    # See https://github.com/panoseti/panoseti/issues/58.
-                    if is_acceptable_temperature(temp):
-                        update_quabo(quabo_obj, detector_serial_nums, temp)
-                    else:
-                        msg = "hv_updater: The temperature of quabo {0} with base IP {1} is {2} C, "
-                        msg += "which exceeds the maximum operating temperatures. \n"
-                        msg += "Attempting to power down the detectors on this quabo..."
-                        util.write_log(msg.format(quabo_index, module_ip_addr, temp))
-                        try:
-                            quabo_obj.hv_set([0] * 4)
-                            quabos_off.add(rkey)
-                            util.write_log("Successfully powered down.")
-                        except Exception as err:
-                            msg = "*** hv_updater: Failed to power down detectors. "
-                            msg += "Error msg: {0}"
-                            util.write_log(msg.format(err))
-                            continue
-                # TODO: Determine when (or if) we should turn detectors back on after a temperature-related power down.
-                finally:
-                    if quabo_obj is not None:
-                        quabo_obj.close()
+    temps = np.full(len(rkeys), np.nan)
+    for i, val in enumerate(values):
+        try:
+            temps[i] = float(val)
+        except (TypeError, ValueError):
+            continue
+    return temps
+
+
+def update_all_quabos(r: redis.Redis, channels: QuaboChannels):
+    """Updates the detectors' high-voltage values of each quabo in the
+    observatory, provided its temperature is not too extreme.
+    HV values are only sent to quabos where they've changed."""
+    temps = get_redis_temps(r, channels.rkeys)
+    adjusted_hv = get_adjusted_detector_hv(channels.nominal_hv, temps[:, np.newaxis])
+    # Save int encoding
+    hv_values = np.nan_to_num((adjusted_hv + HV_OFFSET) / HV_LSB).astype(int).tolist()
+    temp_ok = is_acceptable_temperature(temps)
+    now = time.time()
+    for i, rkey in enumerate(channels.rkeys):
+        if rkey in quabos_off:
+            continue
+        temp = temps[i]
+        if np.isnan(temp):
+            if rkey not in quabos_untracked:
+                msg = "hv_updater: Failed to update '{0}'. "
+                msg += "Temperature HK data may be missing."
+                util.write_log(msg.format(rkey))
+                quabos_untracked.add(rkey)
+            continue
+        quabos_untracked.discard(rkey)
+        # Checks whether the quabo temperature is acceptable.
+        # See https://github.com/panoseti/panoseti/issues/58.
+        if temp_ok[i]:
+            if hv_values[i] != channels.sent_hv[i] or now - channels.sent_time[i] > RESEND_INTERVAL:
+                channels.send_hv(i, hv_values[i])
+        else:
+            msg = "hv_updater: The temperature of quabo {0} with IP {1} is {2} C, "
+            msg += "which exceeds the maximum operating temperatures. \n"
+            msg += "Attempting to power down the detectors on this quabo..."
+            util.write_log(msg.format(rkey, channels.quabos[i].ip_addr, temp))
+            if channels.send_hv(i, [0] * 4):
+                quabos_off.add(rkey)
+                util.write_log("Successfully powered down.")
+            else:
+                util.write_log("*** hv_updater: Failed to power down detectors.")
+        # TODO: Determine when (or if) we should turn detectors back on after a temperature-related power down.
 
 
 def main():
     """Makes a call to update_all_quabos every UPDATE_INTERVAL seconds."""
     r = redis_utils.redis_init()
+    channels = QuaboChannels()
     print("hv_updater: Running...")
-    while True:
-        update_all_quabos(r)
-        time.sleep(UPDATE_INTERVAL)
+    try:
+        while True:
+            update_all_quabos(r, channels)
+            time.sleep(UPDATE_INTERVAL)
+    finally:
+        channels.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,123 @@
+##############################################################
+# Batched writer for InfluxDB. Points queued by the caller are
+# gathered into a single write_points() call per flush, done by
+# a background thread. If InfluxDB is slow or restarting, the
+# batch is spooled to a bounded on-disk queue of JSON files,
+# which is flushed (oldest first) once InfluxDB is back.
+##############################################################
+import os
+import json
+import time
+import queue
+import threading
+
+import util
+
+SPOOL_DIR = 'influx_spool'
+    # directory of batches not yet written to InfluxDB
+MAX_SPOOL_FILES = 10000
+    # oldest spooled batches are dropped beyond this
+MAX_BATCH_POINTS = 5000
+    # max number of points per write_points() call
+BATCH_WINDOW = 0.1
+    # seconds to wait for more points after the first one of a batch
+RETRY_INTERVAL = 5
+    # seconds between attempts to flush the spool
+
+
+class InfluxWriter:
+    def __init__(self, client, spool_dir=SPOOL_DIR, max_spool_files=MAX_SPOOL_FILES,
+                 max_batch_points=MAX_BATCH_POINTS, retry_interval=RETRY_INTERVAL,
+                 batch_window=BATCH_WINDOW):
+        self.client = client
+        self.spool_dir = spool_dir
+        self.max_spool_files = max_spool_files
+        self.max_batch_points = max_batch_points
+        self.retry_interval = retry_interval
+        self.batch_window = batch_window
+        self.queue = queue.Queue()
+        self.last_retry = 0
+        os.makedirs(spool_dir, exist_ok=True)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # queue a list of points for writing; doesn't block
+    #
+    def write(self, points):
+        if points:
+            self.queue.put(points)
+
+    # wait until all queued points have been written or spooled
+    #
+    def flush(self):
+        self.queue.join()
+
+    def run(self):
+        while True:
+            batch, nitems = self.get_batch()
+            if self.spool_files() and time.time() - self.last_retry > self.retry_interval:
+                self.flush_spool()
+            if batch:
+                if self.spool_files() or not self.write_points(batch):
+                    # keep points in order: don't write around spooled batches
+                    self.spool(batch)
+            for i in range(nitems):
+                self.queue.task_done()
+
+    # gather the points queued within batch_window of the first one
+    # (up to max_batch_points) into one batch
+    #
+    def get_batch(self):
+        try:
+            batch = list(self.queue.get(timeout=self.retry_interval))
+        except queue.Empty:
+            return [], 0
+        nitems = 1
+        deadline = time.time() + self.batch_window
+        while len(batch) < self.max_batch_points:
+            try:
+                batch.extend(self.queue.get(timeout=max(deadline - time.time(), 0)))
+            except queue.Empty:
+                break
+            nitems += 1
+        return batch, nitems
+
+    def write_points(self, points):
+        try:
+            self.client.write_points(points)
+            return True
+        except Exception as e:
+            util.write_log('influx_writer.py: write of %d points failed: %s'%(len(points), e))
+            return False
+
+    # spool file names are timestamps, so sorting them gives write order
+    #
+    def spool_files(self):
+        return sorted(os.listdir(self.spool_dir))
+
+    def spool(self, points):
+        fname = '%s/%d.json'%(self.spool_dir, time.time_ns())
+        with open(fname + '.tmp', 'w') as f:
+            json.dump(points, f)
+        os.rename(fname + '.tmp', fname)
+        files = [f for f in self.spool_files() if f.endswith('.json')]
+        nexcess = len(files) - self.max_spool_files
+        if nexcess > 0:
+            util.write_log('influx_writer.py: spool full; dropping %d oldest batches'%nexcess)
+            for f in files[:nexcess]:
+                os.remove('%s/%s'%(self.spool_dir, f))
+
+    # write spooled batches, oldest first; stop at the first failure
+    #
+    def flush_spool(self):
+        self.last_retry = time.time()
+        for f in self.spool_files():
+            path = '%s/%s'%(self.spool_dir, f)
+            if not f.endswith('.json'):
+                os.remove(path)
+                continue
+            with open(path) as fin:
+                points = json.load(fin)
+            if not self.write_points(points):
+                return
+            os.remove(path)
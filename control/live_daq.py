@@ -0,0 +1,302 @@
+#! /usr/bin/env python3
+
+# live_daq.py --dp X --module N [--module N ...] [--decimate N]
+#
+# stream frames from an in-progress run to stdout (run on a DAQ node,
+# typically over ssh by video.py on the head node).
+#
+# For each module, tail-follow the newest file of the data product,
+# and write each frame as soon as it's complete.
+# Changes to the module run dirs are waited for with inotify;
+# if that's not available, the files are polled.
+# When hashpipe starts a new file (higher seqno) we switch to it.
+# Exits when the run ends.
+#
+# --dp          data product (img8/img16/ph256/ph1024)
+# --module N    stream frames from module N; can be given more than once
+# --decimate N  send only every Nth frame of each module (default 1)
+#
+# Framing: each frame is sent as
+#   FRAME_HEADER (magic, module ID, DP code, JSON length, image length)
+#   the frame's JSON header (without the trailing blank line)
+#   the image (without the '*')
+# A frame header with DP code DP_END marks the end of the stream.
+
+import os, sys, time, struct, select, subprocess, ctypes, ctypes.util
+
+import pff, util
+
+FRAME_MAGIC = b'PF'
+FRAME_HEADER = struct.Struct('<2sHBHI')
+
+DP_END = 0
+DP_CODES = {'img8': 1, 'img16': 2, 'ph256': 3, 'ph1024': 4}
+DP_NAMES = {code: dp for dp, code in DP_CODES.items()}
+
+DP_BYTES_PER_IMAGE = {'img8': 1024, 'img16': 2048, 'ph256': 512, 'ph1024': 2048}
+
+POLL_INTERVAL = 0.05
+    # seconds between checks of file sizes if no inotify
+DIR_POLL_INTERVAL = 1
+    # seconds between checks for new files if no inotify
+RUN_CHECK_INTERVAL = 1
+    # seconds between checks for end of run
+MAX_BACKLOG = 10
+    # if more frames than this are waiting (e.g. at startup),
+    # skip to the newest one
+
+#-------------- INOTIFY ---------------
+
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_EVENT = struct.Struct('iIII')
+
+# wait for changes to directories using inotify (through libc)
+#
+class Inotify:
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1() failed')
+
+    def add_watch(self, path):
+        wd = self.libc.inotify_add_watch(
+            self.fd, path.encode(), IN_MODIFY|IN_CLOSE_WRITE|IN_MOVED_TO|IN_CREATE
+        )
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_add_watch(%s) failed'%path)
+        return wd
+
+    # wait up to timeout secs for events.
+    # return the list of (wd, name) of files created
+    #
+    def wait(self, timeout):
+        created = []
+        r, w, x = select.select([self.fd], [], [], timeout)
+        if not r:
+            return created
+        while True:
+            try:
+                buf = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            i = 0
+            while i < len(buf):
+                wd, mask, cookie, n = IN_EVENT.unpack_from(buf, i)
+                i += IN_EVENT.size
+                if mask & (IN_CREATE|IN_MOVED_TO):
+                    created.append((wd, buf[i:i+n].rstrip(b'\0').decode()))
+                i += n
+        return created
+
+#-------------- FILE TAILS ---------------
+
+# return the seqno of a file of the given data product, or -1 if it isn't one
+#
+def file_seqno(name, dp):
+    if not pff.is_pff_file(name):
+        return -1
+    n = pff.parse_name(name)
+    if not n or n.get('dp') != dp or 'seqno' not in n:
+        return -1
+    return int(n['seqno'])
+
+# follow the newest file of a data product in a module's run dir
+#
+class ModuleTail:
+    def __init__(self, module_id, dir, dp, decimate):
+        self.module_id = module_id
+        self.dir = dir
+        self.dp = dp
+        self.decimate = decimate
+        self.bytes_per_image = DP_BYTES_PER_IMAGE[dp]
+        self.fd = None
+        self.seqno = -1
+        self.frame_size = None
+
+    # open the file with the given seqno.
+    # If at_end, start from its last complete frame
+    #
+    def open(self, name, seqno, at_end):
+        if self.fd is not None:
+            os.close(self.fd)
+        self.fd = os.open('%s/%s'%(self.dir, name), os.O_RDONLY)
+        self.seqno = seqno
+        self.frame_size = None
+        self.at_end = at_end
+        self.next_frame = 0
+
+    # switch to the given file if it's newer than the current one,
+    # after sending the rest of the current one
+    #
+    def new_file(self, name, out):
+        seqno = file_seqno(name, self.dp)
+        if seqno <= self.seqno:
+            return
+        if self.fd is not None:
+            self.send_frames(out)
+        self.open(name, seqno, self.fd is None)
+
+    def scan_dir(self, out):
+        if not os.path.isdir(self.dir):
+            return
+        for name in os.listdir(self.dir):
+            self.new_file(name, out)
+
+    # frame size is header size (from the first frame) + image + '*'
+    #
+    def get_frame_size(self, size):
+        head = os.pread(self.fd, min(size, 65536), 0)
+        n = head.find(b'\n\n')
+        if n < 0 or n + 3 + self.bytes_per_image > size:
+            return False
+        self.header_size = n + 2
+        self.frame_size = self.header_size + 1 + self.bytes_per_image
+        return True
+
+    # write the frames completed since the last call
+    #
+    def send_frames(self, out):
+        if self.fd is None:
+            return
+        size = os.fstat(self.fd).st_size
+        if self.frame_size is None:
+            if not self.get_frame_size(size):
+                return
+            if self.at_end:
+                self.next_frame = size//self.frame_size - 1
+        nframes = size//self.frame_size
+        if nframes - self.next_frame > MAX_BACKLOG*self.decimate:
+            self.next_frame = nframes - 1
+        while self.next_frame < nframes:
+            buf = os.pread(self.fd, self.frame_size, self.next_frame*self.frame_size)
+            if buf[self.header_size] != ord('*'):
+                raise Exception('%s: bad frame %d'%(self.dir, self.next_frame))
+            header = buf[:self.header_size].rstrip()
+            out.write(FRAME_HEADER.pack(
+                FRAME_MAGIC, self.module_id, DP_CODES[self.dp],
+                len(header), self.bytes_per_image
+            ))
+            out.write(header)
+            out.write(buf[self.header_size+1:])
+            self.next_frame += self.decimate
+
+def main(dp, module_ids, decimate):
+    run = util.daq_get_run_name()
+    if not run:
+        sys.stderr.write('no run\n')
+        return
+    tails = [
+        ModuleTail(m, 'module_%d/%s'%(m, run), dp, decimate) for m in module_ids
+    ]
+    try:
+        inotify = Inotify()
+        for tail in tails:
+            tail.wd = inotify.add_watch(tail.dir)
+    except Exception as e:
+        sys.stderr.write('inotify not available (%s); polling\n'%e)
+        inotify = None
+    out = sys.stdout.buffer
+    for tail in tails:
+        tail.scan_dir(out)
+
+    last_run_check = last_dir_scan = time.time()
+    while True:
+        for tail in tails:
+            tail.send_frames(out)
+        out.flush()
+
+        if inotify:
+            for wd, name in inotify.wait(RUN_CHECK_INTERVAL):
+                for tail in tails:
+                    if tail.wd == wd:
+                        tail.new_file(name, out)
+        else:
+            time.sleep(POLL_INTERVAL)
+            if time.time() - last_dir_scan > DIR_POLL_INTERVAL:
+                for tail in tails:
+                    tail.scan_dir(out)
+                last_dir_scan = time.time()
+
+        if time.time() - last_run_check > RUN_CHECK_INTERVAL:
+            if util.daq_get_run_name() != run:
+                break
+            last_run_check = time.time()
+    out.write(FRAME_HEADER.pack(FRAME_MAGIC, 0, DP_END, 0, 0))
+    out.flush()
+
+#-------------- HEAD NODE ---------------
+
+# start streaming frames of the given modules from a DAQ node.
+# return the ssh process; read frames from its stdout with read_frame()
+#
+def subscribe(node, module_ids, dp, decimate=1):
+    rcmd = 'cd %s; ./live_daq.py --dp %s --decimate %d %s'%(
+        node['data_dir'], dp, decimate,
+        ' '.join('--module %d'%m for m in module_ids)
+    )
+    cmd = util.ssh_cmd_str().split() + [
+        '%s@%s'%(node['username'], node['ip_addr']), rcmd
+    ]
+    return subprocess.Popen(cmd, stdout=subprocess.PIPE)
+
+def read_exactly(f, n):
+    buf = b''
+    while len(buf) < n:
+        x = f.read(n - len(buf))
+        if not x:
+            return None
+        buf += x
+    return buf
+
+# read a frame from a stream.
+# return (module ID, data product, JSON header (str), image (bytes)),
+# or None at the end of the stream
+#
+def read_frame(f):
+    buf = read_exactly(f, FRAME_HEADER.size)
+    if buf is None:
+        return None
+    magic, module_id, dp_code, json_len, image_len = FRAME_HEADER.unpack(buf)
+    if magic != FRAME_MAGIC:
+        raise Exception('read_frame(): bad magic %s'%magic)
+    if dp_code == DP_END:
+        return None
+    buf = read_exactly(f, json_len + image_len)
+    if buf is None:
+        return None
+    return module_id, DP_NAMES[dp_code], buf[:json_len].decode(), buf[json_len:]
+
+if __name__ == "__main__":
+    dp = None
+    module_ids = []
+    decimate = 1
+    argv = sys.argv
+    i = 1
+    while i<len(argv):
+        if argv[i] == '--dp':
+            i += 1
+            dp = argv[i]
+        elif argv[i] == '--module':
+            i += 1
+            module_ids.append(int(argv[i]))
+        elif argv[i] == '--decimate':
+            i += 1
+            decimate = int(argv[i])
+        else:
+            sys.stderr.write('bad arg: %s\n'%argv[i])
+            sys.exit()
+        i += 1
+    if not module_ids:
+        sys.stderr.write('no module specified\n')
+    elif dp not in DP_CODES:
+        sys.stderr.write('bad dp: %s\n'%dp)
+    else:
+        try:
+            main(dp, module_ids, decimate)
+        except BrokenPipeError:
+            # the head node went away
+            pass
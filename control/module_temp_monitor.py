@@ -5,16 +5,17 @@ turns off the corresponding module power supply if its temperature
 exceeds a safe temperature range.
 See https://github.com/panoseti/panoseti/issues/58.
 
-NOTE: this script calls stop.py if any boards or detectors get too hot.
+NOTE: this script stops any run (as stop.py does) if any boards or detectors get too hot.
 """
 
 import time, sys
 import datetime
-import os
 import sys
+import numpy as np
 import redis
 import redis_utils
 import power
+import stop
 
 from util import are_redis_daemons_running, write_log
 from capture_power import get_wps_rkey
@@ -22,41 +23,71 @@ sys.path.insert(0, '../util')
 import config_file
 
 # Seconds between updates.
-UPDATE_INTERVAL = 10
+UPDATE_INTERVAL = 2
 
 # Min & max module operating temperatures (degrees Celsius).
 MIN_DETECTOR_TEMP = -20.0
 MAX_DETECTOR_TEMP = 60.0
 MAX_FPGA_TEMP = 85.0
 
+# Redis keys of quabos whose temperatures were missing in the last snapshot.
+untracked_rkeys = set()
 
-def is_acceptable_temperature(temps: (float, float)):
+
+def is_acceptable_temperature(temp1, temp2):
     """
-    Returns a tuple of (TEMP1 is ok?, TEMP2 is ok?) if the corresponding
-    sensor temperature is within the specified operating range.
+    Returns a pair of boolean arrays (TEMP1 is ok?, TEMP2 is ok?) that are True
+    where the corresponding sensor temperature is within the specified operating range.
+    Missing temperatures (NaN) are not acceptable.
     """
-    temp1_ok = MIN_DETECTOR_TEMP <= temps[0] <= MAX_DETECTOR_TEMP
-    temp2_ok = temps[1] <= MAX_FPGA_TEMP
+    temp1_ok = (MIN_DETECTOR_TEMP <= temp1) & (temp1 <= MAX_DETECTOR_TEMP)
+    temp2_ok = temp2 <= MAX_FPGA_TEMP
     return temp1_ok, temp2_ok
 
 
-def get_redis_temps(r: redis.Redis, rkey: str) -> (float, float):
-    """Given a Quabo's redis key, rkey, returns (TEMP1, TEMP2)."""
+def get_monitored_quabos(obs_config):
+    """
+    Returns (rkeys, wps_names): the Redis key of each quabo of each configured module,
+    and the name of the wps powering it.
+    """
+    rkeys = list()
+    wps_names = list()
+    for dome in obs_config['domes']:
+        for module in dome['modules']:
+            for quabo_index in range(4):
+                rkeys.append(f'QUABO_{config_file.get_boardloc(module["ip_addr"], quabo_index)}')
+                wps_names.append(module['wps'])
+    return rkeys, wps_names
+
+
+def get_redis_temps(r: redis.Redis, rkeys):
+    """
+    Reads the HK hashsets of all quabos in rkeys with one pipelined HGETALL.
+    Returns arrays (TEMP1, TEMP2) with one element per quabo;
+    temperatures that aren't in Redis are NaN.
+    """
+    pipe = r.pipeline(transaction=False)
+    for rkey in rkeys:
+        pipe.hgetall(rkey)
     try:
-        temp1 = redis_utils.get_casted_redis_value(r, rkey, 'TEMP1')
-        temp2 = redis_utils.get_casted_redis_value(r, rkey, 'TEMP2')
-        return temp1, temp2
+        snapshot = pipe.execute()
     except redis.RedisError as err:
         msg = "module_temp_monitor: A Redis error occurred. "
         msg += "Error msg: {0}"
         write_log(msg.format(err))
         raise
-    except TypeError as terr:
-        msg = "module_temp_monitor: Failed to update '{0}'. "
-        msg += "Temperature HK data may be missing. "
-        msg += "Error msg: {1}"
-        write_log(msg.format(rkey, terr))
-        raise
+    temps = np.full((2, len(rkeys)), np.nan)
+    for i, (rkey, fields) in enumerate(zip(rkeys, snapshot)):
+        for j, field in enumerate((b'TEMP1', b'TEMP2')):
+            if field not in fields:
+                continue
+            try:
+                temps[j, i] = redis_utils.cast_redis_value(rkey, field, fields[field])
+            except (TypeError, ValueError) as err:
+                msg = "module_temp_monitor: Failed to read {0} of '{1}'. "
+                msg += "Error msg: {2}"
+                write_log(msg.format(field.decode(), rkey, err))
+    return temps[0], temps[1]
 
 
 def log_powered_off_modules(wps_name, wps_to_modules):
@@ -69,13 +100,27 @@ def log_powered_off_modules(wps_name, wps_to_modules):
     write_log(msg.format(wps_name, quabos_off))
 
 
+def stop_active_run():
+    """Stops recording activities, and the run if one is in progress, as stop.py does."""
+    write_log('module_temp_monitor: Stopping recording activities...')
+    try:
+        daq_config = config_file.get_daq_config()
+        quabo_uids = config_file.get_quabo_uids()
+        config_file.associate(daq_config, quabo_uids)
+        stop.stop_run(daq_config, quabo_uids)
+    except Exception as err:
+        # Power must be turned off regardless.
+        msg = "module_temp_monitor: Failed to stop recording activities. "
+        msg += "Error msg: {0}"
+        write_log(msg.format(err))
+
+
 def update_power(obs_config, wps_to_modules, wps_to_turn_off):
     """Turn off each wps in wps_off, write a log message describing which
     modules and quabos are no longer powered, then stop this script."""
     if wps_to_turn_off:
         # Stop any active runs.
-        write_log(f'Running ./stop.py...')
-        os.system('./stop.py')
+        stop_active_run()
         for wps_name in wps_to_turn_off:
             wps_dict = obs_config[wps_name]
             try:
@@ -89,55 +134,38 @@ def update_power(obs_config, wps_to_modules, wps_to_turn_off):
         sys.exit()
 
 
-def check_all_module_temps(obs_config, wps_to_modules, r: redis.Redis):
+def check_all_module_temps(rkeys, wps_names, r: redis.Redis):
     """
-    Iterates through each quabo in the observatory and reads the detector and fpga temperature from Redis.
-    If the temperature is too extreme, we turn off the corresponding module power supply.
+    Reads the detector and fpga temperature of each quabo in rkeys from Redis.
+    Returns the set of names of the wps powering modules whose temperature is too extreme.
     """
-    # wps_off stores the name of each wps that is powering an over-temperature module.
+    temp1, temp2 = get_redis_temps(r, rkeys)
+    missing = np.isnan(temp1) | np.isnan(temp2)
+    # Log quabos whose temperatures have just gone missing, once.
+    for i in np.flatnonzero(missing):
+        if rkeys[i] not in untracked_rkeys:
+            msg = "module_temp_monitor: {0}\n\tFailed to update {1}: "
+            msg += "temperature HK data is not tracked in Redis."
+            write_log(msg.format(datetime.datetime.now(), rkeys[i]))
+    untracked_rkeys.clear()
+    untracked_rkeys.update(rkeys[i] for i in np.flatnonzero(missing))
+    # Checks whether the Quabo temperatures are acceptable.
+    # See https://github.com/panoseti/panoseti/issues/58.
+    # Each temperature is checked if it's present, even if the other one is missing.
+    detector_temp_ok, fpga_temp_ok = is_acceptable_temperature(temp1, temp2)
+    detector_bad = ~np.isnan(temp1) & ~detector_temp_ok
+    fpga_bad = ~np.isnan(temp2) & ~fpga_temp_ok
+    # If the detector or fpga temps exceed thresholds, inform the operator and turn off the corresponding wps.
     wps_to_turn_off = set()
-    for dome in obs_config['domes']:
-        for module in dome['modules']:
-            module_ip_addr = module['ip_addr']
-            module_wps_key = module['wps']
-            for quabo_index in range(4):
-                try:
-                    # Get this Quabo's redis key.
-                    rkey = f'QUABO_{config_file.get_boardloc(module_ip_addr, quabo_index)}'
-                    # Get this Quabo's detector and fpga temperatures, if they exist.
-                    if rkey.encode('utf-8') not in r.keys():
-                        raise Warning("%s is not tracked in Redis." % rkey)
-                    else:
-                        temps = get_redis_temps(r, rkey)
-                except Warning as werr:
-                    msg = "module_temp_monitor: {0}\n\tFailed to update quabo at index {1} with base IP {2}. "
-                    msg += "\tError msg: {3}"
-                    write_log(msg.format(datetime.datetime.now(), quabo_index, module_ip_addr, werr))
-                    continue
-                except redis.RedisError as rerr:
-                    msg = "module_temp_monitor: {0}\n\tA Redis error occurred. "
-                    msg += "\tError msg: {1}"
-                    write_log(msg.format(datetime.datetime.now(), rerr))
-                    raise
-                else:
-                    # Checks whether the Quabo temperatures are acceptable.
-                    # See https://github.com/panoseti/panoseti/issues/58.
-                    detector_temp_ok, fpga_temp_ok = is_acceptable_temperature(temps)
-                    # If the detector or fpga temps exceed thresholds, inform the operator and turn off the corresponding wps.
-                    if not detector_temp_ok or not fpga_temp_ok:
-                        msg = ''
-                        if not detector_temp_ok:
-                            msg += "The DETECTOR temp of Quabo {0} is {1} C, which exceeds the operating temperature range: {2} C to {3} C. "
-                            write_log(msg.format(
-                                config_file.get_boardloc(module_ip_addr, quabo_index), temps[0], MIN_DETECTOR_TEMP, MAX_DETECTOR_TEMP)
-                            )
-                        if not fpga_temp_ok:
-                            msg += "The FPGA temp of Quabo {0} is {1} C, which exceeds the operating temperature of {2} C. "
-                            write_log(msg.format(
-                                config_file.get_boardloc(module_ip_addr, quabo_index), temps[1], MAX_FPGA_TEMP)
-                            )
-                        msg += f'Attempting to turn off the wps: {module_wps_key}'
-                        wps_to_turn_off.add(module_wps_key)
+    for i in np.flatnonzero(detector_bad | fpga_bad):
+        if detector_bad[i]:
+            msg = "The DETECTOR temp of {0} is {1} C, which exceeds the operating temperature range: {2} C to {3} C. "
+            write_log(msg.format(rkeys[i], temp1[i], MIN_DETECTOR_TEMP, MAX_DETECTOR_TEMP))
+        if fpga_bad[i]:
+            msg = "The FPGA temp of {0} is {1} C, which exceeds the operating temperature of {2} C. "
+            write_log(msg.format(rkeys[i], temp2[i], MAX_FPGA_TEMP))
+        write_log(f'Attempting to turn off the wps: {wps_names[i]}')
+        wps_to_turn_off.add(wps_names[i])
     return wps_to_turn_off
 
 
@@ -159,15 +187,15 @@ def main():
     """Makes a call to check_all_module_temps every UPDATE_INTERVAL seconds."""
     obs_config = config_file.get_obs_config()
     wps_to_modules = get_wps_to_modules(obs_config)
+    rkeys, wps_names = get_monitored_quabos(obs_config)
     r = redis_utils.redis_init()
     if not are_redis_daemons_running():
         write_log('Please start redis daemons')
         return
     print("module_temp_monitor: Running...")
-    startup = True
     while True:
         time.sleep(UPDATE_INTERVAL)
-        wps_to_turn_off = check_all_module_temps(obs_config, wps_to_modules, r)
+        wps_to_turn_off = check_all_module_temps(rkeys, wps_names, r)
         update_power(obs_config, wps_to_modules, wps_to_turn_off)
 
 
@@ -26,6 +26,7 @@ class HKconvert():
                          r'TEMP1':self.TEMP1,
                          r'TEMP2':self.TEMP2,
                          r'VCC*':self.VCC}
+        self.converterCache = {}
         self.voltageFactor = 1e9
         self.currentFactor = 1e9
         
@@ -110,11 +111,23 @@ class HKconvert():
         self.showUnits()
         return
         
+    # Return the conversion function for key, or None if there isn't one.
+    # The keyFormat lookup is done once per key; the result is cached.
+    # The returned functions also accept NumPy arrays of values.
+    def getConverter(self, key):
+        if key not in self.converterCache:
+            self.converterCache[key] = None
+            for k in self.keyFormat:
+                if re.match(k, key):
+                    self.converterCache[key] = self.keyFormat[k]
+                    break
+        return self.converterCache[key]
+
     def convertValue(self, key, value):
-        for k in self.keyFormat:
-            if re.match(k, key):
-                return self.keyFormat[k](int(value))
-        return None
+        converter = self.getConverter(key)
+        if converter is None:
+            return None
+        return converter(int(value))
 
 class TestHKConvert(unittest.TestCase):
     hk_converter = HKconvert()
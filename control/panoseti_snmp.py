@@ -6,6 +6,13 @@ import netsnmp
 
 os.environ['MIBDIRS']='+./'
 
+# numeric OIDs of the objects polled by wrs_snmp_bulk,
+# so that requests don't depend on the MIBs being loaded
+WRS_SOFTPLL_STATUS_OID      = '.1.3.6.1.4.1.96.100.6.2.2.2'
+WRS_PORT_STATUS_LINK_OID    = '.1.3.6.1.4.1.96.100.7.6.1.3'
+WRS_PORT_STATUS_SFPPN_OID   = '.1.3.6.1.4.1.96.100.7.6.1.8'
+WRS_NPORTS                  = 18
+
 wrsSnmpObjs={'sfppn'         : 'WR-SWITCH-MIB::wrsPortStatusSfpPN' , \
              'linkstatus'    : 'WR-SWITCH-MIB::wrsPortStatusLink'  , \
              'pllstatus'     : 'WR-SWITCH-MIB::wrsSoftPLLStatus'         }
@@ -36,4 +43,40 @@ class wrs_snmp(object):
     def __InitMethods(self):
         for key in self.objs:
             sw = snmp_wapper(self.dev, self.objs[key])
-            setattr(self, key, sw.snmpwalk) 
\ No newline at end of file
+            setattr(self, key, sw.snmpwalk) 
+
+# get the link status of every port and the softpll status of
+# the switch with a single GETBULK request.
+# dev may include a port, e.g. 'localhost:1161'
+#
+class wrs_snmp_bulk(object):
+    def __init__(self, dev = '10.0.1.36', nports = WRS_NPORTS):
+        self.dev = dev
+        self.nports = nports
+        self.session = netsnmp.Session(
+            Version=2, DestHost=dev, Community='public', UseNumeric=1
+        )
+    # returns (list of link status per port, softpll status),
+    # as strings like those from wrs_snmp, or -1 on failure
+    def status(self):
+        varlist = netsnmp.VarList(
+            netsnmp.Varbind(WRS_SOFTPLL_STATUS_OID),
+            netsnmp.Varbind(WRS_PORT_STATUS_LINK_OID)
+        )
+        try:
+            res = self.session.getbulk(1, self.nports, varlist)
+        except:
+            return -1
+        if not res:
+            return -1
+        pll = -1
+        links = []
+        for var in varlist:
+            oid = var.tag if not var.iid else '%s.%s'%(var.tag, var.iid)
+            if not oid.startswith('.'):
+                oid = '.' + oid
+            if oid.startswith(WRS_SOFTPLL_STATUS_OID + '.'):
+                pll = var.val.decode()
+            elif oid.startswith(WRS_PORT_STATUS_LINK_OID + '.'):
+                links.append(var.val.decode())
+        return links, pll
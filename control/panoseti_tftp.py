@@ -1,10 +1,24 @@
 import tftpy
 import struct
+import io
+import hashlib
 import os
 
+#in-memory download buffer.
+#older tftpy closes the output file after each download,
+#which would discard a BytesIO's contents; keep them
+class DownloadBuffer(io.BytesIO):
+	def close(self):
+		pass
+
 class tftpw(object):
 	def __init__(self,ip,port=69):
-		self.client = tftpy.TftpClient(ip,port)
+		#transfers use in-memory buffers, which can't be file-locked
+		try:
+			self.client = tftpy.TftpClient(ip,port,flock=False)
+		except TypeError:
+			#older tftpy doesn't lock files
+			self.client = tftpy.TftpClient(ip,port)
 	
 	#print help information
 	def help(self):
@@ -22,57 +36,39 @@ class tftpw(object):
 		self.client.download('/flashuid',filename)
 		print('Get flash Device ID successfully!')
 	
+	#read size bytes of flash starting at addr
+	#we can get 65535 bytes each time, so we need to repeat the download operation
+	#for convenience, we read 32768 bytes each time, into a buffer in memory
+	#(rather than a shared file on disk, so several quabos can be read at once)
+	def read_flash(self, addr, size):
+		chunks = []
+		for i in range(0, (size + 0x7fff)//0x8000):
+			addr_tmp = addr + i*0x8000
+			offset = str(hex(addr_tmp))
+			remote_filename = '/flash.' + offset[2:] + '.8000'
+			#print('remote_filename :',remote_filename)
+			#a fresh buffer for each chunk
+			buf = DownloadBuffer()
+			self.client.download(remote_filename,buf)
+			chunks.append(buf.getvalue())
+		return b''.join(chunks)[:size]
+
 	#get wrpc_filesys
 	#space 	: 0x00E00000--0x00F0FFFF
 	#size	: 1MB + 64K BYTES = 1114112 BYTES
 	def get_wrpc_filesys(self, filename='wrpc_filesys',addr=0x00e00000):
-		fp_w = open(filename,'wb')
-		#we can get 65535 bytes each time, so we need to repeat the download operation for 16 times
-		#for convenience, we read 32768 bytes each time
-		for i in range(0,34):
-			addr_tmp = addr + i*0x8000 
-			offset = str(hex(addr_tmp))
-			remote_filename = '/flash.' + offset[2:] + '.8000'
-			#print('remote_filename :',remote_filename)
-			#download the file to 'tmp'
-			self.client.download(remote_filename,'tmp')
-			#open 'tmp'
-			fp_r = open('tmp','rb')
-			#read data out
-			data = fp_r.read()
-			#write the data to the final file
+		data = self.read_flash(addr, 34*0x8000)
+		with open(filename,'wb') as fp_w:
 			fp_w.write(data)
-			#close 'tmp'
-			fp_r.close()
-		fp_r.close()
-		fp_w.close()
-		os.remove('tmp')
 		print('Download wrpc file system successfully!')
 		
 	#get mb_file 
 	#space	: 0x00F10000--0x0100FFFF
 	#size	: 1MB = 1048576 BYTES
 	def get_mb_file(self, filename='mb_file',addr=0x00F10000):
-		fp_w = open(filename,'wb')
-		#we can get 65535 bytes each time, so we need to repeat the download operation for 16 times
-		#for convenience, we read 32768 bytes each time
-		for i in range(0,32):
-			addr_tmp = addr + i*0x8000 
-			offset = str(hex(addr_tmp))
-			remote_filename = '/flash.' + offset[2:] + '.8000'
-			#print('remote_filename :',remote_filename)
-			#download the file to 'tmp'
-			self.client.download(remote_filename,'tmp')
-			#open 'tmp'
-			fp_r = open('tmp','rb')
-			#read data out
-			data = fp_r.read()
-			#write the data to the final file
+		data = self.read_flash(addr, 32*0x8000)
+		with open(filename,'wb') as fp_w:
 			fp_w.write(data)
-			#close 'tmp'
-			fp_r.close()
-		fp_w.close()
-		os.remove('tmp')
 		print('Download mb file successfully!')
 		
 	#put wprc_filesys, starting from 0x00E00000
@@ -102,28 +98,36 @@ class tftpw(object):
 		print('Upload %s to panoseti mb_file space successfully!' %filename)
 		
 	#put bin file,starting from 0x01010000
-	def put_bin_file(self,filename,addr=0x01010000):
+	#if verify, read the image back from flash and compare its checksum
+	#with the file's; raise an exception if they differ
+	def put_bin_file(self,filename,addr=0x01010000,verify=False):
 		offset = str(hex(addr))
 		remote_filename = '/flash.' + offset[2:]
 		#print('remote_filename :',remote_filename)
-		self.client.upload(remote_filename,filename)
+		with open(filename,'rb') as f:
+			image = f.read()
+		self.client.upload(remote_filename,io.BytesIO(image))
+		if verify:
+			checksum = hashlib.sha256(image).hexdigest()
+			flash_checksum = hashlib.sha256(self.read_flash(addr, len(image))).hexdigest()
+			if flash_checksum != checksum:
+				raise Exception('checksum of %s in flash (%s) differs from file (%s)'%(
+					filename, flash_checksum, checksum
+				))
 		print('Upload %s to panoseti bin file space successfully!' %filename)
 		
-	def reboot(self,addr=0x00010100):
+	#the boot address is sent from memory rather than a local file,
+	#so several quabos can be rebooted at once
+	def reboot(self,addr=0x00010100,verbose=True):
 		remote_filename = '/progdev'
-		filename = 'tmp.prog'
-		fp = open(filename,'wb')
-		for i in range(1,5):
-			s = struct.pack('B', addr>>(8*(4-i))&0xFF)
-			fp.write(s)
-		fp.close()
-		print('*******************************************************')
-		print('FPGA is rebooting, just ignore the timeout information')
-		print('Wait for 30s, and then check housekeeping data!')
-		print('*******************************************************')
+		prog = io.BytesIO(struct.pack('>I', addr))
+		if verbose:
+			print('*******************************************************')
+			print('FPGA is rebooting, just ignore the timeout information')
+			print('Wait for 30s, and then check housekeeping data!')
+			print('*******************************************************')
 		try:
-			self.client.upload(remote_filename,filename)
+			self.client.upload(remote_filename,prog)
 		except:
 			pass
-		os.remove(filename)
 		
@@ -14,34 +14,82 @@
 # The IP addr of the WPS and the socket # come from a config file
 # This can be used as a module or a script.
 
-import sys, os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import requests
 sys.path.insert(0, '../util')
 import config_file
 
+HTTP_TIMEOUT = 5
+    # seconds
+
+# one HTTP session per WPS URL, so connections are reused between requests.
+# A session isn't used by more than one thread at once
+#
+sessions = {}
+
+def get_session(url):
+    if url not in sessions:
+        sessions[url] = requests.Session()
+    return sessions[url]
+
 # turn power on or off
 #
 def quabo_power(wps, on):
     url = wps['url']
     socket = wps['quabo_socket']
     value = 'ON' if on else 'OFF'
-    cmd = 'curl -s %s/outlet?%d=%s > /dev/null'%(url,socket,value)
-    ret = os.system(cmd)
-    if ret: raise Exception('%s returned %d'%(cmd, ret))
+    r = get_session(url).get('%s/outlet?%d=%s'%(url,socket,value), timeout=HTTP_TIMEOUT)
+    r.raise_for_status()
 
+# given the WPS status page, return True if the socket's power is on
+#
+def parse_power_status(page, socket):
+    off = page.find('state">')
+    if off < 0:
+        raise Exception('no outlet state in WPS status page')
+    off += len('state">')
+    y = page[off:off+2]
+    status = int(y, 16)
+    return (status&(1<<(socket-1))) != 0
+
+# return the status page of the WPS at the given URL
+#
+def get_status_page(url):
+    r = get_session(url).get('%s/status'%(url), timeout=HTTP_TIMEOUT)
+    r.raise_for_status()
+    return r.text
 
 # return True if power is on
 #
 def quabo_power_query(wps):
-    url = wps['url']
-    socket = wps['quabo_socket']
-    cmd = 'curl -s %s/status'%(url)
-    out = os.popen(cmd).read()
-    off = out.find('state">')
-    off += len('state">')
-    y = out[off:off+2]
-    status = int(y, 16)
-    if(status&(1<<(socket-1))):
-        return 'true'
+    return parse_power_status(get_status_page(wps['url']), wps['quabo_socket'])
+
+# thread pool for concurrent queries
+#
+executor = None
+
+# query several WPSs concurrently.
+# wpss is a dict of name: WPS config.
+# Entries with the same URL (sockets of the same WPS) share one
+# request for the status page.
+# Returns a dict of name: True/False if power is on/off,
+# or the exception raised by the query.
+#
+def quabo_power_query_all(wpss):
+    global executor
+    if executor is None:
+        executor = ThreadPoolExecutor(max_workers=16)
+    urls = set(wps['url'] for wps in wpss.values())
+    futures = {url: executor.submit(get_status_page, url) for url in urls}
+    status = {}
+    for name, wps in wpss.items():
+        try:
+            page = futures[wps['url']].result()
+            status[name] = parse_power_status(page, wps['quabo_socket'])
+        except Exception as e:
+            status[name] = e
+    return status
 
 def do_wps(name, obs_config, op):
     wps = obs_config[name]
@@ -58,7 +106,16 @@ def do_wps(name, obs_config, op):
         print("%s: turned power off"%name)
 
 def do_all(obs_config, op):
-    for key in [k for k in obs_config.keys() if 'wps' in k.lower()]:
+    keys = [k for k in obs_config.keys() if 'wps' in k.lower()]
+    if op == 'query':
+        status = quabo_power_query_all({k: obs_config[k] for k in keys})
+        for name, on in status.items():
+            if isinstance(on, Exception):
+                print("%s: query failed: %s"%(name, on))
+            else:
+                print("%s: power is %s"%(name, 'on' if on else 'off'))
+        return
+    for key in keys:
         do_wps(key, obs_config, op)
 
 if __name__ == "__main__":
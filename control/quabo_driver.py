@@ -14,7 +14,8 @@
 #
 # See https://github.com/panoseti/panoseti/wiki/Quabo-device-driver
 
-import socket, time, json
+import socket, time, json, queue, threading
+from concurrent.futures import ThreadPoolExecutor
 import util
 
 UDP_CMD_PORT= 60000
@@ -53,17 +54,202 @@ class DAQ_PARAMS:
         self.do_stim = True
         self.stim_rate = rate
         self.stim_level = level
-# currently each QUABO object has its own sockets,
+def cmd_socket():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(0.5)
+    sock.bind(("", UDP_CMD_PORT))
+    return sock
+
+# a socket for sending commands that don't read replies (e.g. hv_set()).
+# It's not bound to UDP_CMD_PORT, so other programs can use that port
+# while it's open, and it can be shared by many QUABO objects
+#
+def send_socket():
+    return socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+# Command multiplexer: owns the command socket (and, when needed,
+# the HK socket) and lets many QUABO objects talk to their quabos
+# at the same time.
+# Receiver threads sort incoming packets into a queue per source IP addr,
+# so each quabo only sees its own replies.
+#
+# example:
+#   mux = CMD_MUX()
+#   results = mux.for_each(ip_addrs, lambda q: q.send_daq_params(params))
+#   mux.close()
+#
+class CMD_MUX:
+    def __init__(self, timeout=0.5, retries=2, max_workers=32):
+        self.timeout = timeout
+            # default seconds to wait for a reply
+        self.retries = retries
+            # default number of times a request is resent if there's no reply
+        self.sock = cmd_socket()
+        self.hk_sock = None
+        self.lock = threading.Lock()
+        self.replies = {}
+        self.hk_packets = {}
+            # IP addr -> queue of packets from that addr
+        self.closed = False
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.start_receiver(self.sock, self.replies)
+
+    def start_receiver(self, sock, queues):
+        t = threading.Thread(target=self.receive, args=(sock, queues), daemon=True)
+        t.start()
+
+    def receive(self, sock, queues):
+        while not self.closed:
+            try:
+                data, src = sock.recvfrom(2048)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.get_queue(queues, src[0]).put(data)
+
+    def get_queue(self, queues, ip_addr):
+        with self.lock:
+            if ip_addr not in queues:
+                queues[ip_addr] = queue.Queue()
+            return queues[ip_addr]
+
+    def send(self, ip_addr, cmd):
+        self.sock.sendto(bytes(cmd), (ip_addr, UDP_CMD_PORT))
+
+    # return the next reply from the given quabo;
+    # raise socket.timeout if none arrives in time
+    #
+    def recv(self, ip_addr, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        try:
+            return self.get_queue(self.replies, ip_addr).get(timeout=timeout)
+        except queue.Empty:
+            raise socket.timeout('no reply from %s'%ip_addr)
+
+    # discard replies received so far from the given quabo
+    #
+    def flush(self, ip_addr, queues=None):
+        q = self.get_queue(self.replies if queues is None else queues, ip_addr)
+        while True:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                return
+
+    # send a command and return the reply,
+    # resending it if no reply arrives within the timeout
+    #
+    def request(self, ip_addr, cmd, timeout=None, retries=None):
+        if retries is None:
+            retries = self.retries
+        self.flush(ip_addr)
+        for i in range(retries+1):
+            self.send(ip_addr, cmd)
+            try:
+                return self.recv(ip_addr, timeout)
+            except socket.timeout:
+                if i == retries:
+                    raise
+
+    # return the next HK packet from the given quabo, or None if none
+    # arrives within timeout secs
+    #
+    def read_hk_packet(self, ip_addr, timeout=10):
+        with self.lock:
+            if self.hk_sock is None:
+                self.hk_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.hk_sock.settimeout(0.5)
+                self.hk_sock.bind(("", UDP_HK_PORT))
+                self.start_receiver(self.hk_sock, self.hk_packets)
+        self.flush(ip_addr, self.hk_packets)
+        try:
+            return self.get_queue(self.hk_packets, ip_addr).get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def quabo(self, ip_addr, config_file_path='quabo_config.txt'):
+        return QUABO(ip_addr, config_file_path, mux=self)
+
+    # call fn(quabo) for each of the given quabos, concurrently.
+    # Returns a dict of IP addr: result,
+    # or the exception raised by fn for that quabo
+    #
+    def for_each(self, ip_addrs, fn):
+        futures = {
+            ip_addr: self.executor.submit(fn, self.quabo(ip_addr)) for ip_addr in ip_addrs
+        }
+        results = {}
+        for ip_addr, f in futures.items():
+            try:
+                results[ip_addr] = f.result()
+            except Exception as e:
+                results[ip_addr] = e
+        return results
+
+    def close(self):
+        self.closed = True
+        self.executor.shutdown()
+        self.sock.close()
+        if self.hk_sock:
+            self.hk_sock.close()
+
+# call fn(quabo) for each of the given quabo IP addrs, concurrently,
+# using a temporary CMD_MUX.
+# If fn fails for any quabo, raise an exception listing them;
+# otherwise return a dict of IP addr: result
+#
+def for_each_quabo(ip_addrs, fn, max_workers=32):
+    mux = CMD_MUX(max_workers=max(1, min(max_workers, len(ip_addrs))))
+    try:
+        results = mux.for_each(ip_addrs, fn)
+    finally:
+        mux.close()
+    errors = ['%s: %s'%(ip_addr, r) for ip_addr, r in results.items() if isinstance(r, Exception)]
+    if errors:
+        raise Exception('failed on %d quabos: %s'%(len(errors), '; '.join(errors)))
+    return results
+
+# socket-like view of a CMD_MUX, for one quabo
+#
+class MUX_CHANNEL:
+    def __init__(self, mux, ip_addr):
+        self.mux = mux
+        self.ip_addr = ip_addr
+        self.timeout = mux.timeout
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def sendto(self, data, addr):
+        self.mux.sock.sendto(data, addr)
+
+    def recvfrom(self, bufsize):
+        data = self.mux.recv(self.ip_addr, self.timeout)
+        return data[:bufsize], (self.ip_addr, UDP_CMD_PORT)
+
+    def close(self):
+        pass
+
+# By default each QUABO object has its own command socket,
 # which means you can only have one at a time.
-# will probably need to change this at some point
+# To talk to several quabos at once, create them with CMD_MUX.quabo().
+# To only send commands that don't read replies, pass sock=send_socket();
+# it's not closed by close().
 
 class QUABO:
-    def __init__(self, ip_addr, config_file_path='quabo_config.txt'):
+    def __init__(self, ip_addr, config_file_path='quabo_config.txt', mux=None, sock=None):
         self.ip_addr = ip_addr
         self.config_file_path = config_file_path
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.settimeout(0.5)
-        self.sock.bind(("", UDP_CMD_PORT))
+        self.mux = mux
+        self.own_sock = sock is None
+        if mux is not None:
+            self.sock = MUX_CHANNEL(mux, ip_addr)
+        elif sock is not None:
+            self.sock = sock
+        else:
+            self.sock = cmd_socket()
         self.have_hk_sock = False
 
         self.shutter_open = 0
@@ -75,7 +261,8 @@ class QUABO:
             self.MAROC_regs.append([0 for x in range(104)])
 
     def close(self):
-        self.sock.close()
+        if self.own_sock:
+            self.sock.close()
 
     def send_daq_params(self, params):
         cmd = self.make_cmd(0x03)
@@ -122,11 +309,14 @@ class QUABO:
     #
     def calibrate_ph_baseline(self):
         cmd = self.make_cmd(0x07)
-        self.flush_rx_buf()
-        self.send(cmd)
-        time.sleep(2)
-        reply = self.sock.recvfrom(1024)
-        bytesback = reply[0]
+        if self.mux:
+            bytesback = self.mux.request(self.ip_addr, cmd, timeout=2.5)
+        else:
+            self.flush_rx_buf()
+            self.send(cmd)
+            time.sleep(2)
+            reply = self.sock.recvfrom(1024)
+            bytesback = reply[0]
         x = []
         for n in range(256):
             val = bytesback[2*n+4] + 256*bytesback[2*n+5]
@@ -313,6 +503,8 @@ class QUABO:
     # returns the HK packet, or None
     #
     def read_hk_packet(self):
+        if self.mux:
+            return self.mux.read_hk_packet(self.ip_addr)
         x = None
         end_time = time.time() + 10
         if not self.have_hk_sock:
@@ -337,7 +529,8 @@ class QUABO:
                 self.have_hk_sock = False
                 return None
 
-    # set destination IP addr for both PH and image packets
+    # set destination IP addr for both PH and image packets.
+    # Returns True if the quabo replied with its MAC addrs
     #
     def data_packet_destination(self, ip_addr_str):
         # get the IP address from hostname
@@ -347,16 +540,20 @@ class QUABO:
         for i in range(4):
             cmd[i+1] = ip_addr_bytes[i]
             cmd[i+5] = ip_addr_bytes[i]
-        self.flush_rx_buf()
-        self.send(cmd)
-        reply = self.sock.recvfrom(12)
-        bytes = reply[0]
+        if self.mux:
+            bytes = self.mux.request(self.ip_addr, cmd)[:12]
+        else:
+            self.flush_rx_buf()
+            self.send(cmd)
+            reply = self.sock.recvfrom(12)
+            bytes = reply[0]
         count = len(bytes)
         #print('got %d bytes in reply'%count)
         if count != 12:
-            return
+            return False
         #print('Mac addr for PH packets: %s'%(util.mac_addr_str(bytes[0:6])))
         #print('Mac addr for image packets: %s'%(util.mac_addr_str(bytes[6:12])))
+        return True
 
     def hk_packet_destination(self, ip_addr_str):
         # get the IP address from hostname
@@ -381,6 +578,9 @@ class QUABO:
         return x
 
     def flush_rx_buf(self):
+        if self.mux:
+            self.mux.flush(self.ip_addr)
+            return
         count = 0
         nbytes = 0
         while (count<32):
@@ -5,6 +5,11 @@
 import re
 import redis
 
+# Redis stream to which store_in_redis() appends the name of each updated key.
+# Consumers block on it with wait_for_updated_redis_keys() instead of polling.
+UPDATES_STREAM = 'METADATA_UPDATES'
+UPDATES_STREAM_MAXLEN = 10000
+
 
 def redis_init():
     return redis.Redis(host='localhost', port=6379, db=0)
@@ -13,13 +18,49 @@ def redis_init():
 def store_in_redis(r: redis.Redis, rkey: [bytes, str], rkey_fields: dict):
     """
     Writes every field from rkey_fields into the hashset stored at rkey
-    in the Redis database represented by the object r.
+    in the Redis database represented by the object r, with a single HSET.
+    r may be a pipeline, in which case the write is sent when it's executed.
+    """
+    r.hset(rkey, mapping=rkey_fields)
+    notify_update(r, rkey)
+
+
+def notify_update(r: redis.Redis, rkey: [bytes, str]):
+    """Appends rkey to the updates stream, waking up any consumers."""
+    r.xadd(UPDATES_STREAM, {'key': rkey}, maxlen=UPDATES_STREAM_MAXLEN, approximate=True)
+
+
+def get_updates_stream_id(r: redis.Redis):
+    """
+    Returns the ID of the newest entry in the updates stream. Passing it to
+    wait_for_updated_redis_keys() returns only the updates made after this call.
+    """
+    entries = r.xrevrange(UPDATES_STREAM, count=1)
+    return entries[0][0] if entries else '0-0'
+
+
+def wait_for_updated_redis_keys(r: redis.Redis, last_id, timeout=None):
     """
-    for field, value in rkey_fields.items():
-        r.hset(rkey, field, value)
+    Blocks until keys are updated after the updates stream entry last_id,
+    or until timeout seconds have passed (if timeout is not None).
+    Returns the list of updated keys, without duplicates, and the ID of
+    the last stream entry read, to be passed to the next call.
+    """
+    block = 0 if timeout is None else int(timeout * 1000)
+    updated_keys = dict()
+    for stream, entries in r.xread({UPDATES_STREAM: last_id}, block=block):
+        for entry_id, fields in entries:
+            updated_keys[fields[b'key'].decode('utf-8')] = None
+            last_id = entry_id
+    return list(updated_keys), last_id
 
 
 def get_updated_redis_keys(r:redis.Redis, key_timestamps:dict):
+    """
+    Returns the keys whose Computer_UTC field differs from key_timestamps.
+    This scans every key in the database, so it should only be used to get
+    a snapshot at start-up; use wait_for_updated_redis_keys() after that.
+    """
     avaliable_keys = [key.decode("utf-8") for key in r.keys('*')]
     list_of_updates = []
     for key in avaliable_keys:
@@ -35,12 +76,66 @@ def get_updated_redis_keys(r:redis.Redis, key_timestamps:dict):
     return list_of_updates
 
 
-def get_casted_redis_value(r:redis.Redis, rkey: [bytes, str], field: [bytes, str]):
-    """Returns val = r.hget(rkey, field) casted to int, float, or string
-     as follows:
+# Pattern for values of the form (-)X.Y, with X and Y numeric.
+FLOAT_PATTERN = re.compile("^-*([0-9]+)\\.([0-9]+?)(?:[eE]-?\\+?([0-9]+))?$")
+
+# Per-key schema cache: {redis key: {field: type}}, where type is int or float,
+# recorded by cast_redis_value() the first time a numeric value is seen.
+redis_value_types = dict()
+
+
+def is_int_value(val: str):
+    """Returns True if val has the form (-)X, with X numeric."""
+    return val.isnumeric() or (len(val) > 0 and val[0] == '-' and val[1:].isnumeric())
+
+
+def get_redis_value_type(val: str):
+    """Returns the type val should be casted to:
         1. int, if val has the form X where X.isnumeric(),
         2. float, if val has the form (-)X.Y where X.isnumeric() and Y.isnumeric(),
-        3. string otherwise.
+        3. str otherwise.
+    """
+    # Checks if val has the form X, with X numeric.
+    if is_int_value(val):
+        return int
+    # Checks if val has the form (-)X.Y, with X and Y numeric.
+    match = FLOAT_PATTERN.match(val)
+    if match and match.group(1).isnumeric() and match.group(2).isnumeric() \
+            and (match.group(3) is None or match.group(3).isnumeric()):
+        return float
+    return str
+
+
+def cast_redis_value(rkey: [bytes, str], field: [bytes, str], val: bytes):
+    """Returns val, a value read from field of the hashset rkey, casted to
+    int, float, or string as in get_redis_value_type().
+    Numeric fields are casted directly with the type recorded in redis_value_types;
+    type detection is only done for new fields, string fields, and fields
+    whose value can no longer be casted to the recorded type.
+    A float field whose value has the form of an int stays a float.
+    """
+    val = val.decode('utf-8')
+    key_types = redis_value_types.setdefault(rkey, dict())
+    val_type = key_types.get(field)
+    # int() and float() also accept e.g. " 1", "1_000", "nan" and "inf",
+    # which get_redis_value_type() treats as strings, so check the form first.
+    if val_type is int:
+        if is_int_value(val):
+            return int(val)
+    elif val_type is float:
+        if FLOAT_PATTERN.match(val) or is_int_value(val):
+            return float(val)
+    val_type = get_redis_value_type(val)
+    if val_type is str:
+        key_types.pop(field, None)
+    else:
+        key_types[field] = val_type
+    return val_type(val)
+
+
+def get_casted_redis_value(r:redis.Redis, rkey: [bytes, str], field: [bytes, str]):
+    """Returns val = r.hget(rkey, field) casted to int, float, or string
+     as in get_redis_value_type().
     """
     val = None
     # Checks if val exists in the provided Redis database.
@@ -52,13 +147,4 @@ def get_casted_redis_value(r:redis.Redis, rkey: [bytes, str], field: [bytes, str
         pass
     if val is not None:
         val = val.decode('utf-8')
-        # Checks if val has the form X, with X numeric.
-        if val.isnumeric() or (len(val) > 0 and val[0] == '-' and val[1:].isnumeric()):
-            return int(val)
-        # Checks if val has the form (-)X.Y, with X and Y numeric.
-        pattern = re.compile("^-*([0-9]+)\.([0-9]+?)(?:[eE]-?\+?([0-9]+))?$")
-        match = pattern.match(val)
-        if match and match.group(1).isnumeric() and match.group(2).isnumeric() \
-                and (match.group(3) is None or match.group(3).isnumeric()):
-            return float(val)
-        return val
+        return get_redis_value_type(val)(val)
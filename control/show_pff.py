@@ -1,9 +1,10 @@
 #! /usr/bin/env python3
 
-# show_pff.py [--quantile x] filename
+# show_pff.py [--quantile x] [--play] filename
 # show a PFF file (image or pulse height) as text
 # --quantile: find the x and 1-x quantiles, and use those as limits
 #   default: 0.1
+# --play: show the frames in a figure, as a movie
 # if no filename specified, use 'img'
 
 import os, sys, random, json
@@ -27,6 +28,102 @@ def image_as_figure(figure, im, img):
     figure.canvas.draw()
     figure.canvas.flush_events()
 
+# display limits from the x and 1-x quantiles of recent frames.
+# Frames are buffered, and the limits are recomputed every
+# update_interval frames (and smoothed) rather than for each frame
+#
+class RunningQuantiles:
+    def __init__(self, x, update_interval=20, smoothing=0.5):
+        self.x = x
+        self.update_interval = update_interval
+        self.smoothing = smoothing
+        self.frames = []
+        self.limits = None
+
+    def add(self, img):
+        self.frames.append(img)
+        if self.limits is None or len(self.frames) >= self.update_interval:
+            lo, hi = np.quantile(np.stack(self.frames), [self.x, 1-self.x])
+            if self.limits is None:
+                self.limits = [lo, hi]
+            else:
+                a = self.smoothing
+                self.limits = [
+                    a*self.limits[0] + (1-a)*lo, a*self.limits[1] + (1-a)*hi
+                ]
+            self.frames = []
+        return self.limits
+
+# a figure showing live images from one or more modules,
+# tiled into one canvas.
+# The figure and image are created once; updates change only
+# the image data, and are drawn by blitting it onto the saved background.
+# Each tile is scaled by the running quantiles of its module.
+#
+class LiveDisplay:
+    def __init__(self, module_ids, image_size, quantile=0.1, ncols=None, update_interval=20):
+        self.image_size = image_size
+        n = len(module_ids)
+        if not ncols:
+            ncols = int(np.ceil(np.sqrt(n)))
+        nrows = int(np.ceil(n/ncols))
+        tile = image_size + 1
+            # 1-pixel gap between tiles
+        self.origins = {}
+        self.quantiles = {}
+        for i, module_id in enumerate(module_ids):
+            self.origins[module_id] = ((i//ncols)*tile, (i%ncols)*tile)
+            self.quantiles[module_id] = RunningQuantiles(quantile, update_interval)
+        self.canvas_data = np.full((nrows*tile-1, ncols*tile-1), np.nan)
+
+        plt.ion()
+        self.figure, self.ax = plt.subplots()
+        self.ax.set_axis_off()
+        self.im = self.ax.imshow(
+            self.canvas_data, cmap='plasma', vmin=0, vmax=1, animated=True
+        )
+        self.labels = [
+            self.ax.text(
+                col, row, str(module_id), color='white', va='top', fontsize=8,
+                animated=True
+            )
+            for module_id, (row, col) in self.origins.items()
+        ]
+        self.figure.canvas.mpl_connect('draw_event', self.on_draw)
+        plt.show(block=False)
+        self.figure.canvas.draw()
+        self.figure.canvas.flush_events()
+
+    # save the background (everything but the image) after a full draw,
+    # e.g. when the window is resized
+    #
+    def on_draw(self, event):
+        self.background = self.figure.canvas.copy_from_bbox(self.figure.bbox)
+        self.draw_artists()
+
+    def draw_artists(self):
+        self.ax.draw_artist(self.im)
+        for label in self.labels:
+            self.ax.draw_artist(label)
+
+    # set the image of a module; img is a 1D array of pixels.
+    # Not shown until draw()
+    #
+    def set_image(self, module_id, img):
+        img = img.reshape(self.image_size, self.image_size)
+        lo, hi = self.quantiles[module_id].add(img)
+        row, col = self.origins[module_id]
+        self.canvas_data[row:row+self.image_size, col:col+self.image_size] = \
+            np.clip((img - lo)/(hi - lo), 0, 1) if hi > lo else 0
+
+    def draw(self):
+        canvas = self.figure.canvas
+        self.im.set_data(self.canvas_data)
+        canvas.restore_region(self.background)
+        self.draw_artists()
+        canvas.blit(self.figure.bbox)
+        canvas.flush_events()
+
 def image_as_text(img, img_size, bytes_per_pixel, min, max):
     scale = ' .,-+=#@'
         # 8 chars w/ increasing density
@@ -99,16 +196,28 @@ def show_file(fname, img_size, bytes_per_pixel, min, max, is_ph, verbose):
             if x == 'q':
                 break
 
+def play_file(fname, img_size, bytes_per_pixel, quantile):
+    display = LiveDisplay([0], img_size, quantile)
+    with open(fname, 'rb') as f:
+        while True:
+            j = pff.read_json(f)
+            if not j:
+                break
+            img = pff.read_image(f, img_size, bytes_per_pixel)
+            display.set_image(0, np.array(img))
+            display.draw()
+
 if __name__ == "__main__":
 
     def usage():
-        print("usage: show_pff.py [--quantile x] [--verbose] file")
+        print("usage: show_pff.py [--quantile x] [--verbose] [--play] file")
 
     def main():
         i = 1
         fname = None
         quantile = .1
         verbose = False
+        play = False
 
         argv = sys.argv
         while i<len(argv):
@@ -117,6 +226,8 @@ if __name__ == "__main__":
                 quantile = float(argv[i])  
             elif argv[i] == '--verbose':
                 verbose = True
+            elif argv[i] == '--play':
+                play = True
             else:
                 fname = argv[i]
             i += 1
@@ -148,6 +259,10 @@ if __name__ == "__main__":
         else:
             raise Exception("bad data product %s"%dp)
 
+        if play:
+            play_file(fname, image_size, bytes_per_pixel, quantile)
+            return
+
         [min, max] = image_quantiles.get_quantiles(
             fname, image_size, bytes_per_pixel, quantile
         )
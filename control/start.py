@@ -11,6 +11,7 @@
 # - start the HK recorder
 # - start the HV updater
 # - start the temperature monitor
+# - start the trickle collector (copies closed data files during the run)
 # - start the flow of data: set DAQ mode and dest IP addr of quabos
 # - send commands to DAQ nodes to start hashpipe program
 #
@@ -105,14 +106,33 @@ def get_daq_params(data_config):
         daq_params.set_stim_params(sp['rate'], sp['level'])
     return daq_params
 
+# tell a quabo where to send HK and data packets.
+# Raise an exception if it doesn't acknowledge the data packet dest
+#
+def set_packet_destinations(quabo, head_node_ip_addr, daq_node_ip_addr):
+    if verbose:
+        print('setting HK packet dest to %s on quabo %s'%(
+            head_node_ip_addr, quabo.ip_addr
+        ))
+    quabo.hk_packet_destination(head_node_ip_addr)
+    if verbose:
+        print('setting data packet dest to %s on quabo %s'%(
+            daq_node_ip_addr, quabo.ip_addr
+        ))
+    if not quabo.data_packet_destination(daq_node_ip_addr):
+        raise Exception('bad reply to data packet dest command')
+
 # Start data flow from the quabos.
-# For each quabo:
-# - tell it where to send HK packets
-# - tell it where to send data packets
-# - set its DAQ mode
+# - tell all quabos (concurrently) where to send HK packets
+#   and where to send data packets
+# - if they all acknowledged, set the DAQ mode of all quabos
+#   in a single burst, so that they start at nearly the same time
 #
 def start_data_flow(quabo_uids, data_config, daq_config):
     daq_params = get_daq_params(data_config)        
+    head_node_ip_addr = daq_config['head_node_ip_addr']
+    daq_node_ip_addrs = {}
+        # quabo IP addr -> DAQ node IP addr
     for dome in quabo_uids['domes']:
         for module in dome['modules']:
             if 'daq_node' not in module:
@@ -120,28 +140,54 @@ def start_data_flow(quabo_uids, data_config, daq_config):
             base_ip_addr = module['ip_addr']
             module_id = config_file.ip_addr_to_module_id(base_ip_addr)
             daq_node = config_file.module_id_to_daq_node(daq_config, module_id)
-            daq_node_ip_addr = daq_node['ip_addr']
-            head_node_ip_addr = daq_config['head_node_ip_addr']
             for i in range(4):
                 quabo = module['quabos'][i]
                 if quabo['uid'] == '':
                     continue
                 ip_addr = config_file.quabo_ip_addr(base_ip_addr, i)
-                quabo = quabo_driver.QUABO(ip_addr)
-                if verbose:
-                    print('setting HK packet dest to %s on quabo %s'%(
-                        head_node_ip_addr, ip_addr
-                    ))
-                quabo.hk_packet_destination(head_node_ip_addr)
-                if verbose:
-                    print('setting data packet dest to %s on quabo %s'%(
-                        daq_node_ip_addr, ip_addr
-                    ))
-                quabo.data_packet_destination(daq_node_ip_addr)
-                if verbose:
-                    print('setting DAQ mode on quabo %s'%ip_addr)
-                quabo.send_daq_params(daq_params)
-                quabo.close()
+                daq_node_ip_addrs[ip_addr] = daq_node['ip_addr']
+    if not daq_node_ip_addrs:
+        return
+
+    mux = quabo_driver.CMD_MUX(max_workers=len(daq_node_ip_addrs))
+    try:
+        results = mux.for_each(
+            daq_node_ip_addrs.keys(),
+            lambda quabo: set_packet_destinations(
+                quabo, head_node_ip_addr, daq_node_ip_addrs[quabo.ip_addr]
+            )
+        )
+        errors = ['%s: %s'%(ip_addr, r) for ip_addr, r in results.items() if isinstance(r, Exception)]
+        if errors:
+            raise Exception(
+                'failed to set packet destinations on %d quabos: %s'%(len(errors), '; '.join(errors))
+            )
+        quabos = [mux.quabo(ip_addr) for ip_addr in daq_node_ip_addrs]
+        t = time.time()
+        for quabo in quabos:
+            quabo.send_daq_params(daq_params)
+        if verbose:
+            print('set DAQ mode on %d quabos in %.2f msec'%(
+                len(quabos), (time.time() - t)*1000
+            ))
+    finally:
+        mux.close()
+
+# make module and run directories on a DAQ node other than this one,
+# take a process snapshot, and unpack the config files archive
+# into the run dir; all with one ssh command
+#
+def setup_daq_node(node, run_name, archive):
+    data_dir = node['data_dir']
+    rcmds = ['mkdir -p %s/%s'%(data_dir, run_name)]
+    for module in node['modules']:
+        rcmds.append('mkdir -p %s/module_%d/%s'%(
+            data_dir, module['id'], run_name
+        ))
+    # create process snapshot
+    rcmds.append('cd %s/%s && ps -ux > pss_%s.log'%(data_dir, run_name, node['ip_addr']))
+    rcmds.append(file_xfer.unpack_config_files_cmd(node, run_name))
+    util.run_on_node(node, ' && '.join(rcmds), archive, verbose)
 
 # make run directories; copy config files to them
 # on each DAQ node:
@@ -150,6 +196,8 @@ def start_data_flow(quabo_uids, data_config, daq_config):
 #     module_n
 #         run/     .pff files go here
 #
+# DAQ nodes are set up concurrently
+#
 def make_run_dirs(run_name, daq_config):
     my_ip = util.local_ip()
     run_dir = '%s/%s'%(daq_config['head_node_data_dir'], run_name)
@@ -162,14 +210,13 @@ def make_run_dirs(run_name, daq_config):
         for file in files:
             shutil.copyfile(file, '%s/%s'%(run_dir, file))
     
-     
     # make module and run directories on DAQ nodes
     #
+    remote_nodes = []
     for node in daq_config['daq_nodes']:
         if not node['modules']:
             continue
-        ip_addr = node['ip_addr']
-        if ip_addr == my_ip:
+        if node['ip_addr'] == my_ip:
             for module in node['modules']:
                 cmd = 'mkdir -p %s/module_%d/%s'%(
                     daq_config['head_node_data_dir'],
@@ -180,30 +227,32 @@ def make_run_dirs(run_name, daq_config):
                 ret = os.system(cmd)
                 if ret: raise Exception('%s returned %d'%(cmd, ret))
         else:
-            username = node['username']
-            data_dir = node['data_dir']
-            rcmds = ['mkdir %s/%s'%(data_dir, run_name)]
-            for module in node['modules']:
-                rcmds.append('mkdir -p %s/module_%d/%s'%(
-                    data_dir, module['id'], run_name
-                ))
-            # create process snapshot
-            rcmds.append('cd %s/%s; ps -ux > pss_%s.log'%(data_dir,run_name, ip_addr))
-            rcmd = ';'.join(rcmds)
-            cmd = 'ssh %s@%s "%s"'%(username, ip_addr, rcmd)
-            if verbose:
-                print(cmd)
-            ret = os.system(cmd)
-            if ret: raise Exception('%s returned %d'%(cmd, ret))
-
-    # copy config files to DAQ nodes
-    file_xfer.copy_config_files(daq_config, run_name, verbose)
+            remote_nodes.append(node)
+
+    # ... and copy config files to them
+    archive = file_xfer.config_files_archive()
+    util.for_each_node(
+        remote_nodes, lambda node: setup_daq_node(node, run_name, archive)
+    )
+
+# start hashpipe on a DAQ node
+#
+def start_daq_node(node, run_name, max_file_size_mb, daq_params):
+    remote_cmd = './start_daq.py --daq_ip_addr %s --run_dir %s --max_file_size_mb %d --group_ph_frames %d'%(
+        node['ip_addr'], run_name, max_file_size_mb, daq_params.do_group_ph_frames
+    )
+    if 'bindhost' in node.keys():
+        remote_cmd += ' --bindhost %s'%node['bindhost']
+    for m in node['modules']:
+        module_id = config_file.ip_addr_to_module_id(m['ip_addr'])
+        remote_cmd += ' --module_id %d'%module_id
+    util.run_on_node(node, 'cd %s; %s'%(node['data_dir'], remote_cmd), verbose=verbose)
 
 # start recording data
-#   for each DAQ node that is getting data
-#       create run directory
-#       copy config files to run directory
-#       start hashpipe program
+#   start HK recorder, HV updater and temperature monitor
+#   start hashpipe program on each DAQ node that is getting data
+#   (concurrently)
+#   start trickle collector
 #
 def start_recording(data_config, daq_config, run_name, no_hv):
     my_ip = util.local_ip()
@@ -225,26 +274,14 @@ def start_recording(data_config, daq_config, run_name, no_hv):
     else:
         max_file_size_mb = util.default_max_file_size_mb
     daq_params = get_daq_params(data_config)
-    for node in daq_config['daq_nodes']:
-        if not node['modules']:
-            continue
-        username = node['username']
-        data_dir = node['data_dir']
-        remote_cmd = './start_daq.py --daq_ip_addr %s --run_dir %s --max_file_size_mb %d --group_ph_frames %d'%(
-            node['ip_addr'], run_name, max_file_size_mb, daq_params.do_group_ph_frames
-        )
-        if 'bindhost' in node.keys():
-            remote_cmd += ' --bindhost %s'%node['bindhost']
-        for m in node['modules']:
-            module_id = config_file.ip_addr_to_module_id(m['ip_addr'])
-            remote_cmd += ' --module_id %d'%module_id
-        cmd = 'ssh %s@%s "cd %s; %s"'%(
-            username, node['ip_addr'], data_dir, remote_cmd
-        )
-        if verbose:
-            print(cmd)
-        ret = os.system(cmd)
-        if ret: raise Exception('%s returned %d'%(cmd, ret))
+    util.for_each_node(
+        [node for node in daq_config['daq_nodes'] if node['modules']],
+        lambda node: start_daq_node(node, run_name, max_file_size_mb, daq_params)
+    )
+
+    # start copying closed files from DAQ nodes
+    if max_file_size_mb:
+        util.start_trickle_collector(run_name)
 
 def start_run(
     obs_config, daq_config, quabo_uids, data_config, no_hv, no_redis, no_data
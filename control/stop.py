@@ -5,6 +5,7 @@
 #
 # - tell DAQs to stop recording
 # - stop HK recorder process
+# - stop trickle collector
 # - tell quabos to stop sending data
 # - if a run is in progress, copy data files to head and delete from DAQs
 #
@@ -146,6 +147,9 @@ def stop_run(
     print("stopping data generation")
     stop_data_flow(quabo_uids)
 
+    print("stopping trickle collector")
+    kill_trickle_collector()
+
     if run_dir:
         if not complete_file_exists(run_dir, recording_ended_filename):
             write_complete_file(run_dir, recording_ended_filename)
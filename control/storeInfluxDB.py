@@ -1,21 +1,25 @@
 #! /usr/bin/env python3
 ##############################################################
 # Populates new data from redis into the influxDB database.
-# Script stores all sets which contains the key for the 
+# The script waits on the redis updates stream (see redis_utils)
+# for the sets written by the capture scripts, and stores all
+# sets which contains the key for the 
 # computer timestamp 'Computer_UTC'. All sets where this value 
 # is absent is ignored. The set is stored as a new entry in the
 # database 'metadata' in the measurement associated with each 
-# redis set.
+# redis set. The sets updated in each polling cycle are sent to
+# influxDB in one batched write by an InfluxWriter, which buffers
+# them on disk while influxDB is unavailable.
 ##############################################################
 import sys
 from os import write
 from influxdb import InfluxDBClient
 import redis
-import time
 from datetime import datetime
 import re
 import util
 from redis_utils import *
+from influx_writer import InfluxWriter
 sys.path.insert(0, '../util')
 import config_file
 
@@ -34,8 +38,9 @@ def influx_init():
     r = redis_init()
     client = InfluxDBClient('localhost', 8086, 'root', 'root', 'metadata')
     client.create_database('metadata')
+    writer = InfluxWriter(client)
 
-    return r, client
+    return r, writer
 
 
 def get_datatype(redis_key):
@@ -45,47 +50,56 @@ def get_datatype(redis_key):
     return "None"
 
 
-# Create the json body and write the data to influxDB
-def write_influx(client:InfluxDBClient, key:str, data_fields:dict, datatype:str):
+# Create the json body of an influxDB point
+def make_influx_point(key:str, data_fields:dict, datatype:str):
     utc_timestamp = data_fields['Computer_UTC']
     utc_time_obj = datetime.utcfromtimestamp(utc_timestamp)
     t = utc_time_obj.isoformat()
-    json_body = [
-        {
-            "measurement": key,
-            "tags": {
-                "observatory": OBSERVATORY,
-                "datatype": datatype
-            },
-            "fields": data_fields,
-            "time": t
-        }
-    ]
-    client.write_points(json_body)
+    return {
+        "measurement": key,
+        "tags": {
+            "observatory": OBSERVATORY,
+            "datatype": datatype
+        },
+        "fields": data_fields,
+        "time": t
+    }
 
 
-def write_redis_to_influx(client:InfluxDBClient, r:redis.Redis, redis_keys:list, key_timestamps:dict):
+def write_redis_to_influx(writer:InfluxWriter, r:redis.Redis, redis_keys:list, key_timestamps:dict):
+    points = []
+    # Read all the updated sets in one round trip.
+    pipe = r.pipeline(transaction=False)
     for rkey in redis_keys:
+        pipe.hgetall(rkey)
+    for rkey, redis_value in zip(redis_keys, pipe.execute()):
+        if b'Computer_UTC' not in redis_value:
+            continue
         data_fields = dict()
-        for key in r.hkeys(rkey):
-            val = get_casted_redis_value(r, rkey, key)
-            if (val is not None) and (val != ""):
-                data_fields[key.decode('utf-8')] = val
+        for key, val in redis_value.items():
+            key = key.decode('utf-8')
+            val = cast_redis_value(rkey, key, val)
+            if val != "":
+                data_fields[key] = val
             else:
-                msg = f"storeInfluxDB.py: No data in ({rkey}, {key.decode('utf-8')}): {repr(val)}!"
+                msg = f"storeInfluxDB.py: No data in ({rkey}, {key}): {repr(val)}!"
                 msg += "\n Aborting influx write..."
                 util.write_log(msg)
                 continue
-        write_influx(client, rkey, data_fields, get_datatype(rkey))
+        points.append(make_influx_point(rkey, data_fields, get_datatype(rkey)))
         key_timestamps[rkey] = data_fields['Computer_UTC']
+    writer.write(points)
 
 
 def main():
-    r, client = influx_init()
+    r, writer = influx_init()
     key_timestamps = {}
+    # Snapshot the current sets once, then handle updates as they happen.
+    last_id = get_updates_stream_id(r)
+    write_redis_to_influx(writer, r, get_updated_redis_keys(r, key_timestamps), key_timestamps)
     while True:
-        write_redis_to_influx(client, r, get_updated_redis_keys(r, key_timestamps), key_timestamps)
-        time.sleep(1)
+        updated_keys, last_id = wait_for_updated_redis_keys(r, last_id)
+        write_redis_to_influx(writer, r, updated_keys, key_timestamps)
 
 
 if __name__ == "__main__":
@@ -6,13 +6,13 @@
 # computer timestamp 'Computer_UTC'. All sets where this value 
 # is absent is ignored. The set is then stored in to a json 
 # format separated by the characters '\n\n'.
+# Updated sets are read from the redis updates stream (see redis_utils).
 # As pertained in the panoseti metdata json format specifications.
 ##############################################################
 from io import FileIO
 import redis
 import json
 import sys
-import time
 from redis_utils import *
 
 file_ptr = None
@@ -36,6 +36,9 @@ if __name__ == "__main__":
         print("Too many command line arguments")
         exit(0)
     file_ptr = open(sys.argv[1], "w+")
+    # Snapshot the current sets once, then record updates as they happen.
+    last_id = get_updates_stream_id(r)
+    write_redis_keys(file_ptr, get_updated_redis_keys(r, key_timestamps), key_timestamps)
     while True:
-        write_redis_keys(file_ptr, get_updated_redis_keys(r, key_timestamps), key_timestamps)
-        time.sleep(1)
+        updated_keys, last_id = wait_for_updated_redis_keys(r, last_id)
+        write_redis_keys(file_ptr, updated_keys, key_timestamps)
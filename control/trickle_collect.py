@@ -0,0 +1,144 @@
+#! /usr/bin/env python3
+
+# trickle_collect.py [--run run_name] [--interval secs] [--bwlimit KBps] [--verbose]
+#
+# copy data files from remote DAQ nodes to the head node
+# while a run is in progress.
+# hashpipe starts a new file (with a higher seqno) when a file
+# reaches max_file_size_mb; files that have been superseded in this way
+# are closed, and are copied (with limited bandwidth, so as not to
+# disturb recording), verified, and recorded in the run's collect manifest.
+# At the end of the run collect.py then only has to copy the open files.
+#
+# Started by start.py; killed by stop.py before it collects the run.
+# Exits when the run is no longer current.
+#
+# --run         the run (default: the current run)
+# --interval    seconds between checks for closed files (default 60)
+# --bwlimit     max transfer rate per DAQ node, KB/sec (default 20000; 0=no limit)
+
+import sys, os, time
+import util, file_xfer, collect
+sys.path.insert(0, '../util')
+import config_file, pff
+
+DEFAULT_INTERVAL = 60
+DEFAULT_BWLIMIT = 20000
+RUN_NAME_TIMEOUT = 120
+    # start.py starts us before it writes the run name;
+    # give up if it hasn't appeared after this many seconds
+
+# return the paths of closed .pff files, i.e. those for which
+# a file for the same module and data product with a higher seqno exists
+#
+def closed_files(paths):
+    latest = {}
+    seqnos = {}
+    for path in paths:
+        name = os.path.basename(path)
+        if not pff.is_pff_file(name):
+            continue
+        n = pff.parse_name(name)
+        if not n or 'seqno' not in n:
+            continue
+        key = (os.path.dirname(path), n.get('module'), n.get('dp'))
+        seqno = int(n['seqno'])
+        seqnos[path] = (key, seqno)
+        latest[key] = max(latest.get(key, -1), seqno)
+    return [path for path, (key, seqno) in seqnos.items() if seqno < latest[key]]
+
+# copy and verify the closed files on a node not already trickled.
+# Add them to trickled if successful.
+# return error message, or ''
+#
+def trickle_node(run_name, daq_config, node, trickled, bwlimit, verbose):
+    sizes = file_xfer.list_node_run_files(run_name, node, verbose)
+    paths = [p for p in closed_files(sizes.keys()) if p not in trickled]
+    if not paths:
+        return ''
+    hashes = file_xfer.hash_node_files(node, paths, verbose)
+    manifest = {
+        p: {'size': sizes[p], 'sha256': hashes[p]} for p in paths if p in hashes
+    }
+    error_msg = file_xfer.copy_run_from_node(
+        run_name, daq_config, node, manifest, verbose, bwlimit
+    )
+    if error_msg:
+        return error_msg
+    for path, f in manifest.items():
+        msg = file_xfer.verify_file_from_node(run_name, daq_config, node, path, f)
+        if msg:
+            error_msg += msg
+        else:
+            trickled[path] = f
+    if verbose:
+        print('trickled %d files from %s'%(len(manifest), collect.node_key(node)))
+    return error_msg
+
+def trickle_run(run_name, daq_config, interval, bwlimit, verbose):
+    my_ip = util.local_ip()
+    nodes = [
+        node for node in daq_config['daq_nodes']
+        if node['modules'] and node['ip_addr'] != my_ip
+    ]
+    if not nodes:
+        return
+    t = time.time()
+    while util.read_run_name() != run_name:
+        if time.time() - t > RUN_NAME_TIMEOUT:
+            util.write_log('trickle_collect.py: run %s never started'%run_name)
+            return
+        time.sleep(1)
+    while util.read_run_name() == run_name:
+        time.sleep(interval)
+        manifest = collect.read_manifest(daq_config, run_name)
+
+        def trickle(node):
+            entry = manifest.setdefault(collect.node_key(node), {
+                'files': {}, 'verified': False
+            })
+            trickled = entry.setdefault('trickled', {})
+            try:
+                return trickle_node(run_name, daq_config, node, trickled, bwlimit, verbose)
+            except Exception as e:
+                return 'trickle_node(): %s '%e
+
+        error_msg = ''.join(
+            util.for_each_node(nodes, trickle)
+        )
+        collect.write_manifest(daq_config, run_name, manifest)
+        if error_msg:
+            # files that failed are tried again next time
+            util.write_log('trickle_collect.py: %s'%error_msg)
+
+if __name__ == "__main__":
+    run_name = None
+    interval = DEFAULT_INTERVAL
+    bwlimit = DEFAULT_BWLIMIT
+    verbose = False
+    argv = sys.argv
+    i = 1
+    while i < len(argv):
+        if argv[i] == '--run':
+            i += 1
+            run_name = argv[i]
+        elif argv[i] == '--interval':
+            i += 1
+            interval = float(argv[i])
+        elif argv[i] == '--bwlimit':
+            i += 1
+            bwlimit = int(argv[i])
+        elif argv[i] == '--verbose':
+            verbose = True
+        else:
+            print('bad arg: %s'%argv[i])
+            sys.exit()
+        i += 1
+    if not run_name:
+        run_name = util.read_run_name()
+        if not run_name:
+            raise Exception("No run found")
+    daq_config = config_file.get_daq_config()
+    quabo_uids = config_file.get_quabo_uids()
+    config_file.associate(daq_config, quabo_uids)
+    trickle_run(run_name, daq_config, interval, bwlimit, verbose)
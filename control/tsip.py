@@ -0,0 +1,145 @@
+##############################################################
+# Buffered parser for the Trimble Standard Interface Protocol
+# (TSIP) used by the GPS receiver. Packets are framed as
+#   DLE <id> <data> DLE ETX
+# with each DLE in <data> sent twice. Bytes are fed to the parser
+# in arbitrary chunks and complete, unstuffed packets come out.
+# The 0x8F-AB and 0x8F-AC timing packets are decoded with
+# precompiled struct layouts. Running this script runs the
+# unit tests for the parser.
+##############################################################
+import struct
+import unittest
+
+DLE = 0x10
+ETX = 0x03
+DLE_ETX = b'\x10\x03'
+DLE_DLE = b'\x10\x10'
+
+PRIMARY_TIMING_ID = b'\x8f\xab'
+SUPPLEMENTARY_TIMING_ID = b'\x8f\xac'
+
+# Layouts of the packet data following the 0x8F byte (starting with the subcode byte).
+# OutputID 0x8F-AB
+PRIMARY_TIMING_STRUCT = struct.Struct('>xIHhBBBBBBH')
+PRIMARY_TIMING_FIELDS = [
+    'timeofWeek', 'weekNumber', 'UTCOffset', 'timingFlag',
+    'seconds', 'minutes', 'hours', 'dayofMonth', 'month', 'year'
+]
+# OutputID 0x8F-AC
+SUPPLEMENTARY_TIMING_STRUCT = struct.Struct('>xBBBIHHBBBBffIffdddf4x')
+SUPPLEMENTARY_TIMING_FIELDS = [
+    'receiverMode', 'discipliningMode', 'selfSurveyProgress', 'holdOverDuration',
+    'criticalAlarms', 'minorAlarms', 'GPSDecodingStatus', 'discipliningActivity',
+    'spareStatus1', 'spareStatus2', 'PPSOffset', 'clockOffset', 'DACValue',
+    'DACVoltage', 'temp', 'latitude', 'longitude', 'altitude', 'PPSQuantizationError'
+]
+
+
+class TSIPParser():
+    def __init__(self):
+        self.buf = bytearray()
+
+    # Add a chunk of bytes from the receiver.
+    # Returns the list of packets completed by it; each packet is the
+    # unstuffed bytes between the leading DLE and the trailing DLE ETX,
+    # starting with the packet ID.
+    #
+    def feed(self, chunk):
+        self.buf += chunk
+        packets = []
+        start = 0
+        while True:
+            # resync: a packet starts with DLE followed by an ID byte
+            start = self.buf.find(DLE, start)
+            if start < 0:
+                del self.buf[:]
+                break
+            if start + 1 < len(self.buf) and self.buf[start+1] in (DLE, ETX):
+                # stuffed DLE or end of a packet we didn't see the start of
+                start += 2
+                continue
+            end = self.findEnd(start + 1)
+            if end < 0:
+                del self.buf[:start]
+                break
+            packet = bytes(self.buf[start+1:end]).replace(DLE_DLE, b'\x10')
+            if len(packet) > 0:
+                packets.append(packet)
+            start = end + 2
+        return packets
+
+    # Return the offset of the DLE ETX ending the packet that
+    # starts before pos, or -1 if it's not in the buffer yet.
+    # A DLE ETX ends a packet only if it's preceded by an even
+    # number of DLEs (i.e. the DLE isn't the second of a stuffed pair).
+    #
+    def findEnd(self, pos):
+        while True:
+            end = self.buf.find(DLE_ETX, pos)
+            if end < 0:
+                return -1
+            ndle = 0
+            while end - ndle - 1 >= pos and self.buf[end - ndle - 1] == DLE:
+                ndle += 1
+            if ndle % 2 == 0:
+                return end
+            pos = end + 2
+
+
+# Decode the data of a timing packet (starting with the subcode byte).
+# Returns a dict of raw field values, or None if the packet is malformed.
+#
+def decodePrimaryTimingPacket(data):
+    if len(data) != PRIMARY_TIMING_STRUCT.size:
+        return None
+    return dict(zip(PRIMARY_TIMING_FIELDS, PRIMARY_TIMING_STRUCT.unpack(data)))
+
+def decodeSupplementaryTimingPacket(data):
+    if len(data) != SUPPLEMENTARY_TIMING_STRUCT.size:
+        return None
+    return dict(zip(SUPPLEMENTARY_TIMING_FIELDS, SUPPLEMENTARY_TIMING_STRUCT.unpack(data)))
+
+
+# Frame a packet as sent by the receiver.
+#
+def framePacket(packet):
+    return b'\x10' + packet.replace(b'\x10', DLE_DLE) + DLE_ETX
+
+
+class TestTSIPParser(unittest.TestCase):
+    primary = PRIMARY_TIMING_ID + PRIMARY_TIMING_STRUCT.pack(
+        345600, 2250, 18, 0x03, 10, 16, 3, 19, 10, 2026
+    )[1:]
+
+    def test_sizes(self):
+        self.assertEqual(17, PRIMARY_TIMING_STRUCT.size)
+        self.assertEqual(68, SUPPLEMENTARY_TIMING_STRUCT.size)
+
+    def test_chunked_input(self):
+        stream = framePacket(self.primary) * 3
+        for chunk_size in [1, 2, 5, len(stream)]:
+            parser = TSIPParser()
+            packets = []
+            for i in range(0, len(stream), chunk_size):
+                packets += parser.feed(stream[i:i+chunk_size])
+            self.assertEqual([self.primary] * 3, packets)
+
+    def test_stuffed_dle(self):
+        packet = b'\x8f\x10\x03\x10\x10\x10'
+        self.assertEqual([packet], TSIPParser().feed(framePacket(packet)))
+
+    def test_resync(self):
+        stream = b'\x01\x02' + framePacket(self.primary)[3:] + framePacket(self.primary)
+        self.assertEqual(self.primary, TSIPParser().feed(stream)[-1])
+
+    def test_decode_primary(self):
+        fields = decodePrimaryTimingPacket(self.primary[1:])
+        self.assertEqual(345600, fields['timeofWeek'])
+        self.assertEqual(18, fields['UTCOffset'])
+        self.assertEqual(2026, fields['year'])
+        self.assertIsNone(decodePrimaryTimingPacket(self.primary))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
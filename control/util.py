@@ -2,6 +2,7 @@
 
 import os, sys, subprocess, signal, socket, datetime, time, psutil, shutil
 import __main__
+from concurrent.futures import ThreadPoolExecutor
 import netifaces, json
 
 #-------------- DEFAULTS ---------------
@@ -33,6 +34,8 @@ hv_updater_name = './hv_updater.py'
 
 module_temp_monitor_name = './module_temp_monitor.py'
 
+trickle_collector_name = './trickle_collect.py'
+
 hashpipe_name = 'hashpipe'
 
 daq_hashpipe_pid_filename = 'daq_hashpipe_pid'
@@ -91,12 +94,98 @@ def ip_addr_str_to_bytes(ip_addr_str):
 def ping(ip_addr):
     return not os.system('ping -c 1 -w 1 -q %s > /dev/null 2>&1'%ip_addr)
 
+# ping a list of IP addrs at once; return the set of those that answered
+#
+def ping_all(ip_addrs):
+    procs = [
+        (ip_addr, subprocess.Popen(
+            ['ping', '-c', '1', '-w', '1', '-q', ip_addr],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        ))
+        for ip_addr in ip_addrs
+    ]
+    return set(ip_addr for ip_addr, p in procs if p.wait() == 0)
+
+# ping a list of IP addrs once a second until each one answers,
+# or until timeout secs have passed.
+# Return a dict of IP addr: time when it first answered, or None
+#
+def wait_for_pings(ip_addrs, timeout):
+    ready = dict.fromkeys(ip_addrs)
+    end_time = time.time() + timeout
+    pending = list(ip_addrs)
+    while pending and time.time() < end_time:
+        t = time.time()
+        for ip_addr in ping_all(pending):
+            ready[ip_addr] = time.time()
+        pending = [ip_addr for ip_addr in pending if ready[ip_addr] is None]
+        if pending:
+            time.sleep(max(0, 1 - (time.time() - t)))
+    return ready
+
 def mac_addr_str(bytes):
     s = ['']*6
     for i in range(6):
         s[i] = hex(bytes[i])[2:]
     return ':'.join(s)
 
+#-------------- DAQ NODES ---------------
+
+# ssh options for connection multiplexing: the first ssh to a node
+# opens a master connection, which later ssh, scp and rsync commands
+# to that node reuse (and which stays open for ControlPersist secs)
+#
+ssh_control_dir = os.path.expanduser('~/.ssh/panoseti')
+ssh_opts = [
+    '-o', 'ControlMaster=auto',
+    '-o', 'ControlPath=%s/%%C'%ssh_control_dir,
+    '-o', 'ControlPersist=600'
+]
+
+# the ssh command line (as a string) for use in rsync -e or os.system()
+#
+def ssh_cmd_str():
+    os.makedirs(ssh_control_dir, exist_ok=True)
+    return ' '.join(['ssh'] + ssh_opts)
+
+# run a shell command on a DAQ node, passing it input (bytes) on stdin.
+# Raise an exception if it fails.
+# If capture, return its output (bytes)
+#
+def run_on_node(node, rcmd, input=None, verbose=False, capture=False):
+    os.makedirs(ssh_control_dir, exist_ok=True)
+    cmd = ['ssh'] + ssh_opts + ['%s@%s'%(node['username'], node['ip_addr']), rcmd]
+    if verbose:
+        print('ssh %s@%s "%s"'%(node['username'], node['ip_addr'], rcmd))
+    p = subprocess.run(
+        cmd, input=input, stdout=subprocess.PIPE if capture else None
+    )
+    if p.returncode:
+        raise Exception('ssh %s@%s "%s" returned %d'%(
+            node['username'], node['ip_addr'], rcmd, p.returncode
+        ))
+    return p.stdout
+
+# call fn(node) for each of the given DAQ nodes, concurrently.
+# If it fails for any node, raise an exception listing them;
+# otherwise return the list of results
+#
+def for_each_node(nodes, fn):
+    if not nodes:
+        return []
+    with ThreadPoolExecutor(max_workers=len(nodes)) as executor:
+        futures = [executor.submit(fn, node) for node in nodes]
+    results = []
+    errors = []
+    for node, f in zip(nodes, futures):
+        try:
+            results.append(f.result())
+        except Exception as e:
+            errors.append('%s:%s: %s'%(node['ip_addr'], node['data_dir'], e))
+    if errors:
+        raise Exception('failed on %d DAQ nodes: %s'%(len(errors), '; '.join(errors)))
+    return results
+
 #-------------- BINARY DATA ---------------
 
 def print_binary(data):
@@ -223,6 +312,15 @@ def start_module_temp_monitor():
         raise
 
 
+# Start daemon that copies closed data files from DAQ nodes during the run
+def start_trickle_collector(run_name):
+    try:
+        subprocess.Popen([trickle_collector_name, '--run', run_name])
+    except:
+        print("can't launch trickle collector")
+        raise
+
+
 # write run name to a file, and symlink 'run' to the run dir
 def write_run_name(daq_config, run_name):
     with open(run_name_file, 'w') as f:
@@ -293,10 +391,17 @@ def kill_hk_recorder():
         if hk_recorder_name in p.cmdline():
             os.kill(p.pid, signal.SIGKILL)
 
-def kill_hv_updater():
+# wait until it has exited, so that it doesn't send HV commands
+# after the quabos are stopped
+#
+def kill_hv_updater(timeout=5):
     for p in psutil.process_iter():
         if hv_updater_name in p.cmdline():
             os.kill(p.pid, signal.SIGKILL)
+            try:
+                p.wait(timeout)
+            except psutil.TimeoutExpired:
+                write_log('hv_updater.py (pid %d) did not exit'%p.pid)
 
 
 def kill_module_temp_monitor():
@@ -304,6 +409,19 @@ def kill_module_temp_monitor():
         if module_temp_monitor_name in p.cmdline():
             os.kill(p.pid, signal.SIGKILL)
 
+def is_trickle_collector_running():
+    return is_script_running(trickle_collector_name[2:])
+
+# also kill its rsync and ssh processes,
+# so they don't copy files at the same time as collect.py
+#
+def kill_trickle_collector():
+    for p in psutil.process_iter():
+        if trickle_collector_name in p.cmdline():
+            for c in p.children(recursive=True):
+                c.kill()
+            os.kill(p.pid, signal.SIGKILL)
+
 # write a message to per-run log file, and to stdout
 #
 def write_log(msg):
@@ -1,94 +1,117 @@
 #! /usr/bin/env python3
 
-# video.py [--module N] [--ph]
+# video.py [--module N ...] [--ph N] [--decimate N]
 # run (only) while a recording is in progress.
 # Shows recent frames from it.
-#   --module N      show frames from module N (default: first one)
-#   --ph            show pulse height images (default: image mode)
+#   --module N      show frames from module N (default: first one);
+#                   can be given more than once
+#   --ph N          show pulse height images (ph256 or ph1024)
+#                   (default: image mode)
+#   --decimate N    show only every Nth frame
 #
-# It does this by creating a process on the DAQ node that
-# monitors the relevant PFF file and returns frames from the end
+# It does this by running live_daq.py on the DAQ nodes,
+# which streams frames as they're written.
+# Modules on the same DAQ node share one connection.
+# Modules are shown as tiles in one figure.
 
-import sys, subprocess, pty
+import sys, threading, queue
 import numpy as np
 
-import show_pff, util
+import show_pff, live_daq
 
 sys.path.insert(0, '../util')
 
-import config_file, pff
+import config_file
 
-def main(quabo_uids, module_id, dp):
-    if module_id < 0:
-        dome = quabo_uids['domes'][0]
-        module = dome['modules'][0]
-        module_id = module['id']
-        node = daq_config['daq_nodes'][0]
-    else:
-        found = False
-        for dome in quabo_uids['domes']:
-            for module in dome['modules']:
-                if module['id'] == module_id:
-                    found = True
-                    break
-            if found: break
-        if not found:
+DP_IMAGE_PARAMS = {
+    # image size, bytes/pixel
+    'img8': (32, 1),
+    'img16': (32, 2),
+    'ph256': (16, 2),
+    'ph1024': (32, 2),
+}
+
+# return the module with the given ID (first one if -1), or None
+#
+def find_module(quabo_uids, module_id):
+    for dome in quabo_uids['domes']:
+        for module in dome['modules']:
+            if module_id < 0 or module['id'] == module_id:
+                return module
+    return None
+
+# read frames from a DAQ node's stream and put them in a queue;
+# put None when the stream ends
+#
+def read_frames(process, frames):
+    while True:
+        frame = live_daq.read_frame(process.stdout)
+        frames.put(frame)
+        if frame is None:
+            break
+
+def main(quabo_uids, module_ids, dp, decimate):
+    modules = []
+    for module_id in module_ids:
+        module = find_module(quabo_uids, module_id)
+        if not module:
             print('no such module %d'%module_id)
             return
-    daq_node = module['daq_node']
-        
-    cmd = 'cd %s; ./video_daq.py --module %d --dp %s'%(
-            daq_node['data_dir'], module_id, dp
-    )
-    print(cmd)
-    process = subprocess.Popen(['ssh',
-        '%s@%s'%(daq_node['username'], daq_node['ip_addr']),
-        cmd,
-        ],
-        shell=False, stdout = subprocess.PIPE
-    )
-    ph = False
-    if dp == 'img16' or dp == 'ph1024':
-        image_size = 32
-        bpp = 2
-    elif dp == 'img8':
-        image_size = 32
-        bpp = 1
-    elif dp == 'ph256':
-        image_size = 16
-        bpp = 2
-        ph = True
-    figure, im = show_pff.create_figure(image_size)
-    while True:
-        j = ''
-        while True:
-            line = process.stdout.readline()
-            line = line.decode()
-            if line == '\n':
+        modules.append(module)
+
+    # one stream per DAQ node
+    nodes = {}
+    for module in modules:
+        daq_node = module['daq_node']
+        key = (daq_node['ip_addr'], daq_node['data_dir'])
+        if key not in nodes:
+            nodes[key] = (daq_node, [])
+        nodes[key][1].append(module['id'])
+    frames = queue.Queue()
+    for daq_node, ids in nodes.values():
+        process = live_daq.subscribe(daq_node, ids, dp, decimate)
+        threading.Thread(
+            target=read_frames, args=(process, frames), daemon=True
+        ).start()
+
+    image_size, bpp = DP_IMAGE_PARAMS[dp]
+    dtype = np.uint8 if bpp == 1 else np.uint16
+    display = show_pff.LiveDisplay([module['id'] for module in modules], image_size)
+    nstreams = len(nodes)
+    while nstreams:
+        frame = frames.get()
+        if frame is None:
+            nstreams -= 1
+            continue
+        # show only the newest frame of each module
+        latest = {}
+        while frame is not None:
+            latest[frame[0]] = frame
+            try:
+                frame = frames.get_nowait()
+            except queue.Empty:
                 break
-            j += line
-        show_pff.print_json(j, ph, False)
-        #print('got header')
-        img = pff.read_image(process.stdout, image_size, bpp)
-        img = np.array(img)
-        if dp == 'ph256' or dp == 'ph1024':
-            img = img.astype(np.int16)
-        print('max: %d, min: %d'%(max(img), min(img)))
-        #show_pff.image_as_text(img, image_size, bpp, 0, 256)
-        img = img - img.min()
-        img = img/img.max()
-        show_pff.image_as_figure(figure, im, img.reshape(image_size,image_size))
-        if process.poll() is not None:
-            break
+        if frame is None:
+            nstreams -= 1
+        for module_id, dp, j, image in latest.values():
+            img = np.frombuffer(image, dtype=dtype)
+            if dp == 'ph256' or dp == 'ph1024':
+                img = img.astype(np.int16)
+            display.set_image(module_id, img)
+        display.draw()
 
 i = 1
-module_id = -1
+module_ids = []
+decimate = 1
 argv = sys.argv
 ph = False
 while i<len(argv):
     if argv[i] == '--module':
         i += 1
-        module_id = int(argv[i])
+        module_ids.append(int(argv[i]))
+    elif argv[i] == '--decimate':
+        i += 1
+        decimate = int(argv[i])
     elif argv[i] == '--ph':
         i += 1
         ph = int(argv[i])
@@ -117,4 +140,4 @@ else:
     else:
         dp = 'img8'
 
-main(quabo_uids, module_id, dp)
+main(quabo_uids, module_ids if module_ids else [-1], dp, decimate)
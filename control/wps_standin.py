@@ -0,0 +1,85 @@
+#! /usr/bin/env python3
+
+##############################################################
+# Stand-in for a Digital Loggers web power switch (WPS), for
+# testing power.py and capture_power.py without hardware.
+# It serves /status (a page with the outlet state bitmask)
+# and /outlet?N=ON|OFF, like the real switch.
+#
+# usage: wps_standin.py [--port N] [--delay secs]
+#   --port: TCP port to listen on (default 8081)
+#   --delay: time to wait before each reply, to simulate a slow switch
+#
+# then e.g.: capture_power.py --wps wps_test http://localhost:8081 1
+##############################################################
+import sys, time, threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qsl
+
+DEFAULT_PORT = 8081
+
+class WPSStandin:
+    def __init__(self, port=DEFAULT_PORT, delay=0):
+        self.state = 0xff
+            # bitmask of outlets that are on
+        self.delay = delay
+        self.nrequests = 0
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+                # keep-alive, so clients can reuse connections
+
+            def do_GET(self):
+                standin.nrequests += 1
+                time.sleep(standin.delay)
+                url = urlparse(self.path)
+                if url.path == '/status':
+                    body = '<tr><td>Outlet state</td><td class="state">%02x</td></tr>'%standin.state
+                elif url.path == '/outlet':
+                    for outlet, value in parse_qsl(url.query):
+                        bit = 1 << (int(outlet) - 1)
+                        if value == 'ON':
+                            standin.state |= bit
+                        else:
+                            standin.state &= ~bit
+                    body = 'ok'
+                else:
+                    self.send_error(404)
+                    return
+                body = body.encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+
+    def start(self):
+        t = threading.Thread(target=self.server.serve_forever, daemon=True)
+        t.start()
+        return t
+
+
+if __name__ == "__main__":
+    port = DEFAULT_PORT
+    delay = 0
+    argv = sys.argv
+    i = 1
+    while i < len(argv):
+        if argv[i] == '--port':
+            i += 1
+            port = int(argv[i])
+        elif argv[i] == '--delay':
+            i += 1
+            delay = float(argv[i])
+        else:
+            print('bad arg: %s'%argv[i])
+            sys.exit()
+        i += 1
+    print('WPS stand-in listening on TCP port %d'%port)
+    WPSStandin(port, delay).server.serve_forever()
@@ -0,0 +1,214 @@
+#! /usr/bin/env python3
+
+##############################################################
+# Stand-in for the SNMP agent of a White Rabbit switch, for
+# testing capture_wr.py and panoseti_snmp.py without hardware.
+# It answers SNMPv2c GET, GETNEXT and GETBULK requests on UDP
+# for the WR-SWITCH-MIB objects we poll, with values that can
+# be changed while it runs.
+#
+# usage: wrs_snmp_standin.py [--port N] [--nports N] [--flap secs]
+#   --port: UDP port to listen on (default 1161)
+#   --nports: number of switch ports (default 18)
+#   --flap: toggle the link status of port 1 every secs seconds
+#
+# then e.g.: capture_wr.py --switch localhost:1161
+##############################################################
+import sys, socket, threading, time
+
+from panoseti_snmp import WRS_SOFTPLL_STATUS_OID, WRS_PORT_STATUS_LINK_OID, \
+    WRS_PORT_STATUS_SFPPN_OID, WRS_NPORTS
+
+DEFAULT_PORT = 1161
+
+# BER tags
+INTEGER = 0x02
+OCTET_STRING = 0x04
+NULL = 0x05
+OID = 0x06
+SEQUENCE = 0x30
+GET_REQUEST = 0xa0
+GETNEXT_REQUEST = 0xa1
+GET_RESPONSE = 0xa2
+GETBULK_REQUEST = 0xa5
+NO_SUCH_OBJECT = 0x80
+END_OF_MIB_VIEW = 0x82
+
+#-------------- BER ENCODING ---------------
+
+def encode_length(n):
+    if n < 0x80:
+        return bytes([n])
+    b = n.to_bytes((n.bit_length() + 7)//8, 'big')
+    return bytes([0x80 | len(b)]) + b
+
+def encode_tlv(tag, value):
+    return bytes([tag]) + encode_length(len(value)) + value
+
+def encode_int(n):
+    nbytes = max(1, (n + (n < 0)).bit_length()//8 + 1)
+    return encode_tlv(INTEGER, n.to_bytes(nbytes, 'big', signed=True))
+
+def encode_oid(oid):
+    out = bytearray([40*oid[0] + oid[1]])
+    for arc in oid[2:]:
+        b = [arc & 0x7f]
+        arc >>= 7
+        while arc:
+            b.append(0x80 | (arc & 0x7f))
+            arc >>= 7
+        out += bytes(reversed(b))
+    return encode_tlv(OID, bytes(out))
+
+def encode_value(v):
+    if isinstance(v, int):
+        return encode_int(v)
+    if isinstance(v, str):
+        return encode_tlv(OCTET_STRING, v.encode())
+    # exception tags: noSuchObject, endOfMibView
+    return encode_tlv(v, b'')
+
+#-------------- BER DECODING ---------------
+
+# return (tag, value, offset of next TLV)
+#
+def decode_tlv(data, i):
+    tag = data[i]
+    n = data[i+1]
+    i += 2
+    if n & 0x80:
+        nbytes = n & 0x7f
+        n = int.from_bytes(data[i:i+nbytes], 'big')
+        i += nbytes
+    return tag, data[i:i+n], i+n
+
+def decode_seq(data):
+    items = []
+    i = 0
+    while i < len(data):
+        tag, value, i = decode_tlv(data, i)
+        items.append((tag, value))
+    return items
+
+def decode_oid(value):
+    oid = [value[0]//40, value[0]%40]
+    arc = 0
+    for b in value[1:]:
+        arc = (arc << 7) | (b & 0x7f)
+        if not b & 0x80:
+            oid.append(arc)
+            arc = 0
+    return tuple(oid)
+
+def parse_oid(s):
+    return tuple(int(x) for x in s.strip('.').split('.'))
+
+#-------------- AGENT ---------------
+
+class WRSStandin:
+    def __init__(self, nports=WRS_NPORTS, port=DEFAULT_PORT):
+        self.lock = threading.Lock()
+        self.mib = {}
+        self.set_softpll(1)
+        for i in range(nports):
+            self.set_link(i+1, 2)
+            self.mib[parse_oid(WRS_PORT_STATUS_SFPPN_OID) + (i+1,)] = 'PS-FB-RX1310'
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', port))
+        self.nrequests = 0
+
+    # port is 1-based; status is 1 (down) or 2 (up)
+    #
+    def set_link(self, port, status):
+        with self.lock:
+            self.mib[parse_oid(WRS_PORT_STATUS_LINK_OID) + (port,)] = status
+
+    def set_softpll(self, status):
+        with self.lock:
+            self.mib[parse_oid(WRS_SOFTPLL_STATUS_OID) + (0,)] = status
+
+    def get(self, oid):
+        return oid, self.mib.get(oid, NO_SUCH_OBJECT)
+
+    def get_next(self, oid):
+        later = [o for o in self.mib if o > oid]
+        if not later:
+            return oid, END_OF_MIB_VIEW
+        o = min(later)
+        return o, self.mib[o]
+
+    def respond(self, request):
+        (_, msg), = decode_seq(request)
+        (_, version), (_, community), (pdu_type, pdu) = decode_seq(msg)
+        (_, request_id), (_, x), (_, y), (_, varbinds) = decode_seq(pdu)
+        oids = [decode_oid(decode_seq(vb)[0][1]) for _, vb in decode_seq(varbinds)]
+        with self.lock:
+            if pdu_type == GET_REQUEST:
+                results = [self.get(oid) for oid in oids]
+            elif pdu_type == GETNEXT_REQUEST:
+                results = [self.get_next(oid) for oid in oids]
+            elif pdu_type == GETBULK_REQUEST:
+                nonrepeaters = int.from_bytes(x, 'big')
+                maxrepetitions = int.from_bytes(y, 'big')
+                results = [self.get_next(oid) for oid in oids[:nonrepeaters]]
+                last = oids[nonrepeaters:]
+                for i in range(maxrepetitions):
+                    row = [self.get_next(oid) for oid in last]
+                    results += row
+                    last = [oid for oid, v in row]
+            else:
+                return None
+        vbs = b''.join(
+            encode_tlv(SEQUENCE, encode_oid(oid) + encode_value(v)) for oid, v in results
+        )
+        pdu = encode_tlv(INTEGER, request_id) + encode_int(0) + encode_int(0) + encode_tlv(SEQUENCE, vbs)
+        msg = encode_tlv(INTEGER, version) + encode_tlv(OCTET_STRING, community) + encode_tlv(GET_RESPONSE, pdu)
+        return encode_tlv(SEQUENCE, msg)
+
+    def serve_forever(self):
+        while True:
+            request, addr = self.sock.recvfrom(65536)
+            try:
+                reply = self.respond(request)
+            except Exception as e:
+                print('bad request from %s: %s'%(str(addr), e))
+                continue
+            self.nrequests += 1
+            if reply:
+                self.sock.sendto(reply, addr)
+
+    def start(self):
+        t = threading.Thread(target=self.serve_forever, daemon=True)
+        t.start()
+        return t
+
+
+if __name__ == "__main__":
+    port = DEFAULT_PORT
+    nports = WRS_NPORTS
+    flap = 0
+    argv = sys.argv
+    i = 1
+    while i < len(argv):
+        if argv[i] == '--port':
+            i += 1
+            port = int(argv[i])
+        elif argv[i] == '--nports':
+            i += 1
+            nports = int(argv[i])
+        elif argv[i] == '--flap':
+            i += 1
+            flap = float(argv[i])
+        else:
+            print('bad arg: %s'%argv[i])
+            sys.exit()
+        i += 1
+    wrs = WRSStandin(nports, port)
+    wrs.start()
+    print('WR switch stand-in listening on UDP port %d'%port)
+    link = 2
+    while True:
+        time.sleep(flap if flap else 1)
+        if flap:
+            link = 3 - link
+            wrs.set_link(1, link)
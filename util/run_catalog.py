@@ -0,0 +1,201 @@
+#! /usr/bin/env python3
+
+# run_catalog.py --data_dir X [--print]
+#
+# maintain a catalog of the runs in a data dir, so that web pages
+# can list runs and their files without scanning the data dir.
+#
+# The catalog (.run_catalog/catalog.json in the data dir) has, for each run,
+# its parsed name, the contents of its recording_ended,
+# collect_complete and run_complete files,
+# and for each PFF file its size, parsed name, number of frames,
+# and the times of the first and last frames.
+#
+# It's updated incrementally: a run is rescanned only if its
+# dir mtime has changed or it's not complete,
+# and a file's frame info is recomputed only if its size or mtime changed.
+#
+# --print     write the catalog (JSON) to stdout
+# --runs      write the runs (JSON, name -> entry), without their file lists
+# --run NAME  write the entry of run NAME (JSON; null if there's no such run)
+#
+# The web pages (web/panoseti.inc) run this in the web dir;
+# to install, link it there, along with pff.py:
+#   cd web; ln -s ../util/run_catalog.py ../util/pff.py .
+# Without it, the pages scan the data dir instead.
+
+import os, sys, json
+import pff
+
+CATALOG_DIR = '.run_catalog'
+    # in the data dir.  The catalog is in a subdir so that
+    # writing it doesn't change the data dir's mtime
+CATALOG_FILENAME = 'catalog.json'
+CATALOG_VERSION = 1
+    # rebuild the catalog if its version is different
+
+RUN_STATUS_FILES = ['recording_ended', 'collect_complete', 'run_complete']
+    # written by stop.py
+
+DP_BYTES_PER_IMAGE = {'img8': 1024, 'img16': 2048, 'ph256': 512, 'ph1024': 2048}
+
+# return info about a PFF file: parsed name, frame count and time span
+#
+def file_info(path, name, st):
+    f = {'size': st.st_size, 'mtime': st.st_mtime, 'attrs': pff.parse_name(name)}
+    dp = f['attrs'].get('dp') if f['attrs'] else None
+    f['nframes'] = 0
+    f['first_t'] = f['last_t'] = None
+    if dp in DP_BYTES_PER_IMAGE and st.st_size:
+        try:
+            with open(path, 'rb') as fin:
+                [frame_size, nframes, first_t, last_t] = pff.img_info(
+                    fin, DP_BYTES_PER_IMAGE[dp]
+                )
+            f['nframes'] = nframes
+            f['first_t'] = first_t
+            f['last_t'] = last_t
+        except Exception:
+            # e.g. all frames have zero times
+            pass
+    return f
+
+# return catalog entry for a run.
+# prev is the run's previous entry (or None); reuse its file info
+# for files whose size and mtime are unchanged
+#
+def scan_run(run_path, run, mtime, prev):
+    prev_files = prev['files'] if prev else {}
+    entry = {
+        'mtime': mtime,
+        'attrs': pff.parse_name(run),
+        'files': {},
+    }
+    for name in RUN_STATUS_FILES:
+        path = '%s/%s'%(run_path, name)
+        if os.path.exists(path):
+            with open(path) as f:
+                entry[name] = f.read().strip()
+    entry['complete'] = 'run_complete' in entry
+    for name in sorted(os.listdir(run_path)):
+        if not pff.is_pff_file(name) or name == 'hk.pff':
+            continue
+        path = '%s/%s'%(run_path, name)
+        st = os.stat(path)
+        f = prev_files.get(name)
+        if not f or f['size'] != st.st_size or f['mtime'] != st.st_mtime:
+            f = file_info(path, name, st)
+        entry['files'][name] = f
+    return entry
+
+def read_catalog(data_dir):
+    path = '%s/%s/%s'%(data_dir, CATALOG_DIR, CATALOG_FILENAME)
+    try:
+        with open(path) as f:
+            catalog = json.load(f)
+        if catalog['version'] == CATALOG_VERSION:
+            return catalog
+    except Exception:
+        pass
+    return {'version': CATALOG_VERSION, 'mtime': None, 'runs': {}}
+
+# write the catalog atomically; it's OK if we can't
+# (e.g. no write access to the data dir)
+#
+def write_catalog(data_dir, catalog):
+    path = '%s/%s/%s'%(data_dir, CATALOG_DIR, CATALOG_FILENAME)
+    tmp = '%s.%d'%(path, os.getpid())
+    try:
+        os.makedirs('%s/%s'%(data_dir, CATALOG_DIR), exist_ok=True)
+        with open(tmp, 'w') as f:
+            json.dump(catalog, f)
+        os.rename(tmp, path)
+    except OSError:
+        pass
+
+# bring the catalog of a data dir up to date, and return it
+#
+def update_catalog(data_dir):
+    catalog = read_catalog(data_dir)
+    runs = catalog['runs']
+    changed = False
+
+    # the list of runs changes only if the data dir's mtime does
+    mtime = os.stat(data_dir).st_mtime
+    if mtime != catalog['mtime']:
+        names = set(r for r in os.listdir(data_dir) if pff.is_pff_dir(r))
+        for run in list(runs.keys()):
+            if run not in names:
+                del runs[run]
+        for run in names:
+            if run not in runs:
+                runs[run] = None
+        catalog['mtime'] = mtime
+        changed = True
+
+    for run, entry in runs.items():
+        run_path = '%s/%s'%(data_dir, run)
+        try:
+            run_mtime = os.stat(run_path).st_mtime
+        except FileNotFoundError:
+            continue
+        if entry and entry['complete'] and entry['mtime'] == run_mtime:
+            continue
+        new_entry = scan_run(run_path, run, run_mtime, entry)
+        if new_entry != entry:
+            runs[run] = new_entry
+            changed = True
+
+    # runs that disappeared while we were scanning
+    for run in [r for r, e in runs.items() if e is None]:
+        del runs[run]
+    if changed:
+        write_catalog(data_dir, catalog)
+    return catalog
+
+# return list of (run name, entry), newest first
+#
+def sorted_runs(catalog):
+    return sorted(
+        catalog['runs'].items(),
+        key=lambda x: x[1]['attrs'].get('start', ''), reverse=True
+    )
+
+if __name__ == "__main__":
+    data_dir = None
+    do_print = False
+    runs_only = False
+    run = None
+    argv = sys.argv
+    i = 1
+    while i < len(argv):
+        if argv[i] == '--data_dir':
+            i += 1
+            data_dir = argv[i]
+        elif argv[i] == '--print':
+            do_print = True
+        elif argv[i] == '--runs':
+            runs_only = True
+        elif argv[i] == '--run':
+            i += 1
+            run = argv[i]
+        else:
+            print('bad arg: %s'%argv[i])
+            sys.exit()
+        i += 1
+    if not data_dir:
+        print('usage: run_catalog.py --data_dir X [--print | --runs | --run NAME]')
+        sys.exit()
+    catalog = update_catalog(data_dir)
+    if run:
+        json.dump(catalog['runs'].get(run), sys.stdout)
+    elif runs_only:
+        json.dump(
+            {
+                name: {k: v for k, v in entry.items() if k != 'files'}
+                for name, entry in catalog['runs'].items()
+            },
+            sys.stdout
+        )
+    elif do_print:
+        json.dump(catalog, sys.stdout)
@@ -1,6 +1,35 @@
 <?php
 
 require_once("panoseti.inc");
+require_once("analysis.inc");
+
+// show the file's pre-rendered summary (see summarize_files.py)
+//
+function show_summary($vol, $run, $fname) {
+    $s = file_summary($vol, $run, $fname);
+    if (!$s) {
+        row2("Summary", "Not available yet");
+        return;
+    }
+    if (!empty($s->error)) {
+        row2("Summary", "Not available: $s->error");
+        return;
+    }
+    $dir = file_summary_dir($vol, $run, $fname);
+    row2("Frames", $s->nframes);
+    if ($s->first_t) {
+        row2("Duration (sec)", number_format($s->last_t - $s->first_t, 1));
+    }
+    row2("Mean pixel value", number_format($s->mean_pixel, 2));
+    row2("Max pixel value", $s->max_pixel);
+    row2("Mean image", "<img src=$dir/mean.png>");
+    if (file_exists("$dir/rate.png")) {
+        row2("Rate", "<img src=$dir/rate.png><br><a href=$dir/rate.csv>CSV</a>");
+    }
+    if (file_exists("$dir/ph_hist.png")) {
+        row2("Pulse heights", "<img src=$dir/ph_hist.png>");
+    }
+}
 
 function main($vol, $run, $fname) {
     page_head("PFF file $fname");
@@ -14,6 +43,7 @@ function main($vol, $run, $fname) {
     row2("Download",
         "<a href=$vol/data/$run/$fname>PFF</a> &middot; FITS"
     );
+    show_summary($vol, $run, $fname);
     end_table();
     page_tail();
 }
@@ -28,19 +28,21 @@ function tags($vol, $run) {
     return $x;
 }
 
-function get_durations($vol, $run, $start_dt) {
+// $run is the run's catalog entry
+//
+function get_durations($run, $start_dt) {
     $rec_dur = '---';
     $collect_dur = '---';
     $cleanup_dur = '---';
-    $rec_end = @file_get_contents("$vol/data/$run/recording_ended");
+    $rec_end = @$run->recording_ended;
     if ($rec_end) {
         $rec_end_dt = local_to_dt($rec_end);
         $rec_dur = dt_diff_str($start_dt, $rec_end_dt);
-        $collect_end = @file_get_contents("$vol/data/$run/collect_complete");
+        $collect_end = @$run->collect_complete;
         if ($collect_end) {
             $collect_end_dt = local_to_dt($collect_end);
             $collect_dur = dt_diff_str($rec_end_dt, $collect_end_dt);
-            $cleanup_end = @file_get_contents("$vol/data/$run/run_complete");
+            $cleanup_end = @$run->run_complete;
             if ($cleanup_end) {
                 $cleanup_end_dt = local_to_dt($cleanup_end);
                 $cleanup_dur = dt_diff_str($collect_end_dt, $cleanup_end_dt);
@@ -70,14 +72,13 @@ function main() {
     $vols = json_decode(file_get_contents('head_node_volumes.json'));
     $runs = [];
     foreach ($vols as $vol) {
-        foreach (scandir("$vol/data") as $f) {
-            if (!strstr($f, '.pffd')) continue;
-            $n = parse_pff_name($f);
+        foreach (catalog_runs($vol) as $f => $entry) {
+            $n = (array)$entry->attrs;
             $birdie_seq = -1;
             if (array_key_exists('birdie', $n)) {
                 $birdie_seq = $n['birdie'];
             }
-            $runs[] = [$n['start'], $f, $vol, $birdie_seq];
+            $runs[] = [$n['start'], $f, $vol, $birdie_seq, $entry];
         }
     }
     usort($runs, 'compare');
@@ -98,7 +99,7 @@ function main() {
     foreach ($runs as $run) {
         $name = $run[1];
         $vol = $run[2];
-        $n = parse_pff_name($name);
+        $n = (array)$run[4]->attrs;
         $start = $run[0];
         $start_dt = iso_to_dt($start);
         dt_to_local($start_dt);
@@ -108,7 +109,7 @@ function main() {
             row1($day, 99, 'info');
             $prev_day = $day;
         }
-        [$rec_dur, $collect_dur, $cleanup_dur] = get_durations($vol, $name, $start_dt);
+        [$rec_dur, $collect_dur, $cleanup_dur] = get_durations($run[4], $start_dt);
 
         $birdie_seq = $run[3];
         $b = '';
@@ -1,8 +1,8 @@
 import json
-import os, sys
+import sys
 sys.path.insert(1, '/home/panosetigraph/web')
 from web_util import *
-import pff
+import run_catalog
 
 def body():
     x = ''
@@ -17,18 +17,11 @@ def body():
     '''
     x += table_start('table-striped')
     x += table_header(['observatory', 'start', 'run type', 'click to view'])
-    runs = []
-    for run in os.listdir('/home/panosetigraph/web/data'):
-        if not pff.is_pff_dir(run):
-            continue
-        n = pff.parse_name(run)
-        runs.append([n['start'], run])
-    runs = sorted(runs, key=lambda x: x[0], reverse=True)
+    catalog = run_catalog.update_catalog('/home/panosetigraph/web/data')
     prev_day = ''
-    for run in runs:
-        name = run[1]
-        n = pff.parse_name(name)
-        start = run[0]
+    for name, run in run_catalog.sorted_runs(catalog):
+        n = run['attrs']
+        start = n['start']
         s = start.split('T')
         day = s[0]
         time = s[1]
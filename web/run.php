@@ -129,7 +129,10 @@ function show_comments($vol, $run) {
 function main($vol, $run) {
     page_head("Observing run: $vol $run");
 
-    $dir = "$vol/data/$run";
+    $entry = catalog_run($vol, $run);
+    if (!$entry) {
+        error_page("no such run");
+    }
 
     echo "<h2>Data files</h2>";
     start_table('table-striped');
@@ -137,24 +140,35 @@ function main($vol, $run) {
         "Start time<br><small>click for details</small>",
         "Type",
         "Module",
-        "Size (MB)"
+        "Size (MB)",
+        "Frames",
+        "Duration (sec)",
+        "Preview"
     );
-    foreach (scandir($dir) as $f) {
-        if ($f[0] == ".") continue;
-        if (!is_pff($f)) continue;
-        $n = filesize("$vol/data/$run/$f");
-        if (!$n) continue;
-        $n = number_format($n/1e6, 2);
-        $p = parse_pff_name($f);
+    foreach ($entry->files as $f => $info) {
+        if (!$info->size) continue;
+        $n = number_format($info->size/1e6, 2);
+        $p = (array)$info->attrs;
         if (!$p) continue;
         $start = iso_to_dt($p['start']);
         dt_to_local($start);
+        $dur = '---';
+        if ($info->first_t) {
+            $dur = number_format($info->last_t - $info->first_t, 1);
+        }
+        $preview = '---';
+        $s = file_summary($vol, $run, $f);
+        if ($s && empty($s->error)) {
+            $preview = sprintf('<img src=%s/thumbnail.png width=64 height=64>',
+                file_summary_dir($vol, $run, $f)
+            );
+        }
         table_row(
             sprintf(
                 '<a href=file.php?vol=%s&run=%s&fname=%s>%s</a>',
                 $vol, $run, $f, dt_time_str($start)
             ),
-            $p['dp'], $p['module'], $n
+            $p['dp'], $p['module'], $n, $info->nframes, $dur, $preview
         );
     }
     end_table();